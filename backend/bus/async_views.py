@@ -0,0 +1,59 @@
+"""
+Асинхронные версии публичных endpoints автобусов.
+Подключаются только в ASGI (gorod_osh/urls_asgi.py).
+"""
+from asgiref.sync import sync_to_async
+from django.views.decorators.http import require_safe
+
+from busLocation import fastpath
+from gorod_osh.async_responses import cached_json, get_config, query_key
+from shift.models import Shift
+from .models import Bus
+
+
+def active_buses():
+    return Bus.objects.filter(
+        id__in=Shift.objects.filter(status='active').values('bus_id'),
+        is_active=True
+    )
+
+
+@require_safe
+async def on_route(request):
+    """
+    GET /api/buses/on-route/ — то же, что BusViewSet.on_route, и тем же
+    fastpath.buses_on_route.
+    """
+    async def build():
+        buses = active_buses()
+
+        route_id = request.GET.get('route')
+        if route_id:
+            buses = buses.filter(route_id=route_id)
+
+        bus_type = request.GET.get('bus_type')
+        if bus_type:
+            buses = buses.filter(bus_type=bus_type)
+
+        return await sync_to_async(fastpath.buses_on_route)(buses)
+
+    return await cached_json(
+        query_key('async:on_route', request, 'route', 'bus_type'),
+        get_config()['LIVE_TTL'],
+        build
+    )
+
+
+@require_safe
+async def by_route(request, route_id):
+    """
+    GET /api/buses/by-route/{route_id}/ — то же, что BusViewSet.by_route.
+    """
+    async def build():
+        return await sync_to_async(fastpath.buses_on_route)(active_buses().filter(route_id=route_id))
+
+    return await cached_json(
+        f'async:by_route:{route_id}',
+        get_config()['LIVE_TTL'],
+        build
+    )
@@ -129,19 +129,17 @@ class Bus(models.Model):
     def current_location(self):
         """
         Возвращает последнюю координату ТОЛЬКО если есть активная смена.
+        Значение кешируется в объекте и может быть заполнено заранее
+        пакетной загрузкой (BusLocation.objects.attach_to_buses).
         """
-        from shift.models import Shift
+        if hasattr(self, '_cached_current_location'):
+            return self._cached_current_location
+
         from busLocation.models import BusLocation
-    
-        # Проверяем есть ли активная смена
-        active_shift = Shift.objects.filter(
-            bus=self,
-            status='active'
+
+        # Активная смена и её последняя координата - одним запросом
+        self._cached_current_location = BusLocation.objects.latest_for_buses(
+            [self.id]
         ).first()
-    
-        if not active_shift:
-            return None
-    
-        return BusLocation.objects.filter(
-        shift=active_shift
-        ).order_by('-timestamp').first()
\ No newline at end of file
+
+        return self._cached_current_location
\ No newline at end of file
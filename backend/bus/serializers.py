@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from gorod_osh import refcache
 from .models import Bus
 from user.serializers import DriverSerializer
 from route.serializers import RouteListSerializer
@@ -47,7 +48,7 @@ class BusListSerializer(serializers.ModelSerializer):
     Упрощённый сериализатор для списка автобусов.
     """
     bus_type_display = serializers.CharField(source='get_bus_type_display', read_only=True)
-    route_number = serializers.CharField(source='route.number', read_only=True)
+    route_number = refcache.ReferenceField(refcache.route_number, source='route_id')
     driver_name = serializers.SerializerMethodField()
     is_on_route = serializers.BooleanField(read_only=True)
     
@@ -60,6 +61,11 @@ class BusListSerializer(serializers.ModelSerializer):
         ]
     
     def get_driver_name(self, obj):
+        if obj.assigned_driver_id is None:
+            return None
+        name = refcache.driver_name(obj.assigned_driver_id)
+        if name is not None:
+            return name
         if obj.assigned_driver:
             return f"{obj.assigned_driver.first_name} {obj.assigned_driver.last_name}".strip() or obj.assigned_driver.username
         return None
@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from gorod_osh import refcache
+from gorod_osh.async_responses import invalidate
+from .models import Bus
+
+
+@receiver(post_save, sender=Bus)
+@receiver(post_delete, sender=Bus)
+def reset_bus_references(sender, instance, **kwargs):
+    """
+    Гос. номера, типы и маршруты автобусов в справочном кеше
+    перечитываются после коммита.
+    """
+    transaction.on_commit(refcache.buses.invalidate)
+
+
+@receiver(post_save, sender=Bus)
+@receiver(post_delete, sender=Bus)
+def reset_async_route_list(sender, instance, **kwargs):
+    """
+    Смена маршрута автобуса меняет active_buses_count в списке маршрутов:
+    закешированный ответ ASGI удаляется после коммита.
+    """
+    from route.async_views import ROUTES_KEY
+
+    transaction.on_commit(lambda: invalidate(ROUTES_KEY))
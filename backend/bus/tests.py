@@ -1,3 +1,28 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from gorod_osh import refcache
+from .models import Bus
+
+
+class BusReferenceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        refcache.buses.state = None
+
+    def test_new_bus_is_visible_without_delay(self):
+        self.assertIsNone(refcache.bus_number(1_000_000))
+        bus = Bus.objects.create(registration_number='01KG001', bus_type='bus')
+        with self.captureOnCommitCallbacks(execute=True):
+            bus.save()
+        self.assertEqual(refcache.bus_number(bus.id), '01KG001')
+
+    def test_missing_bus_is_looked_up_once_per_version(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(5):
+                self.assertIsNone(refcache.bus_number(1_000_000))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(cache.get(refcache.buses.version_key), 0)
@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.db.models import Q
+from busLocation import fastpath
 from .models import Bus
 from .serializers import (
     BusSerializer, BusListSerializer, BusCreateUpdateSerializer,
@@ -39,6 +40,15 @@ class BusViewSet(viewsets.ModelViewSet):
             return BusLocationInfoSerializer
         return BusSerializer
     
+    def get_queryset(self):
+        """
+        Спискам JOIN с маршрутами и водителями не нужен: номера маршрутов
+        и имена водителей берутся из справочного кеша (gorod_osh/refcache.py).
+        """
+        if self.action in ['list', 'active', 'available']:
+            return Bus.objects.all()
+        return super().get_queryset()
+    
     def get_permissions(self):
         """
         Публичный доступ для GET запросов (пассажиры смотрят автобусы).
@@ -54,7 +64,7 @@ class BusViewSet(viewsets.ModelViewSet):
         Получить список активных автобусов.
         GET /api/buses/active/
         """
-        active_buses = self.queryset.filter(is_active=True)
+        active_buses = self.get_queryset().filter(is_active=True)
         serializer = BusListSerializer(active_buses, many=True)
         return Response(serializer.data)
     
@@ -73,7 +83,7 @@ class BusViewSet(viewsets.ModelViewSet):
         ).values_list('bus_id', flat=True)
         
         # Исключаем занятые автобусы
-        available_buses = self.queryset.filter(
+        available_buses = self.get_queryset().filter(
             is_active=True
         ).exclude(id__in=busy_bus_ids)
         
@@ -113,8 +123,8 @@ class BusViewSet(viewsets.ModelViewSet):
         if bus_type:
             buses = buses.filter(bus_type=bus_type)
         
-        serializer = self.get_serializer(buses, many=True)
-        return Response(serializer.data)
+        # Без сериализатора: два запроса на весь список вместо N+1
+        return Response(fastpath.buses_on_route(buses))
     
     @action(detail=False, methods=['get'], url_path='by-route/(?P<route_id>[^/.]+)')
     def by_route(self, request, route_id=None):
@@ -136,8 +146,7 @@ class BusViewSet(viewsets.ModelViewSet):
             is_active=True
         )
         
-        serializer = self.get_serializer(buses, many=True)
-        return Response(serializer.data)
+        return Response(fastpath.buses_on_route(buses))
     
     def destroy(self, request, *args, **kwargs):
         """
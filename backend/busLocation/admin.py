@@ -1,17 +1,165 @@
+import json
+from urllib.parse import urlsplit
+
 from django.contrib import admin
-from .models import BusLocation
+from django.contrib.admin.options import IS_POPUP_VAR, TO_FIELD_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from gorod_osh import refcache
+from .models import BusLocation, RouteDeviation, StopEvent
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator без COUNT(*) по большой таблице.
+
+    На Postgres число строк берётся из оценки планировщика (EXPLAIN);
+    точный COUNT выполняется, только если оценка меньше EXACT_BELOW,
+    то есть когда он и так дешёвый.
+    """
+    EXACT_BELOW = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate < self.EXACT_BELOW:
+            return super().count
+        return estimate
+
+
+class BusFilter(admin.SimpleListFilter):
+    """
+    Фильтр по автобусу. Список берётся из справочного кеша,
+    а не запросом по всем автобусам на каждую загрузку страницы.
+    """
+    title = 'автобус'
+    parameter_name = 'bus'
+
+    def lookups(self, request, model_admin):
+        buses = refcache.buses.data()
+        return sorted(
+            ((str(bus_id), bus[0]) for bus_id, bus in buses.items()),
+            key=lambda item: item[1]
+        )
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(bus_id=self.value())
+        return queryset
+
+
+class OlderThanFilter(admin.SimpleListFilter):
+    """
+    Keyset-пагинация: ссылка «Следующие записи» продолжает список строго
+    после последней строки текущей страницы по (timestamp, id), без OFFSET.
+    """
+    title = 'листание'
+    parameter_name = 'before'
+
+    def lookups(self, request, model_admin):
+        # Единственный вариант строится по результатам страницы в choices()
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        timestamp, _, location_id = value.rpartition('_')
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None or not location_id.isdigit():
+            return queryset
+        return queryset.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=int(location_id))
+        )
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'С начала',
+        }
+        if changelist.result_list and len(changelist.result_list) >= changelist.list_per_page:
+            last = changelist.result_list[len(changelist.result_list) - 1]
+            yield {
+                'selected': False,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: f'{last.timestamp.isoformat()}_{last.id}'},
+                    remove=['p']
+                ),
+                'display': 'Следующие записи →',
+            }
+
+
+class TodayDateHierarchyMixin:
+    """
+    Без года date_hierarchy агрегирует всю таблицу (MIN/MAX и список лет),
+    поэтому при входе в список без даты он открывается на сегодня.
+
+    Не перенаправляются окна выбора (popup, raw_id) и переходы из самого
+    списка: ссылки date_hierarchy «назад» к году и ко всем датам должны
+    работать, а год уже ограничивает агрегаты.
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        params = request.GET
+        field = self.date_hierarchy
+        dated = any(key.startswith(f'{field}__') for key in params)
+        popup = IS_POPUP_VAR in params or TO_FIELD_VAR in params
+        drilled_up = urlsplit(request.META.get('HTTP_REFERER', '')).path == request.path
+        if not (dated or popup or drilled_up):
+            today = timezone.localdate()
+            query = params.copy()
+            query[f'{field}__year'] = today.year
+            query[f'{field}__month'] = today.month
+            query[f'{field}__day'] = today.day
+            return redirect(f'{request.path}?{query.urlencode()}')
+        return super().changelist_view(request, extra_context)
 
 
 @admin.register(BusLocation)
-class BusLocationAdmin(admin.ModelAdmin):
-    list_display = ('bus', 'shift', 'latitude', 'longitude', 'speed', 'timestamp')
-    list_filter = ('timestamp', 'bus')
-    search_fields = ('bus__registration_number', 'shift__driver__username')
+class BusLocationAdmin(TodayDateHierarchyMixin, admin.ModelAdmin):
+    """
+    Админка самой большой таблицы: список по умолчанию ограничен днём
+    (date_hierarchy), без полного COUNT и без запросов на строку.
+    """
+    list_display = ('bus_number', 'shift_link', 'latitude', 'longitude', 'speed', 'timestamp')
+    list_filter = (BusFilter, OlderThanFilter)
+    # Точное совпадение: поиск по индексу, а не LIKE по всей таблице
+    search_fields = ('=bus__registration_number', '=shift__driver__username')
     readonly_fields = ('timestamp',)
-    
+    date_hierarchy = 'timestamp'
+    ordering = ('-timestamp', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_fields = ('bus',)
+    raw_id_fields = ('shift',)
+
     fieldsets = (
         ('Основная информация', {
-            'fields': ('bus', 'shift', 'timestamp')
+            'fields': ('bus', 'shift', 'timestamp', 'seq')
         }),
         ('Координаты', {
             'fields': ('latitude', 'longitude', 'accuracy')
@@ -19,4 +167,80 @@ class BusLocationAdmin(admin.ModelAdmin):
         ('Движение', {
             'fields': ('speed', 'heading')
         }),
-    )
\ No newline at end of file
+    )
+
+    def bus_number(self, obj):
+        return refcache.bus_number(obj.bus_id) or obj.bus_id
+    bus_number.short_description = 'Автобус'
+
+    def shift_link(self, obj):
+        url = reverse('admin:shift_shift_change', args=[obj.shift_id])
+        return format_html('<a href="{}">Смена #{}</a>', url, obj.shift_id)
+    shift_link.short_description = 'Смена'
+
+
+class DeviationStatusFilter(admin.SimpleListFilter):
+    title = 'статус'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('active', 'Вне маршрута'),
+            ('ended', 'Вернулся'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'active':
+            return queryset.filter(ended_at__isnull=True)
+        if self.value() == 'ended':
+            return queryset.filter(ended_at__isnull=False)
+        return queryset
+
+
+@admin.register(RouteDeviation)
+class RouteDeviationAdmin(admin.ModelAdmin):
+    """
+    Лента сходов с маршрута: сначала последние, открытые - без времени возврата.
+    """
+    list_display = ('started_at', 'bus_number', 'route_number', 'shift_link', 'ended_at', 'is_active')
+    list_filter = (DeviationStatusFilter, 'started_at')
+    search_fields = ('=bus__registration_number',)
+    raw_id_fields = ('shift', 'bus', 'route')
+    readonly_fields = ('updated_at',)
+    date_hierarchy = 'started_at'
+
+    def bus_number(self, obj):
+        return refcache.bus_number(obj.bus_id) or obj.bus_id
+    bus_number.short_description = 'Автобус'
+
+    def route_number(self, obj):
+        return refcache.route_number(obj.route_id) or '-'
+    route_number.short_description = 'Маршрут'
+
+    def shift_link(self, obj):
+        url = reverse('admin:shift_shift_change', args=[obj.shift_id])
+        return format_html('<a href="{}">Смена #{}</a>', url, obj.shift_id)
+    shift_link.short_description = 'Смена'
+
+    def is_active(self, obj):
+        return obj.is_active
+    is_active.boolean = True
+    is_active.short_description = 'Вне маршрута'
+
+
+@admin.register(StopEvent)
+class StopEventAdmin(TodayDateHierarchyMixin, admin.ModelAdmin):
+    list_display = ('arrived_at', 'route_number', 'stop_index', 'stops_version', 'bus_number', 'trip', 'departed_at', 'dwell_seconds')
+    list_filter = ('arrived_at',)
+    raw_id_fields = ('shift', 'bus', 'route')
+    date_hierarchy = 'arrived_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def bus_number(self, obj):
+        return refcache.bus_number(obj.bus_id) or obj.bus_id
+    bus_number.short_description = 'Автобус'
+
+    def route_number(self, obj):
+        return refcache.route_number(obj.route_id) or obj.route_id
+    route_number.short_description = 'Маршрут'
@@ -0,0 +1,59 @@
+"""
+Асинхронные версии публичных endpoints координат.
+Подключаются только в ASGI (gorod_osh/urls_asgi.py).
+"""
+from asgiref.sync import sync_to_async
+from django.views.decorators.http import require_safe
+
+from gorod_osh.async_responses import cached_json, encode, get_config, json_response, query_key
+from shift.models import Shift
+from . import clusters, prediction
+from .fastpath import latest_items, latest_queryset
+
+
+@require_safe
+async def latest(request):
+    """
+    GET /api/locations/latest/ — то же, что BusLocationViewSet.latest,
+    включая ответ в MessagePack по Accept.
+    """
+    zoom = request.GET.get('zoom')
+    if zoom is not None:
+        try:
+            zoom = clusters.parse_zoom(zoom)
+        except ValueError:
+            return json_response(
+                encode({'detail': 'zoom должен быть целым числом от 0 до 22'}), status=400
+            )
+
+    try:
+        route_id, bus_type = clusters.parse_filters(request.GET.get('route'), request.GET.get('bus_type'))
+    except ValueError:
+        return json_response(
+            encode({'detail': 'route должен быть ID маршрута, bus_type - типом транспорта'}), status=400
+        )
+
+    async def build():
+        active_shifts = Shift.objects.filter(status='active')
+
+        if route_id is not None:
+            active_shifts = active_shifts.filter(bus__route_id=route_id)
+
+        if bus_type is not None:
+            active_shifts = active_shifts.filter(bus__bus_type=bus_type)
+
+        rows = [row async for row in latest_queryset(active_shifts)]
+        # Справочный кеш может подгрузиться из БД - только в sync-контексте
+        items = await sync_to_async(latest_items)(rows)
+        if request.GET.get('predict') == '1':
+            items = await sync_to_async(prediction.add_predictions)(items)
+        if zoom is not None:
+            return clusters.cluster_locations(items, zoom, (route_id, bus_type))
+        return items
+
+    return await cached_json(
+        query_key('async:latest', request, 'route', 'bus_type', 'zoom', 'predict'),
+        get_config()['LIVE_TTL'],
+        build,
+        request=request
+    )
@@ -0,0 +1,57 @@
+import csv
+import io
+from itertools import islice
+
+from django.db import connections
+
+
+def chunked(iterable, size):
+    """
+    Разбивает итерируемый объект на списки по size элементов.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_rows(model, columns, rows, using='default'):
+    """
+    Загружает строки в таблицу модели через PostgreSQL COPY.
+    Обходит save()/clean() и auto_now_add, поэтому данные должны быть
+    проверены заранее и записаны в формате колонки БД (координаты -
+    целые микроградусы, см. busLocation/fields.py). None записывается как NULL.
+    Возвращает количество загруженных строк.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+
+    if not count:
+        return 0
+
+    sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(model._meta.get_field(name).column) for name in columns)
+    )
+
+    with connection.cursor() as cursor:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy'):
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            # psycopg2
+            buffer.seek(0)
+            raw_cursor.copy_expert(sql, buffer)
+
+    return count
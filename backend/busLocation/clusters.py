@@ -0,0 +1,217 @@
+"""
+Кластеры автобусов для мелкого масштаба карты (/api/locations/latest/?zoom=).
+
+Координаты переводятся в пиксели Web Mercator и раскладываются
+в квадратные ячейки CELL_PX пикселей. Ячейка на масштабе z - это
+ячейка масштаба MAX_ZOOM, сдвинутая на MAX_ZOOM - z бит, поэтому
+индекс хранит все уровни сразу и при движении автобуса обновляет
+только его ячейки (по одной на уровень), а не пересчитывает весь город.
+Уровни, где ничего не поменялось, отдаются из готового результата.
+
+Индекс свой у каждого процесса и набора фильтров (маршрут, тип транспорта),
+синхронизируется с ответом latest на каждом запросе. Фильтры проверяются
+до построения ключа, а индексов в процессе не больше MAX_INDEXES: давно
+не запрашивавшиеся наборы вытесняются.
+"""
+import math
+import threading
+from collections import Counter, OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+
+
+DEFAULTS = {
+    # Крупнее этого масштаба кластеры не строятся, отдаются все автобусы
+    'MAX_ZOOM': 14,
+    # Размер ячейки в экранных пикселях (тайл - 256)
+    'CELL_PX': 64,
+    # Ячейки с меньшим числом автобусов отдаются отдельными автобусами
+    'MIN_POINTS': 2,
+    # Сколько наборов фильтров держать в памяти процесса
+    'MAX_INDEXES': 64,
+}
+
+MAX_ZOOM_LEVEL = 22
+MAX_LATITUDE = 85.05112878
+
+# Индексы этого процесса, от давно запрошенных к недавним:
+# {(маршрут, тип, MAX_ZOOM, CELL_PX): ClusterIndex}
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LOCATION_CLUSTERS', {})}
+
+
+def parse_zoom(value):
+    """
+    Масштаб карты из query params; ValueError, если это не целое 0-22.
+    """
+    zoom = int(value)
+    if not 0 <= zoom <= MAX_ZOOM_LEVEL:
+        raise ValueError(value)
+    return zoom
+
+
+def parse_filters(route, bus_type):
+    """
+    Фильтры latest из query params: (ID маршрута или None, тип или None).
+    ValueError, если маршрут не целое число или тип не из BUS_TYPE_CHOICES.
+    """
+    route = int(route) if route else None
+    if bus_type:
+        Bus = apps.get_model('bus', 'Bus')
+        if bus_type not in dict(Bus.BUS_TYPE_CHOICES):
+            raise ValueError(bus_type)
+    return route, bus_type or None
+
+
+def cell_of(latitude, longitude, zoom, cell_px):
+    """
+    Ячейка (x, y) точки на масштабе zoom.
+    """
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    size = 256 * 2 ** zoom
+    x = (longitude + 180) / 360 * size
+    sin = math.sin(math.radians(latitude))
+    y = (0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * size
+    return int(x // cell_px), int(y // cell_px)
+
+
+class ClusterIndex:
+    """
+    Иерархическая сетка автобусов по масштабам 0..max_zoom.
+    Каждая ячейка хранит автобусы, суммы координат и маршруты.
+    """
+
+    def __init__(self, max_zoom, cell_px):
+        self.max_zoom = max_zoom
+        self.cell_px = cell_px
+        self.items = {}
+        # {bus_id: (ячейка на max_zoom, широта, долгота, маршрут)}
+        self.positions = {}
+        self.levels = [{} for _ in range(max_zoom + 1)]
+        self._results = {}
+        self.lock = threading.Lock()
+
+    def _cells(self, cell):
+        x, y = cell
+        for zoom in range(self.max_zoom + 1):
+            shift = self.max_zoom - zoom
+            yield zoom, (x >> shift, y >> shift)
+
+    def _add(self, bus_id, position):
+        cell, latitude, longitude, route_number = position
+        for zoom, key in self._cells(cell):
+            entry = self.levels[zoom].get(key)
+            if entry is None:
+                entry = self.levels[zoom][key] = [set(), 0.0, 0.0, Counter()]
+            entry[0].add(bus_id)
+            entry[1] += latitude
+            entry[2] += longitude
+            entry[3][route_number] += 1
+        self.positions[bus_id] = position
+
+    def _remove(self, bus_id):
+        cell, latitude, longitude, route_number = self.positions.pop(bus_id)
+        for zoom, key in self._cells(cell):
+            entry = self.levels[zoom][key]
+            entry[0].discard(bus_id)
+            if not entry[0]:
+                del self.levels[zoom][key]
+                continue
+            entry[1] -= latitude
+            entry[2] -= longitude
+            entry[3][route_number] -= 1
+            if not entry[3][route_number]:
+                del entry[3][route_number]
+
+    def sync(self, items):
+        """
+        Приводит индекс к списку элементов latest: переносит только
+        сдвинувшиеся автобусы и убирает пропавшие.
+        """
+        changed = False
+        seen = set()
+        for item in items:
+            bus_id = item['bus_id']
+            seen.add(bus_id)
+            self.items[bus_id] = item
+
+            latitude, longitude = item['latitude'], item['longitude']
+            old = self.positions.get(bus_id)
+            if old and old[1:] == (latitude, longitude, item['route_number']):
+                continue
+
+            if old:
+                self._remove(bus_id)
+            cell = cell_of(latitude, longitude, self.max_zoom, self.cell_px)
+            self._add(bus_id, (cell, latitude, longitude, item['route_number']))
+            changed = True
+
+        for bus_id in set(self.items) - seen:
+            del self.items[bus_id]
+            self._remove(bus_id)
+            changed = True
+
+        if changed:
+            self._results.clear()
+
+    def clusters(self, zoom, min_points):
+        """
+        Кластеры масштаба zoom и ID автобусов, оставшихся отдельными.
+        """
+        key = (zoom, min_points)
+        if key not in self._results:
+            clusters = []
+            single = []
+            for bus_ids, sum_latitude, sum_longitude, routes in self.levels[zoom].values():
+                count = len(bus_ids)
+                if count < min_points:
+                    single.extend(bus_ids)
+                    continue
+                clusters.append({
+                    'count': count,
+                    'latitude': round(sum_latitude / count, 6),
+                    'longitude': round(sum_longitude / count, 6),
+                    'routes': [
+                        {'route_number': number, 'count': route_count}
+                        for number, route_count in routes.most_common()
+                    ]
+                })
+            clusters.sort(key=lambda cluster: -cluster['count'])
+            self._results[key] = (clusters, sorted(single))
+        return self._results[key]
+
+
+def index_for(key, config):
+    index_key = (*key, config['MAX_ZOOM'], config['CELL_PX'])
+    with _indexes_lock:
+        index = _indexes.get(index_key)
+        if index is None:
+            index = _indexes[index_key] = ClusterIndex(config['MAX_ZOOM'], config['CELL_PX'])
+            while len(_indexes) > config['MAX_INDEXES']:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(index_key)
+    return index
+
+
+def cluster_locations(items, zoom, key=()):
+    """
+    Ответ latest для масштаба zoom: кластеры и отдельные автобусы.
+    key - фильтры запроса (parse_filters), у каждого набора свой индекс.
+    Крупнее MAX_ZOOM все автобусы отдаются отдельно.
+    """
+    config = get_config()
+    if zoom > config['MAX_ZOOM']:
+        return {'zoom': zoom, 'clusters': [], 'buses': items}
+
+    index = index_for(key, config)
+    with index.lock:
+        index.sync(items)
+        clusters, single = index.clusters(zoom, config['MIN_POINTS'])
+        buses = [index.items[bus_id] for bus_id in single]
+    return {'zoom': zoom, 'clusters': clusters, 'buses': buses}
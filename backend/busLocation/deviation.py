@@ -0,0 +1,151 @@
+"""
+Контроль схода с маршрута.
+
+Каждая принятая координата проверяется на попадание в коридор вокруг
+пути маршрута смены (route/geo.py SegmentGrid). Коридор строится один
+раз на процесс и версию маршрута (updated_at): при сохранении маршрута
+сразу, в остальных процессах - на первой координате.
+
+Чтобы скачки GPS не давали ложных тревог, сход фиксируется после
+CONFIRM_FIXES координат подряд вне коридора, возврат - после стольких же
+внутри. Сход записывается в RouteDeviation (started_at), возврат
+закрывает запись (ended_at). Счётчики подряд идущих координат хранятся
+в общем кеше по смене.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from gorod_osh import metrics
+from route.geo import SegmentGrid
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Полуширина коридора в метрах
+    'BUFFER_M': 75,
+    # Сколько координат подряд подтверждают сход или возврат
+    'CONFIRM_FIXES': 2,
+    # Координаты с точностью хуже этой не проверяются
+    'MAX_ACCURACY_M': 50,
+}
+
+# Коридоры, построенные этим процессом: {route_id: (updated_at, buffer_m, grid)}
+_corridors = {}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ROUTE_DEVIATION', {})}
+
+
+def state_key(shift_id):
+    return f'deviation:state:{shift_id}'
+
+
+def corridor_for(route):
+    """
+    Коридор маршрута; перестраивается, если маршрут сохранили.
+    """
+    buffer_m = get_config()['BUFFER_M']
+    cached = _corridors.get(route.pk)
+    if cached and cached[0] == route.updated_at and cached[1] == buffer_m:
+        return cached[2]
+
+    grid = SegmentGrid(route.path, buffer_m)
+    _corridors[route.pk] = (route.updated_at, buffer_m, grid)
+    return grid
+
+
+def get_state(shift_id):
+    """
+    Состояние смены: id открытого схода, счётчик координат подряд,
+    противоречащих текущему состоянию, и первая из них.
+    Без кеша id открытого схода берётся из БД.
+    """
+    try:
+        state = cache.get(state_key(shift_id))
+    except Exception:
+        logger.exception('Failed to read deviation state for shift %s', shift_id)
+        state = None
+
+    if state is None:
+        from .models import RouteDeviation
+
+        state = {
+            'deviation_id': RouteDeviation.objects.filter(
+                shift_id=shift_id, ended_at__isnull=True
+            ).values_list('id', flat=True).first(),
+            'streak': 0,
+            'first': None,
+        }
+    return state
+
+
+def set_state(shift_id, state):
+    try:
+        # Смена без координат дольше суток неактуальна
+        cache.set(state_key(shift_id), state, 24 * 60 * 60)
+    except Exception:
+        logger.exception('Failed to store deviation state for shift %s', shift_id)
+
+
+def check(location, shift):
+    """
+    Проверяет сохранённую координату и открывает или закрывает сход.
+    Возвращает 'started', 'ended' или None.
+    """
+    config = get_config()
+    route = shift.bus.route
+    if not config['ENABLED'] or route is None or not route.path:
+        return None
+
+    if location.accuracy is not None and location.accuracy > config['MAX_ACCURACY_M']:
+        return None
+
+    off_route = not corridor_for(route).contains(location.latitude, location.longitude)
+
+    state = get_state(shift.id)
+    deviating = state['deviation_id'] is not None
+    if off_route == deviating:
+        state['streak'] = 0
+        state['first'] = None
+    else:
+        if not state['streak']:
+            # Сход или возврат датируется первой координатой серии
+            state['first'] = (location.timestamp, location.latitude, location.longitude)
+        state['streak'] += 1
+
+    event = None
+    if state['streak'] >= config['CONFIRM_FIXES']:
+        from .models import RouteDeviation
+
+        timestamp, latitude, longitude = state['first']
+        if off_route:
+            deviation = RouteDeviation.objects.create(
+                shift=shift,
+                bus_id=shift.bus_id,
+                route=route,
+                started_at=timestamp,
+                latitude=latitude,
+                longitude=longitude
+            )
+            state['deviation_id'] = deviation.id
+            event = 'started'
+        else:
+            RouteDeviation.objects.filter(id=state['deviation_id']).update(
+                ended_at=timestamp, updated_at=timezone.now()
+            )
+            state['deviation_id'] = None
+            event = 'ended'
+        state['streak'] = 0
+        state['first'] = None
+
+        logger.info('Route deviation %s: shift %s, route %s', event, shift.id, route.number)
+        metrics.inc('route_deviations_total', {'event': event})
+
+    set_state(shift.id, state)
+    return event
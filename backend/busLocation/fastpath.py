@@ -0,0 +1,163 @@
+"""
+Быстрый путь для горячих endpoints чтения координат.
+
+Строки берутся из .values() / .values_list() и сразу собираются в словари
+того же вида, что отдают сериализаторы (BusLocationListSerializer,
+BusLocationTrackSerializer, BusLocationInfoSerializer), без создания
+объектов моделей и без ModelSerializer. Совпадение вывода проверяет
+benchmark_endpoints --suite serializers.
+"""
+from rest_framework import serializers
+
+from bus.models import Bus
+from gorod_osh import refcache
+from .models import BusLocation
+
+
+LIST_FIELDS = ('id', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'timestamp')
+TRACK_FIELDS = ('latitude', 'longitude', 'speed', 'timestamp')
+
+# Формат времени берётся из поля DRF, чтобы учитывать DATETIME_FORMAT и часовой пояс
+_datetime_field = serializers.DateTimeField()
+
+
+def format_datetime(value):
+    return _datetime_field.to_representation(value)
+
+
+def format_decimal(value):
+    """
+    Decimal координаты в строку, как DecimalField сериализатора.
+    Масштаб уже задан колонкой (decimal_places=6).
+    """
+    return None if value is None else f'{value:f}'
+
+
+def location_list(rows):
+    """
+    Словари из .values(*LIST_FIELDS) в вид BusLocationListSerializer.
+    """
+    return [
+        {
+            'id': row['id'],
+            'latitude': format_decimal(row['latitude']),
+            'longitude': format_decimal(row['longitude']),
+            'speed': row['speed'],
+            'heading': row['heading'],
+            'accuracy': row['accuracy'],
+            'timestamp': format_datetime(row['timestamp']),
+        }
+        for row in rows
+    ]
+
+
+def track_point(latitude, longitude, speed, timestamp):
+    return {
+        'latitude': format_decimal(latitude),
+        'longitude': format_decimal(longitude),
+        'speed': speed,
+        'timestamp': format_datetime(timestamp),
+    }
+
+
+def track_points(queryset):
+    """
+    Точки трека в виде BusLocationTrackSerializer.
+    """
+    return [track_point(*row) for row in queryset.values_list(*TRACK_FIELDS)]
+
+
+def track_page(queryset, limit):
+    """
+    Первые limit точек трека без COUNT: (точки, id последней точки,
+    есть ли точки дальше). Читает на одну строку больше limit.
+    """
+    rows = list(queryset.values_list('id', *TRACK_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return [track_point(*row[1:]) for row in rows], rows[-1][0] if rows else None, has_more
+
+
+LATEST_FIELDS = (
+    'bus_id', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'timestamp'
+)
+
+
+def latest_queryset(active_shifts):
+    """
+    Последние координаты смен - один запрос без JOIN с автобусами
+    и маршрутами. Порядок как у смен (сначала начатые позже).
+    """
+    return BusLocation.objects.latest_for_shifts(
+        active_shifts
+    ).order_by('-shift__start_time').values_list(*LATEST_FIELDS)
+
+
+def latest_items(rows):
+    """
+    Строки latest_queryset в элементы ответа /api/locations/latest/.
+    Гос. номер, тип и маршрут автобуса берутся из справочного кеша.
+    """
+    items = []
+    for bus_id, latitude, longitude, speed, heading, accuracy, timestamp in rows:
+        bus = refcache.buses.get(bus_id)
+        items.append({
+            'bus_id': bus_id,
+            'bus_number': bus[0] if bus else None,
+            'bus_type': bus[1] if bus else None,
+            'route_number': refcache.route_number(bus[2]) if bus else None,
+            'latitude': float(latitude),
+            'longitude': float(longitude),
+            'speed': speed,
+            'heading': heading,
+            'accuracy': accuracy,
+            'timestamp': timestamp
+        })
+    return items
+
+
+def latest_locations(active_shifts):
+    """
+    Последние координаты активных смен в виде ответа /api/locations/latest/.
+    """
+    return latest_items(latest_queryset(active_shifts))
+
+
+def buses_on_route(buses):
+    """
+    Автобусы на линии в виде BusLocationInfoSerializer(many=True).
+    Два запроса: автобусы и их текущие координаты, номера маршрутов
+    берутся из справочного кеша.
+    """
+    bus_rows = list(buses.values_list('id', 'registration_number', 'bus_type', 'route_id'))
+
+    locations = {
+        row[0]: {
+            'latitude': float(row[1]),
+            'longitude': float(row[2]),
+            'speed': row[3],
+            'heading': row[4],
+            'accuracy': row[5],
+            'timestamp': row[6]
+        }
+        for row in BusLocation.objects.latest_for_buses(
+            [row[0] for row in bus_rows]
+        ).values_list('bus_id', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'timestamp')
+    }
+
+    bus_types = dict(Bus.BUS_TYPE_CHOICES)
+    result = []
+    for bus_id, registration_number, bus_type, route_id in bus_rows:
+        route_number = refcache.route_number(route_id)
+        item = {
+            'id': bus_id,
+            'registration_number': registration_number,
+            'bus_type': bus_type,
+            'bus_type_display': str(bus_types.get(bus_type, bus_type)),
+        }
+        # Сериализатор пропускает route_number, если у автобуса нет маршрута
+        if route_number is not None:
+            item['route_number'] = route_number
+        item['current_location'] = locations.get(bus_id)
+        result.append(item)
+    return result
@@ -0,0 +1,76 @@
+"""
+Компактные поля для таблицы координат.
+
+BusLocation - самая большая таблица, и ширина строки напрямую определяет,
+какая её часть и её индексов помещается в память. numeric(9,6) занимает
+в Postgres 9-11 байт, integer - 4, real - 4 вместо 8 у double precision.
+"""
+from decimal import Decimal
+
+from django.db import models
+
+
+MICRODEGREES = 10 ** 6
+
+
+def to_microdegrees(value):
+    """
+    Градусы (Decimal, float или строка) в целые микроградусы.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int(value.scaleb(6).to_integral_value())
+
+
+class MicrodegreeField(models.DecimalField):
+    """
+    Координата в микроградусах (integer в БД).
+
+    Для Python, форм и сериализаторов DRF это по-прежнему DecimalField
+    с decimal_places=6: из БД возвращается Decimal('40.528300'), поэтому
+    вывод API не меняется.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_digits', 9)
+        kwargs.setdefault('decimal_places', 6)
+        super().__init__(*args, **kwargs)
+
+    def get_internal_type(self):
+        return 'IntegerField'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return Decimal(value).scaleb(-self.decimal_places)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if hasattr(value, 'as_sql'):
+            return value
+        return to_microdegrees(value)
+
+
+class SmallFloatField(models.FloatField):
+    """
+    FloatField одинарной точности (real в Postgres).
+    Семи значащих цифр с запасом хватает для скорости, курса и точности GPS.
+
+    Из БД значение округляется до этих семи цифр: real хранит ближайшее
+    двоичное число, и без округления 45.3 читалось бы как 45.29999923706055,
+    а вывод API отличался бы от прежнего double precision.
+    """
+    SIGNIFICANT_DIGITS = 7
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'real'
+        return super().db_type(connection)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or connection.vendor != 'postgresql':
+            return value
+        return float(f'{value:.{self.SIGNIFICANT_DIGITS}g}')
@@ -0,0 +1,283 @@
+"""
+Шина координат: каждая принятая координата публикуется один раз,
+а подписчики в любом процессе получают её без опроса BusLocation.
+
+- LocalHub - доставка внутри процесса (разработка, тесты, один worker);
+- PostgresHub - между процессами через PostgreSQL LISTEN/NOTIFY:
+  публикация - pg_notify, в каждом процессе с подписчиками один
+  фоновый поток слушает канал и раздаёт координаты локально.
+
+Публикация включается настройкой PUBLISH: без подписчиков (сейчас это
+только команда watch_positions) каждая координата платила бы лишним
+запросом pg_notify и трафиком очереди NOTIFY.
+
+Подписка фильтруется по маршруту, типу транспорта и прямоугольнику
+координат. Медленный подписчик не задерживает приём координат: его
+очередь ограничена, при переполнении выбрасываются самые старые.
+"""
+import json
+import logging
+import queue
+import select
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from gorod_osh import metrics
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Публиковать принятые координаты (включать, когда есть подписчики)
+    'PUBLISH': False,
+    # 'postgres', 'local' или None - по базе данных
+    'BACKEND': None,
+    'CHANNEL': 'bus_positions',
+    'QUEUE_SIZE': 1000,
+    'RECONNECT_SECONDS': 5,
+}
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'POSITION_HUB', {})}
+
+
+class Subscription:
+    """
+    Подписка на координаты. Без callback координаты складываются
+    в очередь, которую читает get().
+
+    bbox - (min_lat, min_lng, max_lat, max_lng).
+    """
+
+    def __init__(self, hub, callback=None, route=None, bus_type=None, bbox=None, maxsize=1000):
+        self.hub = hub
+        self.callback = callback
+        self.route = int(route) if route is not None else None
+        self.bus_type = bus_type
+        self.bbox = tuple(float(value) for value in bbox) if bbox else None
+        self.queue = queue.Queue(maxsize) if callback is None else None
+
+    def matches(self, fix):
+        if self.route is not None and fix['route'] != self.route:
+            return False
+        if self.bus_type is not None and fix['bus_type'] != self.bus_type:
+            return False
+        if self.bbox is not None:
+            min_lat, min_lng, max_lat, max_lng = self.bbox
+            if not (min_lat <= fix['lat'] <= max_lat and min_lng <= fix['lng'] <= max_lng):
+                return False
+        return True
+
+    def deliver(self, fix):
+        if self.callback is not None:
+            self.callback(fix)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(fix)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    metrics.inc('hub_dropped_total')
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """
+        Следующая координата или None, если за timeout секунд ничего не пришло.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalHub:
+    """
+    Шина внутри процесса: publish сразу раздаёт координату подписчикам.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback=None, route=None, bus_type=None, bbox=None):
+        subscription = Subscription(
+            self, callback, route=route, bus_type=bus_type, bbox=bbox,
+            maxsize=self.config['QUEUE_SIZE']
+        )
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, fix):
+        self.dispatch(fix)
+
+    def dispatch(self, fix):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if not subscription.matches(fix):
+                continue
+            try:
+                subscription.deliver(fix)
+            except Exception:
+                logger.exception('Position hub subscriber failed')
+
+
+class PostgresHub(LocalHub):
+    """
+    Шина между процессами через LISTEN/NOTIFY. Слушающее соединение
+    отдельное от соединений Django и открывается только в процессе,
+    где есть подписчики.
+    """
+
+    def __init__(self, config=None, using='default'):
+        super().__init__(config)
+        self.using = using
+        self._listener = None
+        self._stopping = threading.Event()
+
+    def publish(self, fix):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)',
+                [self.config['CHANNEL'], json.dumps(fix, separators=(',', ':'))]
+            )
+
+    def subscribe(self, callback=None, route=None, bus_type=None, bbox=None):
+        subscription = super().subscribe(callback, route=route, bus_type=bus_type, bbox=bbox)
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._stopping.clear()
+                self._listener = threading.Thread(
+                    target=self._listen_forever, name='position-hub', daemon=True
+                )
+                self._listener.start()
+        return subscription
+
+    def stop(self):
+        self._stopping.set()
+
+    def _connect(self):
+        wrapper = connections[self.using]
+        connection = wrapper.get_new_connection(wrapper.get_connection_params())
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {wrapper.ops.quote_name(self.config["CHANNEL"])}')
+        return connection
+
+    def _notifications(self, connection):
+        """
+        Полезные нагрузки уведомлений, не дольше секунды ожидания,
+        чтобы поток замечал stop().
+        """
+        if callable(getattr(connection, 'notifies', None)):
+            # psycopg 3
+            for notify in connection.notifies(timeout=1.0, stop_after=1):
+                yield notify.payload
+            return
+
+        # psycopg2
+        if select.select([connection], [], [], 1.0)[0]:
+            connection.poll()
+            while connection.notifies:
+                yield connection.notifies.pop(0).payload
+
+    def _listen_forever(self):
+        connection = None
+        while not self._stopping.is_set():
+            try:
+                if connection is None:
+                    connection = self._connect()
+                for payload in self._notifications(connection):
+                    self.dispatch(json.loads(payload))
+            except Exception:
+                logger.exception('Position hub listener failed, reconnecting')
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                    connection = None
+                self._stopping.wait(self.config['RECONNECT_SECONDS'])
+
+        if connection is not None:
+            connection.close()
+
+
+def get_hub():
+    """
+    Шина этого процесса (создаётся при первом обращении).
+    """
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                config = get_config()
+                backend = config['BACKEND'] or (
+                    'postgres' if connections['default'].vendor == 'postgresql' else 'local'
+                )
+                _hub = PostgresHub(config) if backend == 'postgres' else LocalHub(config)
+    return _hub
+
+
+def fix_from(location, shift):
+    """
+    Координата в виде сообщения шины (только JSON-типы, короткие ключи).
+    """
+    return {
+        'shift': shift.id,
+        'bus': shift.bus_id,
+        'route': shift.bus.route_id,
+        'bus_type': shift.bus.bus_type,
+        'lat': float(location.latitude),
+        'lng': float(location.longitude),
+        'speed': location.speed,
+        'heading': location.heading,
+        'accuracy': location.accuracy,
+        'timestamp': location.timestamp.isoformat(),
+        'seq': location.seq,
+    }
+
+
+def publish_location(location, shift):
+    """
+    Публикует сохранённую координату после коммита транзакции,
+    чтобы подписчики не получили координату откатившейся записи.
+    При выключенном PUBLISH ничего не делает. Ошибка шины не мешает
+    приёму координат.
+    """
+    if not get_config()['PUBLISH']:
+        return
+
+    def publish():
+        try:
+            get_hub().publish(fix_from(location, shift))
+            metrics.inc('hub_published_total')
+        except Exception:
+            logger.exception('Failed to publish location of shift %s', shift.id)
+
+    transaction.on_commit(publish)
@@ -0,0 +1,174 @@
+"""
+Фильтр входящих GPS-координат (мёртвая зона и heartbeat).
+
+На конечных и в пробках автобус стоит по 20 минут и каждые 5 секунд
+присылает одну и ту же точку. Такие записи раздувают BusLocation,
+её индексы и треки, не добавляя информации. Координата сохраняется,
+только если автобус сдвинулся от последней сохранённой точки дальше
+мёртвой зоны или с неё прошло HEARTBEAT_SECONDS.
+
+Последняя сохранённая точка каждой смены хранится в общем кеше.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from route.geo import haversine_m
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Минимальный сдвиг в метрах; если точность GPS хуже, порогом служит accuracy
+    'MIN_DISTANCE_M': 15,
+    # Точность, больше которой accuracy в порог не берётся (явно плохой фикс)
+    'MAX_ACCURACY_M': 50,
+    # Не реже чем раз в столько секунд координата сохраняется в любом случае
+    'HEARTBEAT_SECONDS': 60,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LOCATION_INGEST_FILTER', {})}
+
+
+def last_fix_key(shift_id):
+    return f'ingest:last_fix:{shift_id}'
+
+
+def dead_band_m(accuracy, config):
+    """
+    Радиус мёртвой зоны: не меньше MIN_DISTANCE_M и не меньше
+    погрешности фикса, но не больше MAX_ACCURACY_M.
+    """
+    if accuracy is None:
+        return config['MIN_DISTANCE_M']
+    return max(config['MIN_DISTANCE_M'], min(accuracy, config['MAX_ACCURACY_M']))
+
+
+def is_redundant(shift_id, latitude, longitude, accuracy, now=None):
+    """
+    True, если координату можно не сохранять: автобус не вышел из мёртвой
+    зоны вокруг последней сохранённой точки и heartbeat ещё не наступил.
+    Без сохранённой точки (первая координата, сброс кеша) - False.
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return False
+
+    try:
+        last = cache.get(last_fix_key(shift_id))
+    except Exception:
+        logger.exception('Failed to read last fix for shift %s', shift_id)
+        return False
+
+    if last is None:
+        return False
+
+    now = now or timezone.now()
+    if now.timestamp() - last['timestamp'] >= config['HEARTBEAT_SECONDS']:
+        return False
+
+    distance = haversine_m(last['latitude'], last['longitude'], float(latitude), float(longitude))
+    return distance < dead_band_m(accuracy, config)
+
+
+def remember(location):
+    """
+    Запоминает сохранённую координату как новую опорную точку смены.
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return
+
+    try:
+        cache.set(last_fix_key(location.shift_id), {
+            'latitude': float(location.latitude),
+            'longitude': float(location.longitude),
+            'timestamp': location.timestamp.timestamp(),
+        }, config['HEARTBEAT_SECONDS'] * 2)
+    except Exception:
+        logger.exception('Failed to store last fix for shift %s', location.shift_id)
+
+
+# acked_seq в кеше: "в смене ещё нет координат с seq" (seq не отрицательный)
+NO_SEQ = -1
+ACKED_SEQ_TTL = 24 * 60 * 60
+# Замок на сравнение и запись acked_seq: попытки и время жизни
+ACK_LOCK_ATTEMPTS = 5
+ACK_LOCK_SECONDS = 2
+
+
+def acked_seq_key(shift_id):
+    return f'ingest:acked_seq:{shift_id}'
+
+
+def acked_seq(shift_id):
+    """
+    Наибольший номер координаты (seq), принятый в смене: сохранённой
+    или отброшенной фильтром. Приложение водителя по нему понимает,
+    какие координаты из буфера отправлять повторно. Без кеша - максимум
+    из БД (частичный индекс (shift, seq)); смена без таких координат
+    запоминается как NO_SEQ, чтобы не повторять запрос на каждом фиксе.
+    """
+    try:
+        value = cache.get(acked_seq_key(shift_id))
+    except Exception:
+        logger.exception('Failed to read acked seq for shift %s', shift_id)
+        value = None
+
+    if value is None:
+        from django.db.models import Max
+        from .models import BusLocation
+
+        value = BusLocation.objects.filter(
+            shift_id=shift_id, seq__isnull=False
+        ).aggregate(seq=Max('seq'))['seq']
+        if value is not None:
+            acknowledge(shift_id, value)
+        else:
+            try:
+                # add: не затирает номер, принятый за время запроса
+                cache.add(acked_seq_key(shift_id), NO_SEQ, ACKED_SEQ_TTL)
+            except Exception:
+                logger.exception('Failed to store acked seq for shift %s', shift_id)
+    return None if value == NO_SEQ else value
+
+
+def acknowledge(shift_id, seq):
+    """
+    Поднимает подтверждённый номер до seq, если он больше. Чтение и
+    запись в кеше не атомарны, поэтому сравнение и запись идут под
+    коротким замком (cache.add): иначе два одновременных фикса могли бы
+    опустить номер. Не дождавшись замка, номер не поднимается - это
+    безопасно, приложение лишь повторит отправку.
+
+    Номер - только верхняя граница: всё, что больше, точно новое, а про
+    пропуски ниже него он ничего не говорит. Координата с меньшим seq
+    проверяется запросом exists() (BusLocationCreateSerializer.is_duplicate).
+    """
+    if seq is None:
+        return
+    key = acked_seq_key(shift_id)
+    lock_key = f'{key}:lock'
+    try:
+        for _ in range(ACK_LOCK_ATTEMPTS):
+            current = cache.get(key)
+            if current is not None and current >= seq:
+                return
+            if cache.add(lock_key, True, ACK_LOCK_SECONDS):
+                try:
+                    current = cache.get(key)
+                    if current is None or seq > current:
+                        cache.set(key, seq, ACKED_SEQ_TTL)
+                finally:
+                    cache.delete(lock_key)
+                return
+            time.sleep(0.005)
+        logger.warning('Acked seq for shift %s not raised to %s: lock busy', shift_id, seq)
+    except Exception:
+        logger.exception('Failed to store acked seq for shift %s', shift_id)
@@ -0,0 +1,404 @@
+import json
+import platform
+import re
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bus.models import Bus
+from bus.serializers import BusLocationInfoSerializer
+from busLocation import fastpath
+from busLocation.models import BusLocation
+from busLocation.serializers import BusLocationListSerializer, BusLocationTrackSerializer
+from busLocation.simulation import summarize
+from gorod_osh.renderers import ORJSONRenderer
+from shift.models import Shift
+from user.models import User
+
+
+BENCH_ADMIN_USERNAME = 'bench_admin'
+
+
+class Command(BaseCommand):
+    """
+    Повторяемый бенчмарк основных endpoints через django.test.Client.
+    Для каждого случая замеряются задержка, число SQL-запросов и размер
+    ответа. Результат выводится в JSON, чтобы сравнивать прогоны между собой.
+
+    Набор --suite serializers сравнивает сериализаторы DRF с JSONRenderer
+    и быстрый путь (busLocation/fastpath.py) с ORJSONRenderer: время,
+    число запросов и побайтовое совпадение ответов.
+
+    Набор --suite indexes замеряет скорость вставки координат (одиночной,
+    как при приёме от водителя, и пачкой) и основные запросы к BusLocation
+    с разбором плана на PostgreSQL (тип сканирования, Heap Fetches,
+    размеры индексов). Вставки откатываются, данные не меняются.
+    Набор работает с моделью текущего кода, поэтому схема БД должна
+    быть последней: после 0007 (seq) откат к 0003 удаляет колонку, и
+    запросы модели падают. Старую схему индексов (0003) можно замерить
+    только кодом коммита, где появилась 0004, на том же наборе данных.
+
+    Запускать на наборе данных из generate_dataset.
+    """
+    help = 'Микро-бенчмарк endpoints с выводом результатов в JSON'
+
+    # Поля результата, которые печатаются в stderr по ходу прогона
+    SUMMARY_KEYS = {
+        'endpoints': ('p50_ms', 'avg_queries'),
+        'serializers': ('serializer_p50_ms', 'fastpath_p50_ms', 'speedup', 'identical'),
+        'indexes': ('p50_ms', 'rows_per_s', 'scans'),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite', choices=['endpoints', 'serializers', 'indexes'], default='endpoints',
+            help='endpoints - HTTP-запросы, serializers - сериализаторы против быстрого пути, '
+                 'indexes - вставка и планы запросов к BusLocation'
+        )
+        parser.add_argument('--iterations', type=int, default=50, help='Замеров на каждый случай')
+        parser.add_argument('--warmup', type=int, default=5, help='Прогревочных запросов на случай')
+        parser.add_argument('--case', action='append', help='Запустить только указанные случаи')
+        parser.add_argument('--output', help='Записать JSON в файл вместо stdout')
+
+    def handle(self, *args, **options):
+        fixtures = self._load_fixtures()
+        if options['suite'] == 'serializers':
+            cases = self._build_serializer_cases(fixtures)
+            measure = self._measure_serializers
+        elif options['suite'] == 'indexes':
+            cases = self._build_index_cases(fixtures)
+            measure = self._measure_index_case
+        else:
+            self.client = Client()
+            cases = self._build_cases(fixtures)
+            measure = self._measure
+
+        selected = options['case'] or list(cases)
+        unknown = set(selected) - set(cases)
+        if unknown:
+            raise CommandError(f"Неизвестные случаи: {', '.join(sorted(unknown))}")
+
+        results = {}
+        for name in selected:
+            results[name] = measure(*cases[name], options)
+            self.stderr.write(f'{name}: ' + ' '.join(
+                f'{key}={results[name][key]}' for key in self.SUMMARY_KEYS[options['suite']]
+            ))
+
+        report = {
+            'meta': {
+                'generated_at': timezone.now().isoformat(),
+                'suite': options['suite'],
+                'iterations': options['iterations'],
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'fixtures': {key: value for key, value in fixtures.items() if key.endswith('_id')},
+                'indexes': self._index_sizes(),
+            },
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def _load_fixtures(self):
+        """
+        Выбирает объекты для замеров: последнюю активную смену с координатами,
+        её автобус и водителя, а также администратора для закрытых endpoints.
+        """
+        latest = BusLocation.objects.filter(
+            shift__status='active'
+        ).order_by('-timestamp').values('bus_id', 'shift_id').first()
+        if not latest:
+            raise CommandError('Нет активных смен с координатами, сначала запустите generate_dataset')
+
+        shift = Shift.objects.select_related('driver').get(id=latest['shift_id'])
+        admin, _ = User.objects.get_or_create(
+            username=BENCH_ADMIN_USERNAME,
+            defaults={'role': 'admin', 'is_staff': True}
+        )
+
+        return {
+            'bus_id': latest['bus_id'],
+            'shift_id': latest['shift_id'],
+            'route_id': shift.bus.route_id,
+            'driver_token': str(AccessToken.for_user(shift.driver)),
+            'admin_token': str(AccessToken.for_user(admin)),
+        }
+
+    def _build_cases(self, fixtures):
+        """
+        Случай: имя -> (путь, query params, JWT или None).
+        """
+        return {
+            'latest': ('/api/locations/latest/', {}, None),
+            'latest_by_route': ('/api/locations/latest/', {'route': fixtures['route_id']}, None),
+            'bus_history': (f"/api/locations/bus/{fixtures['bus_id']}/", {'hours': 24, 'limit': 1000}, None),
+            'shift_locations': (f"/api/locations/shift/{fixtures['shift_id']}/", {'limit': 2000}, None),
+            'track': ('/api/locations/track/', {'limit': 1000}, fixtures['driver_token']),
+            'shift_statistics': ('/api/shifts/statistics/', {'days': 30}, fixtures['admin_token']),
+            'shift_history': ('/api/shifts/history/', {'days': 7}, fixtures['admin_token']),
+            'route_list': ('/api/routes/', {}, None),
+        }
+
+    def _measure(self, path, params, token, options):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+
+        for _ in range(options['warmup']):
+            self.client.get(path, params, **headers)
+
+        samples = []
+        status_codes = set()
+        size = 0
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path, params, **headers)
+            samples.append({
+                'latency_ms': (time.perf_counter() - started) * 1000,
+                'queries': len(queries),
+                'ok': response.status_code < 400,
+            })
+            status_codes.add(response.status_code)
+            size = len(response.content)
+
+        summary = summarize(samples)
+        summary['mean_ms'] = round(sum(s['latency_ms'] for s in samples) / len(samples), 2)
+        summary['status_codes'] = sorted(status_codes)
+        summary['response_bytes'] = size
+        return summary
+
+    def _build_serializer_cases(self, fixtures):
+        """
+        Случай: имя -> (эталон, быстрый путь). Обе функции возвращают
+        закодированный ответ, запросы к БД выполняются внутри них
+        (.all() - чтобы не попадать в кеш результатов queryset).
+        """
+        history = BusLocation.objects.filter(
+            bus_id=fixtures['bus_id']
+        ).order_by('-timestamp', '-id')[:1000]
+        track = BusLocation.objects.filter(
+            shift_id=fixtures['shift_id']
+        ).order_by('timestamp')[:1000]
+        buses = Bus.objects.select_related('route').filter(
+            id__in=Shift.objects.filter(status='active').values('bus_id'),
+            is_active=True
+        )
+        active_shifts = Shift.objects.filter(status='active')
+        json_renderer = JSONRenderer()
+        orjson_renderer = ORJSONRenderer()
+
+        return {
+            'location_list': (
+                lambda: json_renderer.render(BusLocationListSerializer(history.all(), many=True).data),
+                lambda: orjson_renderer.render(
+                    fastpath.location_list(history.values(*fastpath.LIST_FIELDS))
+                ),
+            ),
+            'track': (
+                lambda: json_renderer.render(BusLocationTrackSerializer(track.all(), many=True).data),
+                lambda: orjson_renderer.render(fastpath.track_points(track)),
+            ),
+            'on_route': (
+                lambda: json_renderer.render(BusLocationInfoSerializer(buses.all(), many=True).data),
+                lambda: orjson_renderer.render(fastpath.buses_on_route(buses)),
+            ),
+            'latest': (
+                lambda: json_renderer.render(self._latest_reference(active_shifts)),
+                lambda: orjson_renderer.render(fastpath.latest_locations(active_shifts)),
+            ),
+        }
+
+    @staticmethod
+    def _latest_reference(active_shifts):
+        """
+        Ответ latest без быстрого пути: объекты моделей с автобусом
+        и маршрутом через JOIN, как view собирал его до fastpath.
+        """
+        locations = BusLocation.objects.latest_for_shifts(active_shifts).select_related(
+            'bus', 'bus__route'
+        ).order_by('-shift__start_time')
+        return [
+            {
+                'bus_id': location.bus.id,
+                'bus_number': location.bus.registration_number,
+                'bus_type': location.bus.bus_type,
+                'route_number': location.bus.route.number if location.bus.route else None,
+                'latitude': float(location.latitude),
+                'longitude': float(location.longitude),
+                'speed': location.speed,
+                'heading': location.heading,
+                'accuracy': location.accuracy,
+                'timestamp': location.timestamp
+            }
+            for location in locations
+        ]
+
+    def _measure_serializers(self, reference, fast, options):
+        result = {}
+        for name, build in (('serializer', reference), ('fastpath', fast)):
+            for _ in range(options['warmup']):
+                build()
+
+            samples = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    content = build()
+                samples.append({
+                    'latency_ms': (time.perf_counter() - started) * 1000,
+                    'queries': len(queries),
+                    'ok': True,
+                })
+
+            summary = summarize(samples)
+            result[f'{name}_p50_ms'] = summary['p50_ms']
+            result[f'{name}_p95_ms'] = summary['p95_ms']
+            result[f'{name}_queries'] = summary['max_queries']
+            result[f'{name}_content'] = content
+
+        identical = result.pop('serializer_content') == result.pop('fastpath_content')
+        if not identical:
+            self.stderr.write(self.style.ERROR('Ответ быстрого пути отличается от сериализатора'))
+
+        fast_p50 = result['fastpath_p50_ms']
+        result['speedup'] = round(result['serializer_p50_ms'] / fast_p50, 2) if fast_p50 else None
+        result['identical'] = identical
+        return result
+
+    def _build_index_cases(self, fixtures):
+        """
+        Случай: имя -> (вид, параметр). insert - сколько строк вставляется
+        за одну операцию, query - queryset, который выполняется и разбирается.
+        """
+        now = timezone.now()
+        by_shift = BusLocation.objects.filter(shift_id=fixtures['shift_id'])
+
+        return {
+            'insert_single': ('insert', 1),
+            'insert_bulk': ('insert', 1000),
+            'query_latest': ('query', fastpath.latest_queryset(Shift.objects.filter(status='active'))),
+            'query_track': ('query', by_shift.order_by('timestamp').values(*fastpath.TRACK_FIELDS)[:1000]),
+            'query_shift_page': ('query', by_shift.order_by('-timestamp', '-id').values(*fastpath.LIST_FIELDS)[:500]),
+            'query_bus_history': ('query', BusLocation.objects.filter(
+                bus_id=fixtures['bus_id'], timestamp__gte=now - timedelta(hours=24)
+            ).order_by('-timestamp', '-id').values(*fastpath.LIST_FIELDS)[:1000]),
+            'query_last_hour': ('query', BusLocation.objects.filter(
+                timestamp__gte=now - timedelta(hours=1)
+            ).order_by('-timestamp')[:100].values('id')),
+        }
+
+    def _measure_index_case(self, kind, param, options):
+        if kind == 'insert':
+            return self._measure_insert(param, options)
+        return self._measure_query(param, options)
+
+    def _measure_insert(self, size, options):
+        """
+        Вставка size строк в активную смену. Одиночная строка идёт через
+        save() (как в приёме координат), пачка - через bulk_create.
+        Каждая операция откатывается.
+        """
+        shift = Shift.objects.filter(status='active').first()
+
+        def insert():
+            rows = [
+                BusLocation(
+                    bus_id=shift.bus_id, shift=shift,
+                    latitude=Decimal('40.528300'), longitude=Decimal('72.798500'),
+                    speed=20.0, heading=90.0, accuracy=5.0
+                )
+                for _ in range(size)
+            ]
+            with transaction.atomic():
+                if size == 1:
+                    rows[0].save()
+                else:
+                    BusLocation.objects.bulk_create(rows)
+                transaction.set_rollback(True)
+
+        for _ in range(options['warmup']):
+            insert()
+
+        samples = []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            insert()
+            samples.append({'latency_ms': (time.perf_counter() - started) * 1000, 'ok': True})
+
+        summary = summarize(samples)
+        summary['rows_per_s'] = round(size * 1000 / summary['p50_ms']) if summary['p50_ms'] else None
+        summary['scans'] = None
+        return summary
+
+    def _measure_query(self, queryset, options):
+        for _ in range(options['warmup']):
+            list(queryset.all())
+
+        samples = []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            rows = list(queryset.all())
+            samples.append({'latency_ms': (time.perf_counter() - started) * 1000, 'ok': True})
+
+        summary = summarize(samples)
+        summary['rows'] = len(rows)
+        summary['rows_per_s'] = None
+        summary.update(self._explain(queryset))
+        return summary
+
+    def _explain(self, queryset):
+        """
+        Разбор плана на PostgreSQL: какие индексы и как сканируются,
+        сколько строк index-only scan дочитал из таблицы.
+        """
+        if connection.vendor != 'postgresql':
+            return {'scans': None}
+
+        plan = queryset.explain(analyze=True, buffers=True)
+        scans = sorted({
+            f'{match.group(1)} on {match.group(2)}'
+            for match in re.finditer(
+                r'(Index Only Scan|Index Scan|Bitmap Index Scan|Seq Scan)(?: Backward)?'
+                r'(?: using| on) (\S+)', plan
+            )
+        })
+        heap_fetches = sum(int(value) for value in re.findall(r'Heap Fetches: (\d+)', plan))
+        execution = re.search(r'Execution Time: ([\d.]+) ms', plan)
+
+        return {
+            'scans': scans,
+            'heap_fetches': heap_fetches,
+            'execution_ms': float(execution.group(1)) if execution else None,
+            'plan': plan.splitlines(),
+        }
+
+    def _index_sizes(self):
+        """
+        Размеры таблицы координат и её индексов в байтах (только PostgreSQL).
+        """
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexrelname, pg_relation_size(indexrelid) FROM pg_stat_user_indexes '
+                'WHERE relname = %s ORDER BY indexrelname',
+                [BusLocation._meta.db_table]
+            )
+            sizes = dict(cursor.fetchall())
+            cursor.execute('SELECT pg_relation_size(%s)', [BusLocation._meta.db_table])
+            sizes['table'] = cursor.fetchone()[0]
+        return sizes
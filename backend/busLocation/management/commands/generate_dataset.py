@@ -0,0 +1,146 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from busLocation.bulk import chunked, copy_rows
+from busLocation.fields import to_microdegrees
+from busLocation.models import BusLocation
+from busLocation.simulation import PathWalker, create_fleet, delete_fleet, fleet_filter
+from shift.models import Shift
+
+
+SHIFT_COLUMNS = ['driver', 'bus', 'start_time', 'end_time', 'status']
+LOCATION_COLUMNS = ['bus', 'shift', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'timestamp']
+
+
+class Command(BaseCommand):
+    """
+    Генерирует набор данных масштаба города: маршруты с правдоподобными
+    путями, автобусы с водителями, смены за несколько месяцев и координаты
+    каждой смены. Смены и координаты загружаются через COPY.
+
+    Последняя смена каждого автобуса остаётся активной и продолжается
+    до текущего момента, чтобы endpoints живой карты возвращали данные.
+
+    Пример: 300 маршрутов, 2000 автобусов, 60 дней по 10 часов,
+    точка раз в минуту — около 72 млн записей BusLocation.
+    """
+    help = 'Генерация крупного набора данных для бенчмарков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=300, help='Количество маршрутов')
+        parser.add_argument('--buses', type=int, default=2000, help='Количество автобусов')
+        parser.add_argument('--days', type=int, default=60, help='Сколько дней истории генерировать')
+        parser.add_argument('--shift-hours', type=float, default=10, help='Длительность смены, ч')
+        parser.add_argument('--interval', type=int, default=60, help='Интервал между координатами, сек')
+        parser.add_argument('--speed', type=float, default=20, help='Средняя скорость, км/ч')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Строк в одном COPY')
+        parser.add_argument('--prefix', default='DS', help='Префикс синтетических объектов')
+        parser.add_argument('--password', default='dataset-pass-123', help='Пароль синтетических водителей')
+        parser.add_argument('--seed', type=int, default=0, help='Seed генератора')
+        parser.add_argument('--replace', action='store_true', help='Удалить ранее сгенерированный набор с этим префиксом')
+
+    def handle(self, *args, **options):
+        if options['routes'] < 1:
+            raise CommandError('--routes должен быть не меньше 1')
+        if options['buses'] < options['routes']:
+            raise CommandError('--buses не может быть меньше --routes')
+
+        prefix = options['prefix']
+        if options['replace']:
+            delete_fleet(prefix)
+        elif any(objects.exists() for objects in fleet_filter(prefix).values()):
+            raise CommandError(
+                f'Набор с префиксом {prefix} уже есть: запустите с --replace '
+                f'или укажите другой --prefix'
+            )
+
+        self.rng = random.Random(options['seed'])
+        # Остаток от деления достаётся первым маршрутам, по одному автобусу
+        base, extra = divmod(options['buses'], options['routes'])
+        buses_per_route = [base + (index < extra) for index in range(options['routes'])]
+
+        fleet = create_fleet(
+            prefix, options['routes'], buses_per_route,
+            options['password'], seed=options['seed']
+        )
+        self.stdout.write(f'Created {len(fleet)} buses on {options["routes"]} routes')
+
+        shifts = self._create_shifts(fleet, options)
+        self.stdout.write(f'Created {len(shifts)} shifts')
+
+        walkers = {
+            route.id: PathWalker(route.path, options['speed'])
+            for _, _, route in fleet
+        }
+        route_by_bus = {bus.id: route.id for _, bus, route in fleet}
+
+        rows = self._generate_locations(shifts, walkers, route_by_bus, options)
+        total = 0
+        for chunk in chunked(rows, options['chunk_size']):
+            with transaction.atomic():
+                total += copy_rows(BusLocation, LOCATION_COLUMNS, chunk)
+            self.stdout.write(f'Inserted {total} locations...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset ready: {len(fleet)} buses, {len(shifts)} shifts, {total} locations'
+        ))
+
+    def _create_shifts(self, fleet, options):
+        """
+        Одна смена в день на автобус, начало около 06:00 местного времени.
+        """
+        now = timezone.now()
+        today = timezone.localtime(now).replace(hour=6, minute=0, second=0, microsecond=0)
+        shift_length = timedelta(hours=options['shift_hours'])
+
+        rows = []
+        for driver, bus, _ in fleet:
+            starts = [
+                today - timedelta(days=day) + timedelta(minutes=self.rng.randint(-30, 30))
+                for day in range(options['days'], -1, -1)
+            ]
+            starts = [start for start in starts if start < now]
+            for start in starts[:-1]:
+                end = start + shift_length
+                rows.append([driver.id, bus.id, start.isoformat(), end.isoformat(), 'completed'])
+            if starts:
+                rows.append([driver.id, bus.id, starts[-1].isoformat(), None, 'active'])
+
+        with transaction.atomic():
+            for chunk in chunked(rows, options['chunk_size']):
+                copy_rows(Shift, SHIFT_COLUMNS, chunk)
+
+        return list(
+            Shift.objects.filter(bus_id__in=[bus.id for _, bus, _ in fleet])
+            .order_by('start_time')
+            .values_list('id', 'bus_id', 'start_time', 'end_time')
+        )
+
+    def _generate_locations(self, shifts, walkers, route_by_bus, options):
+        now = timezone.now()
+        interval = timedelta(seconds=options['interval'])
+
+        for shift_id, bus_id, start_time, end_time in shifts:
+            walker = walkers[route_by_bus[bus_id]]
+            offset = self.rng.uniform(0, walker.cumulative[-1])
+            end_time = end_time or now
+            timestamp = start_time
+            elapsed = 0
+
+            while timestamp <= end_time:
+                lat, lng, heading = walker.position(elapsed + offset / walker.speed_ms)
+                yield [
+                    bus_id, shift_id,
+                    to_microdegrees(lat + self.rng.gauss(0, 0.00002)),
+                    to_microdegrees(lng + self.rng.gauss(0, 0.00002)),
+                    round(max(0.0, self.rng.gauss(options['speed'], 5)), 1),
+                    round(heading, 1),
+                    round(self.rng.uniform(3, 20), 1),
+                    timestamp.isoformat(),
+                ]
+                timestamp += interval
+                elapsed += options['interval']
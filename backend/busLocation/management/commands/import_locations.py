@@ -0,0 +1,269 @@
+import csv
+import json
+import os
+from bisect import bisect_right
+from datetime import datetime, timezone as dt_timezone
+from xml.etree import ElementTree
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from bus.models import Bus
+from busLocation.bulk import chunked, copy_rows
+from busLocation.fields import to_microdegrees
+from busLocation.models import BusLocation
+from shift.models import Shift
+
+
+COLUMNS = ['bus', 'shift', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'timestamp']
+
+
+class Command(BaseCommand):
+    """
+    Импорт исторических GPS-логов в BusLocation.
+
+    Поддерживаемые форматы:
+    - csv:    заголовок с колонками bus|bus_id, shift_id (опц.), timestamp,
+              latitude|lat, longitude|lon|lng, speed, heading, accuracy
+    - ndjson: по одному JSON-объекту на строку с теми же ключами
+    - gpx:    точки trkpt, автобус задаётся через --bus; точность в метрах
+              считается как hdop * --uere
+
+    Строки загружаются через COPY пачками, без save() на каждую точку.
+    Смена подбирается по автобусу и времени точки.
+    """
+    help = 'Импорт исторических GPS-логов (CSV/NDJSON/GPX) через PostgreSQL COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу с логами')
+        parser.add_argument(
+            '--format', choices=['csv', 'ndjson', 'gpx'],
+            help='Формат файла (по умолчанию определяется по расширению)'
+        )
+        parser.add_argument(
+            '--bus', help='Гос. номер или ID автобуса для всех точек (обязателен для GPX)'
+        )
+        parser.add_argument(
+            '--uere', type=float, default=5.0,
+            help='Ошибка дальности приёмника в метрах для пересчёта GPX hdop в точность '
+                 '(по умолчанию 5; 0 - не заполнять accuracy)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=50000,
+            help='Количество строк в одном COPY (по умолчанию 50000)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только разобрать и сопоставить точки, ничего не записывать'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл не найден: {path}')
+
+        file_format = options['format'] or self._detect_format(path)
+        if file_format == 'gpx' and not options['bus']:
+            raise CommandError('Для GPX необходимо указать --bus')
+
+        self._buses = dict(Bus.objects.values_list('registration_number', 'id'))
+        self._bus_ids = set(self._buses.values())
+        self._shifts_by_bus = {}
+        self._shift_buses = {}
+        self.stats = {'imported': 0, 'invalid': 0, 'unmatched': 0}
+
+        if options['uere'] < 0:
+            raise CommandError('--uere не может быть отрицательным')
+        self._uere = options['uere']
+
+        default_bus_id = self._resolve_bus(options['bus']) if options['bus'] else None
+        if options['bus'] and default_bus_id is None:
+            raise CommandError(f"Автобус не найден: {options['bus']}")
+
+        records = {
+            'csv': self._read_csv,
+            'ndjson': self._read_ndjson,
+            'gpx': self._read_gpx,
+        }[file_format](path)
+
+        rows = self._build_rows(records, default_bus_id)
+
+        for chunk in chunked(rows, options['chunk_size']):
+            if options['dry_run']:
+                self.stats['imported'] += len(chunk)
+                continue
+
+            with transaction.atomic():
+                self.stats['imported'] += copy_rows(BusLocation, COLUMNS, chunk)
+            self.stdout.write(f"Imported {self.stats['imported']} locations...")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.stats['imported']} locations, "
+            f"skipped {self.stats['invalid']} invalid "
+            f"and {self.stats['unmatched']} without matching shift"
+        ))
+
+    def _detect_format(self, path):
+        extension = os.path.splitext(path)[1].lower().lstrip('.')
+        if extension in ('json', 'jsonl', 'ndjson'):
+            return 'ndjson'
+        if extension in ('csv', 'gpx'):
+            return extension
+        raise CommandError('Не удалось определить формат файла, укажите --format')
+
+    # --- Чтение форматов ---
+
+    def _read_csv(self, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+    def _read_ndjson(self, path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def _read_gpx(self, path):
+        for _, element in ElementTree.iterparse(path):
+            if not element.tag.endswith('trkpt'):
+                continue
+
+            record = {'lat': element.get('lat'), 'lon': element.get('lon')}
+            for child in element:
+                tag = child.tag.rsplit('}', 1)[-1]
+                if tag == 'time':
+                    record['timestamp'] = child.text
+                elif tag == 'speed' and child.text:
+                    # В GPX скорость в м/с
+                    record['speed'] = float(child.text) * 3.6
+                elif tag == 'course':
+                    record['heading'] = child.text
+                elif tag == 'hdop' and child.text and self._uere:
+                    # hdop безразмерный: точность в метрах - hdop * UERE
+                    record['accuracy'] = float(child.text) * self._uere
+            element.clear()
+            yield record
+
+    # --- Сопоставление ---
+
+    def _build_rows(self, records, default_bus_id):
+        for record in records:
+            try:
+                row = self._parse_record(record, default_bus_id)
+            except (TypeError, ValueError):
+                self.stats['invalid'] += 1
+                continue
+
+            if row is None:
+                self.stats['unmatched'] += 1
+                continue
+
+            yield row
+
+    def _parse_record(self, record, default_bus_id):
+        latitude = float(_first(record, 'latitude', 'lat'))
+        longitude = float(_first(record, 'longitude', 'lon', 'lng'))
+        speed = _optional_float(record.get('speed'))
+        heading = _optional_float(record.get('heading'))
+        accuracy = _optional_float(record.get('accuracy'))
+        timestamp = _parse_timestamp(_first(record, 'timestamp', 'time'))
+
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            raise ValueError('coordinates out of range')
+        if speed is not None and speed < 0:
+            raise ValueError('negative speed')
+        if heading is not None and not 0 <= heading <= 360:
+            raise ValueError('heading out of range')
+
+        shift_id = record.get('shift_id') or record.get('shift')
+        if shift_id:
+            shift_id = int(shift_id)
+            bus_id = self._get_shift_bus(shift_id)
+        else:
+            bus_value = record.get('bus_id') or record.get('bus')
+            bus_id = self._resolve_bus(bus_value) if bus_value else default_bus_id
+            shift_id = self._find_shift(bus_id, timestamp)
+
+        if bus_id is None or shift_id is None:
+            return None
+
+        return [
+            bus_id, shift_id, to_microdegrees(latitude), to_microdegrees(longitude),
+            speed, heading, accuracy, timestamp.isoformat()
+        ]
+
+    def _resolve_bus(self, value):
+        value = str(value).strip()
+        if value in self._buses:
+            return self._buses[value]
+        if value.upper() in self._buses:
+            return self._buses[value.upper()]
+        if value.isdigit() and int(value) in self._bus_ids:
+            return int(value)
+        return None
+
+    def _get_shift_bus(self, shift_id):
+        if shift_id not in self._shift_buses:
+            self._shift_buses[shift_id] = Shift.objects.filter(
+                id=shift_id
+            ).values_list('bus_id', flat=True).first()
+        return self._shift_buses[shift_id]
+
+    def _find_shift(self, bus_id, timestamp):
+        """
+        Ищет смену автобуса, в интервал которой попадает время точки.
+        Смены автобуса загружаются один раз и ищутся бинарным поиском.
+        """
+        if bus_id is None:
+            return None
+
+        if bus_id not in self._shifts_by_bus:
+            shifts = list(
+                Shift.objects.filter(bus_id=bus_id)
+                .order_by('start_time')
+                .values_list('start_time', 'end_time', 'id')
+            )
+            self._shifts_by_bus[bus_id] = ([s[0] for s in shifts], shifts)
+
+        starts, shifts = self._shifts_by_bus[bus_id]
+        index = bisect_right(starts, timestamp) - 1
+        if index < 0:
+            return None
+
+        start_time, end_time, shift_id = shifts[index]
+        if end_time is not None and timestamp > end_time:
+            return None
+        return shift_id
+
+
+def _first(record, *keys):
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ''):
+            return value
+    raise ValueError(f'missing {keys[0]}')
+
+
+def _optional_float(value):
+    if value in (None, ''):
+        return None
+    return float(value)
+
+
+def _parse_timestamp(value):
+    """
+    Принимает ISO 8601 или unix-время в секундах.
+    Время без часового пояса считается локальным (TIME_ZONE).
+    """
+    if isinstance(value, (int, float)) or str(value).replace('.', '', 1).isdigit():
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+
+    parsed = parse_datetime(str(value).strip())
+    if parsed is None:
+        raise ValueError('invalid timestamp')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
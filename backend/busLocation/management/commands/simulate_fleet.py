@@ -0,0 +1,307 @@
+import heapq
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from busLocation.simulation import (
+    PathWalker, create_fleet, delete_created, delete_fleet, fleet_filter, start_shifts, summarize
+)
+
+
+class InProcessClient:
+    """
+    Выполняет запросы через django.test.Client в текущем процессе.
+    Позволяет считать SQL-запросы на каждый HTTP-запрос.
+    """
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data=None, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'POST':
+                response = self.client.post(
+                    path, data=json.dumps(data), content_type='application/json', **headers
+                )
+            else:
+                response = self.client.get(path, data=data, **headers)
+        return response.status_code, response.content, len(queries)
+
+    def close(self):
+        connection.close()
+
+
+class HttpClient:
+    """
+    Выполняет запросы к запущенному серверу по HTTP.
+    Количество SQL-запросов в этом режиме неизвестно.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, data=None, token=None):
+        url = self.base_url + path
+        body = None
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if method == 'POST':
+            body = json.dumps(data).encode()
+        elif data:
+            url += '?' + urllib.parse.urlencode(data)
+
+        request = urllib.request.Request(url, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, response.read(), None
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), None
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный тест: синтетический парк водителей отправляет координаты
+    по своим маршрутам, а пассажиры опрашивают публичные endpoints.
+
+    По умолчанию запросы выполняются внутри процесса через django.test.Client
+    (считаются SQL-запросы). С --base-url нагрузка идёт на запущенный сервер.
+
+    Тест пишет в БД (маршруты, автобусы, водители, смены), поэтому без
+    DEBUG запускается только с --allow-write. Остатки прошлого прогона
+    по префиксу удаляются только при тесте внутри процесса; с --base-url
+    они считаются чужими данными и тест не запускается. После теста
+    удаляются только созданные им объекты.
+    """
+    help = 'Нагрузочный тест приёма координат и публичных endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=10, help='Количество маршрутов')
+        parser.add_argument('--buses-per-route', type=int, default=5, help='Автобусов на маршрут')
+        parser.add_argument('--duration', type=float, default=60, help='Длительность теста, сек')
+        parser.add_argument('--interval', type=float, default=5, help='Интервал отправки координат одним автобусом, сек')
+        parser.add_argument('--speed', type=float, default=25, help='Скорость автобусов, км/ч')
+        parser.add_argument('--passengers', type=int, default=10, help='Количество пассажиров')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Интервал опроса одним пассажиром, сек')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков для отправки координат')
+        parser.add_argument('--base-url', help='Адрес запущенного сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--prefix', default='LT', help='Префикс синтетических объектов')
+        parser.add_argument('--password', default='loadtest-pass-123', help='Пароль синтетических водителей')
+        parser.add_argument('--seed', type=int, default=0, help='Seed генератора маршрутов')
+        parser.add_argument('--keep', action='store_true', help='Не удалять синтетический парк после теста')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+        parser.add_argument(
+            '--allow-write', action='store_true',
+            help='Разрешить запись в БД при DEBUG=False (не запускайте на рабочей базе)'
+        )
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1:
+            raise CommandError('--threads должен быть не меньше 1')
+
+        self.options = options
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+        if not settings.DEBUG and not options['allow_write']:
+            raise CommandError(
+                'Тест создаёт и удаляет данные в БД: запускайте с DEBUG=True или с --allow-write'
+            )
+
+        prefix = options['prefix']
+        if not options['base_url']:
+            delete_fleet(prefix)
+        elif any(objects.exists() for objects in fleet_filter(prefix).values()):
+            raise CommandError(
+                f'В БД уже есть объекты с префиксом {prefix}: укажите другой --prefix '
+                f'(с --base-url они не удаляются)'
+            )
+
+        # create_fleet атомарен; всё созданное после него удаляется в finally
+        fleet = create_fleet(
+            prefix, options['routes'], options['buses_per_route'],
+            options['password'], seed=options['seed']
+        )
+        try:
+            start_shifts(fleet)
+            self.stderr.write(f'Fleet ready: {len(fleet)} buses on {options["routes"]} routes')
+
+            drivers = self._login(fleet)
+            results = self._run(drivers)
+        finally:
+            if not options['keep']:
+                delete_created(fleet)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            self._print_table(results)
+
+    def _make_client(self):
+        if self.options['base_url']:
+            return HttpClient(self.options['base_url'])
+        return InProcessClient()
+
+    def _record(self, endpoint, started, status_code, queries):
+        sample = {
+            'latency_ms': (time.perf_counter() - started) * 1000,
+            'queries': queries,
+            'ok': status_code < 400,
+        }
+        with self.lock:
+            self.samples[endpoint].append(sample)
+
+    def _call(self, client, endpoint, method, path, data=None, token=None):
+        started = time.perf_counter()
+        status_code, content, queries = client.request(method, path, data, token)
+        self._record(endpoint, started, status_code, queries)
+        return status_code, content
+
+    def _login(self, fleet):
+        """
+        Получает JWT для каждого водителя через /api/auth/login/.
+        """
+        client = self._make_client()
+        drivers = []
+        try:
+            for index, (driver, bus, route) in enumerate(fleet):
+                status_code, content = self._call(
+                    client, 'login', 'POST', '/api/auth/login/',
+                    {'username': driver.username, 'password': self.options['password']}
+                )
+                if status_code != 200:
+                    raise CommandError(f'Не удалось войти как {driver.username}: {status_code}')
+
+                walker = PathWalker(
+                    route.path, self.options['speed'],
+                    offset_m=index * 500.0
+                )
+                drivers.append({
+                    'token': json.loads(content)['access'],
+                    'route_id': route.id,
+                    'walker': walker,
+                })
+        finally:
+            client.close()
+        return drivers
+
+    def _run(self, drivers):
+        options = self.options
+        stop_at = time.perf_counter() + options['duration']
+        threads = []
+
+        groups = [drivers[i::options['threads']] for i in range(options['threads'])]
+        for group in groups:
+            if group:
+                threads.append(threading.Thread(target=self._drive, args=(group, stop_at)))
+
+        for _ in range(options['passengers']):
+            threads.append(threading.Thread(target=self._poll, args=(drivers, stop_at)))
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'config': {
+                'buses': len(drivers),
+                'routes': options['routes'],
+                'passengers': options['passengers'],
+                'interval_s': options['interval'],
+                'target_ingest_rps': round(len(drivers) / options['interval'], 2),
+                'mode': 'http' if options['base_url'] else 'in-process',
+                'duration_s': round(elapsed, 2),
+            },
+            'endpoints': {
+                endpoint: summarize(samples, elapsed if endpoint != 'login' else None)
+                for endpoint, samples in sorted(self.samples.items())
+            },
+        }
+
+    def _drive(self, drivers, stop_at):
+        """
+        Отправляет координаты группы водителей с заданным интервалом.
+        """
+        client = self._make_client()
+        interval = self.options['interval']
+        started = time.perf_counter()
+        # Разносим первые отправки по интервалу, чтобы не было залпа
+        queue = [(started + interval * i / len(drivers), i) for i in range(len(drivers))]
+        heapq.heapify(queue)
+
+        try:
+            while queue[0][0] < stop_at:
+                due, index = heapq.heappop(queue)
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+                driver = drivers[index]
+                lat, lng, heading = driver['walker'].position(time.perf_counter() - started)
+                self._call(client, 'send', 'POST', '/api/locations/send/', {
+                    'latitude': round(lat, 6),
+                    'longitude': round(lng, 6),
+                    'speed': self.options['speed'],
+                    'heading': round(heading, 1),
+                    'accuracy': 10,
+                }, token=driver['token'])
+
+                heapq.heappush(queue, (due + interval, index))
+        finally:
+            client.close()
+
+    def _poll(self, drivers, stop_at):
+        """
+        Пассажир опрашивает карту; трек запрашивается от имени водителя.
+        """
+        client = self._make_client()
+        rng = random.Random()
+        interval = self.options['poll_interval']
+
+        try:
+            time.sleep(rng.uniform(0, interval))
+            while time.perf_counter() < stop_at:
+                driver = rng.choice(drivers)
+                self._call(client, 'latest', 'GET', '/api/locations/latest/')
+                self._call(client, 'on_route', 'GET', '/api/buses/on-route/', {'route': driver['route_id']})
+                self._call(client, 'track', 'GET', '/api/locations/track/', token=driver['token'])
+                time.sleep(interval)
+        finally:
+            client.close()
+
+    def _print_table(self, results):
+        config = results['config']
+        self.stdout.write(
+            f"Mode: {config['mode']}, buses: {config['buses']}, passengers: {config['passengers']}, "
+            f"duration: {config['duration_s']}s, target ingest: {config['target_ingest_rps']} req/s"
+        )
+        header = f"{'endpoint':<10} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+        self.stdout.write(header)
+        for endpoint, s in results['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<10} {s['requests']:>8} {s['errors']:>6} "
+                f"{_fmt(s.get('throughput_rps')):>8} {_fmt(s['p50_ms']):>8} "
+                f"{_fmt(s['p95_ms']):>8} {_fmt(s['p99_ms']):>8} {_fmt(s['avg_queries']):>8}"
+            )
+
+
+def _fmt(value):
+    return '-' if value is None else f'{value:.2f}'
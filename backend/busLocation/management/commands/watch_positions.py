@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from busLocation.hub import get_config, get_hub
+
+
+class Command(BaseCommand):
+    """
+    Печатает координаты из шины (busLocation/hub.py) по мере приёма,
+    по одной JSON-строке. Удобно проверить, что публикация и
+    LISTEN/NOTIFY работают между процессами (нужен POSITION_HUB['PUBLISH']).
+    """
+    help = 'Подписка на шину координат с фильтрами по маршруту, типу и прямоугольнику'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', type=int, help='ID маршрута')
+        parser.add_argument('--bus-type', help='Тип транспорта')
+        parser.add_argument(
+            '--bbox', help='Прямоугольник min_lat,min_lng,max_lat,max_lng'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=0,
+            help='Остановиться после стольких координат (0 - без ограничения)'
+        )
+
+    def handle(self, *args, **options):
+        bbox = None
+        if options['bbox']:
+            try:
+                bbox = [float(value) for value in options['bbox'].split(',')]
+            except ValueError:
+                bbox = []
+            if len(bbox) != 4:
+                raise CommandError('--bbox: нужно четыре числа через запятую')
+
+        if not get_config()['PUBLISH']:
+            self.stderr.write(self.style.WARNING(
+                "POSITION_HUB['PUBLISH'] выключен: приём координат в шину не публикует"
+            ))
+
+        received = 0
+        with get_hub().subscribe(
+            route=options['route'], bus_type=options['bus_type'], bbox=bbox
+        ) as subscription:
+            try:
+                while not options['limit'] or received < options['limit']:
+                    fix = subscription.get(timeout=1.0)
+                    if fix is None:
+                        continue
+                    self.stdout.write(json.dumps(fix, ensure_ascii=False))
+                    received += 1
+            except KeyboardInterrupt:
+                pass
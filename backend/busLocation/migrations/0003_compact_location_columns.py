@@ -0,0 +1,167 @@
+"""
+Перевод координат в целые микроградусы, а speed/heading/accuracy в real.
+
+ALTER COLUMN ... TYPE переписал бы всю таблицу одной транзакцией под
+эксклюзивной блокировкой. Вместо этого миграция неатомарная:
+новые колонки добавляются рядом, данные копируются пачками по id
+(каждая пачка - своя короткая транзакция), затем старые колонки
+удаляются, а новые переименовываются.
+
+Записи, которые появятся во время копирования, подбираются финальным
+проходом по строкам с пустой новой колонкой; на время удаления старых
+колонок приём координат лучше остановить. Миграция необратима.
+"""
+from django.db import migrations, transaction
+
+import busLocation.fields
+
+
+BATCH_SIZE = 50000
+
+COLUMNS = (
+    # (старое поле, новое поле, SQL-выражение)
+    ('latitude', 'latitude_e6', 'ROUND({column} * 1000000)'),
+    ('longitude', 'longitude_e6', 'ROUND({column} * 1000000)'),
+    ('speed', 'speed_r', '{column}'),
+    ('heading', 'heading_r', '{column}'),
+    ('accuracy', 'accuracy_r', '{column}'),
+)
+
+
+def copy_in_batches(apps, schema_editor):
+    BusLocation = apps.get_model('busLocation', 'BusLocation')
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    opts = BusLocation._meta
+
+    table = quote(opts.db_table)
+    assignments = ', '.join(
+        '{} = {}'.format(
+            quote(opts.get_field(new).column),
+            expression.format(column=quote(opts.get_field(old).column))
+        )
+        for old, new, expression in COLUMNS
+    )
+    marker = quote(opts.get_field('latitude_e6').column)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {table}')
+        low, high = cursor.fetchone()
+
+    if low is not None:
+        for start in range(low, high + 1, BATCH_SIZE):
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} SET {assignments} WHERE id >= %s AND id < %s',
+                    [start, start + BATCH_SIZE]
+                )
+
+    # Строки, добавленные во время копирования
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET {assignments} WHERE {marker} IS NULL')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("busLocation", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buslocation",
+            name="latitude_e6",
+            field=busLocation.fields.MicrodegreeField(
+                decimal_places=6, max_digits=9, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="buslocation",
+            name="longitude_e6",
+            field=busLocation.fields.MicrodegreeField(
+                decimal_places=6, max_digits=9, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="buslocation",
+            name="speed_r",
+            field=busLocation.fields.SmallFloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name="buslocation",
+            name="heading_r",
+            field=busLocation.fields.SmallFloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name="buslocation",
+            name="accuracy_r",
+            field=busLocation.fields.SmallFloatField(null=True),
+        ),
+        migrations.RunPython(copy_in_batches),
+        migrations.RemoveField(model_name="buslocation", name="latitude"),
+        migrations.RemoveField(model_name="buslocation", name="longitude"),
+        migrations.RemoveField(model_name="buslocation", name="speed"),
+        migrations.RemoveField(model_name="buslocation", name="heading"),
+        migrations.RemoveField(model_name="buslocation", name="accuracy"),
+        migrations.RenameField(
+            model_name="buslocation", old_name="latitude_e6", new_name="latitude"
+        ),
+        migrations.RenameField(
+            model_name="buslocation", old_name="longitude_e6", new_name="longitude"
+        ),
+        migrations.RenameField(
+            model_name="buslocation", old_name="speed_r", new_name="speed"
+        ),
+        migrations.RenameField(
+            model_name="buslocation", old_name="heading_r", new_name="heading"
+        ),
+        migrations.RenameField(
+            model_name="buslocation", old_name="accuracy_r", new_name="accuracy"
+        ),
+        migrations.AlterField(
+            model_name="buslocation",
+            name="latitude",
+            field=busLocation.fields.MicrodegreeField(
+                decimal_places=6,
+                help_text="Диапазон: -90 до +90",
+                max_digits=9,
+                verbose_name="Широта",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="buslocation",
+            name="longitude",
+            field=busLocation.fields.MicrodegreeField(
+                decimal_places=6,
+                help_text="Диапазон: -180 до +180",
+                max_digits=9,
+                verbose_name="Долгота",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="buslocation",
+            name="speed",
+            field=busLocation.fields.SmallFloatField(
+                blank=True, help_text="Скорость в км/ч", null=True, verbose_name="Скорость"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="buslocation",
+            name="heading",
+            field=busLocation.fields.SmallFloatField(
+                blank=True,
+                help_text="Градусы: 0-360 (0=север, 90=восток)",
+                null=True,
+                verbose_name="Направление",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="buslocation",
+            name="accuracy",
+            field=busLocation.fields.SmallFloatField(
+                blank=True, help_text="Точность в метрах", null=True, verbose_name="Точность GPS"
+            ),
+        ),
+    ]
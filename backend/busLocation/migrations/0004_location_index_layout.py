@@ -0,0 +1,69 @@
+"""
+Новая схема индексов BusLocation.
+
+B-tree (shift, -timestamp) заменяется покрывающим (shift, -timestamp, -id)
+INCLUDE (координаты), B-tree (-timestamp) - индексом BRIN.
+Индексы строятся и удаляются CONCURRENTLY, без блокировки записи,
+поэтому миграция неатомарная. Новые индексы создаются раньше, чем
+удаляются старые, чтобы запросы ни в какой момент не остались без индекса.
+"""
+from django.contrib.postgres.indexes import BrinIndex
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+# Чтобы index-only scan не ходил в таблицу, карта видимости должна быть
+# свежей; для таблицы, которая только дополняется, VACUUM по вставкам
+# запускается чаще стандартного (PostgreSQL 13+)
+AUTOVACUUM_SETTINGS = (
+    'autovacuum_vacuum_insert_scale_factor = 0.01',
+    'autovacuum_vacuum_insert_threshold = 10000',
+)
+
+
+def set_autovacuum(apps, schema_editor):
+    BusLocation = apps.get_model('busLocation', 'BusLocation')
+    table = schema_editor.quote_name(BusLocation._meta.db_table)
+    schema_editor.execute(f"ALTER TABLE {table} SET ({', '.join(AUTOVACUUM_SETTINGS)})")
+
+
+def reset_autovacuum(apps, schema_editor):
+    BusLocation = apps.get_model('busLocation', 'BusLocation')
+    table = schema_editor.quote_name(BusLocation._meta.db_table)
+    names = ', '.join(setting.split(' = ')[0] for setting in AUTOVACUUM_SETTINGS)
+    schema_editor.execute(f'ALTER TABLE {table} RESET ({names})')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("busLocation", "0003_compact_location_columns"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="buslocation",
+            index=models.Index(
+                fields=["shift", "-timestamp", "-id"],
+                include=["latitude", "longitude", "speed", "heading", "accuracy"],
+                name="busloc_shift_ts_covering",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="buslocation",
+            index=BrinIndex(
+                fields=["timestamp"], pages_per_range=32, name="busloc_timestamp_brin"
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name="buslocation",
+            name="busLocation_shift_i_d6093d_idx",
+        ),
+        RemoveIndexConcurrently(
+            model_name="buslocation",
+            name="busLocation_timesta_1b90a8_idx",
+        ),
+        migrations.RunPython(set_autovacuum, reset_autovacuum),
+    ]
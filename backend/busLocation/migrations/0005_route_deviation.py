@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:41
+
+import busLocation.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus', '0002_initial'),
+        ('busLocation', '0004_location_index_layout'),
+        ('route', '0001_initial'),
+        ('shift', '0003_shift_unique_active_shift_per_bus_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDeviation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='Начало схода')),
+                ('ended_at', models.DateTimeField(blank=True, null=True, verbose_name='Возврат на маршрут')),
+                ('latitude', busLocation.fields.MicrodegreeField(decimal_places=6, help_text='Первая координата вне коридора', max_digits=9, verbose_name='Широта')),
+                ('longitude', busLocation.fields.MicrodegreeField(decimal_places=6, help_text='Первая координата вне коридора', max_digits=9, verbose_name='Долгота')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deviations', to='bus.bus', verbose_name='Автобус')),
+                ('route', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deviations', to='route.route', verbose_name='Маршрут')),
+                ('shift', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deviations', to='shift.shift', verbose_name='Смена')),
+            ],
+            options={
+                'verbose_name': 'Сход с маршрута',
+                'verbose_name_plural': 'Сходы с маршрута',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['updated_at'], name='busLocation_updated_00f574_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus', '0002_initial'),
+        ('busLocation', '0005_route_deviation'),
+        ('route', '0002_route_stops'),
+        ('shift', '0003_shift_unique_active_shift_per_bus_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StopEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stop_index', models.PositiveSmallIntegerField(help_text='Номер остановки в Route.stops', verbose_name='Остановка')),
+                ('trip', models.PositiveSmallIntegerField(default=1, help_text='Номер рейса в смене, рейс заканчивается на конечной', verbose_name='Рейс')),
+                ('arrived_at', models.DateTimeField(verbose_name='Прибытие')),
+                ('departed_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправление')),
+                ('dwell_seconds', models.PositiveIntegerField(blank=True, null=True, verbose_name='Стоянка, сек')),
+                ('bus', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stop_events', to='bus.bus', verbose_name='Автобус')),
+                ('route', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stop_events', to='route.route', verbose_name='Маршрут')),
+                ('shift', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stop_events', to='shift.shift', verbose_name='Смена')),
+            ],
+            options={
+                'verbose_name': 'Стоянка на остановке',
+                'verbose_name_plural': 'Стоянки на остановках',
+                'ordering': ['-arrived_at'],
+                'indexes': [models.Index(fields=['route', 'stop_index', 'arrived_at'], name='stopevent_route_stop_time')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+"""
+Номер координаты в смене (seq) для идемпотентной отправки.
+
+Колонка без значения по умолчанию добавляется мгновенно. Уникальность
+(shift, seq) - частичный уникальный индекс (только строки с seq);
+он строится CONCURRENTLY, без блокировки записи, поэтому в БД индекс
+создаётся вручную, а в состояние миграций попадает UniqueConstraint.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("busLocation", "0006_stop_event"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buslocation",
+            name="seq",
+            field=models.IntegerField(
+                blank=True,
+                help_text="Порядковый номер координаты от приложения водителя (для повторов)",
+                null=True,
+                verbose_name="Номер в смене",
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "busloc_shift_seq_unique" '
+                    'ON "busLocation_buslocation" ("shift_id", "seq") WHERE "seq" IS NOT NULL',
+                    'DROP INDEX CONCURRENTLY IF EXISTS "busloc_shift_seq_unique"',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="buslocation",
+                    constraint=models.UniqueConstraint(
+                        condition=models.Q(("seq__isnull", False)),
+                        fields=("shift", "seq"),
+                        name="busloc_shift_seq_unique",
+                    ),
+                ),
+            ],
+        ),
+    ]
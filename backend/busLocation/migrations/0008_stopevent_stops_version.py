@@ -0,0 +1,51 @@
+"""
+Версия списка остановок в StopEvent.
+
+stop_index - номер в Route.stops той версии, что была при прибытии;
+статистика стоянок считается только по текущей версии, поэтому она
+входит в индекс перед stop_index. Индексы перестраиваются CONCURRENTLY,
+без блокировки записи прибытий.
+"""
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("busLocation", "0007_location_seq"),
+        ("route", "0004_route_stops_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stopevent",
+            name="stops_version",
+            field=models.PositiveIntegerField(
+                default=1,
+                help_text="Route.stops_version на момент прибытия",
+                verbose_name="Версия остановок",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="stopevent",
+            name="stop_index",
+            field=models.PositiveSmallIntegerField(
+                help_text="Номер остановки в Route.stops версии stops_version",
+                verbose_name="Остановка",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="stopevent",
+            index=models.Index(
+                fields=["route", "stops_version", "stop_index", "arrived_at"],
+                name="stopevent_route_version_stop",
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name="stopevent",
+            name="stopevent_route_stop_time",
+        ),
+    ]
@@ -1,5 +1,97 @@
-from django.db import models
+from django.contrib.postgres.indexes import BrinIndex
+from django.db import connections, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.expressions import RawSQL
 from django.core.exceptions import ValidationError
+from .fields import MicrodegreeField, SmallFloatField
+
+
+class BusLocationQuerySet(models.QuerySet):
+    """
+    Пакетная выборка последних координат смен и автобусов.
+    """
+    
+    def latest_for_shifts(self, shifts):
+        """
+        Последняя координата каждой смены - одним запросом.
+        shifts - queryset смен или список их ID.
+        
+        Возвращает queryset, поэтому к нему можно добавить
+        select_related, values_list и т.п.
+        
+        На PostgreSQL ID берутся через LATERAL (... ORDER BY timestamp DESC,
+        id DESC LIMIT 1): одно обращение к покрывающему индексу
+        (shift, -timestamp, -id) на смену, без чтения таблицы.
+        На остальных БД - коррелированный подзапрос внутри IN.
+        """
+        shift_model = self.model._meta.get_field('shift').related_model
+        if not isinstance(shifts, models.QuerySet):
+            shifts = shift_model.objects.filter(pk__in=list(shifts))
+        shifts = shifts.order_by().values('pk')
+        
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            quote = connection.ops.quote_name
+            opts = self.model._meta
+            shifts_sql, params = shifts.query.sql_with_params()
+            latest_ids = RawSQL(
+                f'SELECT latest.id FROM ({shifts_sql}) AS shifts(id) '
+                f'CROSS JOIN LATERAL ('
+                f'SELECT {quote(opts.pk.column)} AS id FROM {quote(opts.db_table)} '
+                f'WHERE {quote(opts.get_field("shift").column)} = shifts.id '
+                f'ORDER BY {quote(opts.get_field("timestamp").column)} DESC, '
+                f'{quote(opts.pk.column)} DESC LIMIT 1'
+                f') AS latest',
+                params
+            )
+        else:
+            latest_ids = shifts.annotate(
+                latest_id=Subquery(
+                    self.model.objects.filter(
+                        shift=OuterRef('pk')
+                    ).order_by('-timestamp', '-id').values('id')[:1]
+                )
+            ).values('latest_id')
+        
+        return self.filter(id__in=latest_ids)
+    
+    def latest_for_buses(self, buses):
+        """
+        Текущая координата автобусов (по активной смене) - одним запросом.
+        buses - queryset автобусов или список их ID.
+        Поле bus координаты совпадает с shift.bus, поэтому результат
+        можно сопоставлять с автобусами по bus_id.
+        """
+        shift_model = self.model._meta.get_field('shift').related_model
+        if isinstance(buses, models.QuerySet):
+            buses = buses.order_by().values('pk')
+        return self.latest_for_shifts(
+            shift_model.objects.filter(status='active', bus__in=buses)
+        )
+    
+    def attach_to_shifts(self, shifts):
+        """
+        Заполняет last_location у списка смен одним запросом.
+        """
+        locations = {
+            location.shift_id: location
+            for location in self.latest_for_shifts([shift.id for shift in shifts])
+        }
+        for shift in shifts:
+            shift._cached_last_location = locations.get(shift.id)
+        return shifts
+    
+    def attach_to_buses(self, buses):
+        """
+        Заполняет current_location у списка автобусов одним запросом.
+        """
+        locations = {
+            location.bus_id: location
+            for location in self.latest_for_buses([bus.id for bus in buses])
+        }
+        for bus in buses:
+            bus._cached_current_location = locations.get(bus.id)
+        return buses
 
 
 class BusLocation(models.Model):
@@ -23,35 +115,36 @@ class BusLocation(models.Model):
         help_text='Координаты привязаны к смене'
     )
     
-    latitude = models.DecimalField(
+    # Хранятся целыми микроградусами, наружу - Decimal с 6 знаками
+    latitude = MicrodegreeField(
         max_digits=9,
         decimal_places=6,
         verbose_name='Широта',
         help_text='Диапазон: -90 до +90'
     )
     
-    longitude = models.DecimalField(
+    longitude = MicrodegreeField(
         max_digits=9,
         decimal_places=6,
         verbose_name='Долгота',
         help_text='Диапазон: -180 до +180'
     )
     
-    speed = models.FloatField(
+    speed = SmallFloatField(
         null=True,
         blank=True,
         verbose_name='Скорость',
         help_text='Скорость в км/ч'
     )
     
-    heading = models.FloatField(
+    heading = SmallFloatField(
         null=True,
         blank=True,
         verbose_name='Направление',
         help_text='Градусы: 0-360 (0=север, 90=восток)'
     )
     
-    accuracy = models.FloatField(
+    accuracy = SmallFloatField(
         null=True,
         blank=True,
         verbose_name='Точность GPS',
@@ -63,18 +156,51 @@ class BusLocation(models.Model):
         verbose_name='Время получения координаты'
     )
     
+    # IntegerField, а не PositiveIntegerField: CHECK-ограничение при
+    # добавлении колонки проверялось бы по всей таблице; знак проверяет сериализатор
+    seq = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Номер в смене',
+        help_text='Порядковый номер координаты от приложения водителя (для повторов)'
+    )
+    
+    objects = BusLocationQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Местоположение автобуса'
         verbose_name_plural = 'Местоположения автобусов'
         ordering = ['-timestamp']
+        # Таблица только дополняется, поэтому по времени выбран BRIN вместо
+        # B-tree. Покрывающий индекс рассчитан на index-only scan запросов по
+        # смене (latest, track, shift_locations); выигрыш на PostgreSQL не
+        # замерен, проверять через benchmark_endpoints --suite indexes.
+        # Поле bus дублирует shift.bus, но остаётся: история автобуса за
+        # период не знает смен, а без него нужен JOIN и сортировка по сменам.
         indexes = [
             models.Index(fields=['bus', '-timestamp']),
-            models.Index(fields=['shift', '-timestamp']),
-            models.Index(fields=['-timestamp']),
+            models.Index(
+                fields=['shift', '-timestamp', '-id'],
+                include=['latitude', 'longitude', 'speed', 'heading', 'accuracy'],
+                name='busloc_shift_ts_covering'
+            ),
+            BrinIndex(fields=['timestamp'], pages_per_range=32, name='busloc_timestamp_brin'),
+        ]
+        constraints = [
+            # Повтор отправки с тем же номером не создаёт вторую запись
+            models.UniqueConstraint(
+                fields=['shift', 'seq'],
+                condition=models.Q(seq__isnull=False),
+                name='busloc_shift_seq_unique'
+            ),
         ]
     
     def __str__(self):
-        return f"{self.bus.registration_number} - {self.timestamp.strftime('%H:%M:%S')}"
+        # Гос. номер из справочного кеша, чтобы __str__ не загружал автобус
+        from gorod_osh import refcache
+
+        bus_number = refcache.bus_number(self.bus_id) or f'#{self.bus_id}'
+        return f"{bus_number} - {self.timestamp.strftime('%H:%M:%S')}"
     
     def clean(self):
         """
@@ -94,4 +220,179 @@ class BusLocation(models.Model):
     
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class RouteDeviation(models.Model):
+    """
+    Сход автобуса с маршрута (см. busLocation/deviation.py).
+    Открытый сход - без ended_at.
+    """
+    
+    shift = models.ForeignKey(
+        'shift.Shift',
+        on_delete=models.CASCADE,
+        related_name='deviations',
+        verbose_name='Смена'
+    )
+    
+    bus = models.ForeignKey(
+        'bus.Bus',
+        on_delete=models.CASCADE,
+        related_name='deviations',
+        verbose_name='Автобус'
+    )
+    
+    route = models.ForeignKey(
+        'route.Route',
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='deviations',
+        verbose_name='Маршрут'
+    )
+    
+    started_at = models.DateTimeField(
+        verbose_name='Начало схода'
+    )
+    
+    ended_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Возврат на маршрут'
+    )
+    
+    latitude = MicrodegreeField(
+        verbose_name='Широта',
+        help_text='Первая координата вне коридора'
+    )
+    
+    longitude = MicrodegreeField(
+        verbose_name='Долгота',
+        help_text='Первая координата вне коридора'
+    )
+    
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+    
+    class Meta:
+        verbose_name = 'Сход с маршрута'
+        verbose_name_plural = 'Сходы с маршрута'
+        ordering = ['-started_at']
+        indexes = [
+            # Лента изменений для диспетчера (updated_at > since)
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"Смена #{self.shift_id}: сход в {self.started_at:%H:%M:%S}"
+    
+    @property
+    def is_active(self):
+        return self.ended_at is None
+
+
+class StopEventQuerySet(models.QuerySet):
+    """
+    Аналитика по остановкам без обращения к BusLocation.
+    """
+    
+    def dwell_stats(self, route_id, stops_version, since):
+        """
+        По каждой остановке маршрута (в списке версии stops_version):
+        число прибытий, средняя и максимальная стоянка (секунды),
+        последнее прибытие. Читает диапазон индекса
+        (route, stops_version, stop_index, arrived_at).
+        """
+        return self.filter(
+            route_id=route_id,
+            stops_version=stops_version,
+            arrived_at__gte=since
+        ).values('stop_index').annotate(
+            visits=models.Count('id'),
+            avg_dwell_seconds=models.Avg('dwell_seconds'),
+            max_dwell_seconds=models.Max('dwell_seconds'),
+            last_arrival=models.Max('arrived_at')
+        ).order_by('stop_index')
+
+
+class StopEvent(models.Model):
+    """
+    Стоянка автобуса на остановке (см. busLocation/stops.py):
+    прибытие, отправление и время стоянки. Пока автобус стоит,
+    departed_at и dwell_seconds пустые.
+    """
+    
+    route = models.ForeignKey(
+        'route.Route',
+        on_delete=models.CASCADE,
+        related_name='stop_events',
+        # Покрывается составным индексом (route, stops_version, stop_index, arrived_at)
+        db_index=False,
+        verbose_name='Маршрут'
+    )
+    
+    stop_index = models.PositiveSmallIntegerField(
+        verbose_name='Остановка',
+        help_text='Номер остановки в Route.stops версии stops_version'
+    )
+    
+    stops_version = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Версия остановок',
+        help_text='Route.stops_version на момент прибытия'
+    )
+    
+    shift = models.ForeignKey(
+        'shift.Shift',
+        on_delete=models.CASCADE,
+        related_name='stop_events',
+        verbose_name='Смена'
+    )
+    
+    bus = models.ForeignKey(
+        'bus.Bus',
+        on_delete=models.CASCADE,
+        related_name='stop_events',
+        db_index=False,
+        verbose_name='Автобус'
+    )
+    
+    trip = models.PositiveSmallIntegerField(
+        default=1,
+        verbose_name='Рейс',
+        help_text='Номер рейса в смене, рейс заканчивается на конечной'
+    )
+    
+    arrived_at = models.DateTimeField(
+        verbose_name='Прибытие'
+    )
+    
+    departed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Отправление'
+    )
+    
+    dwell_seconds = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Стоянка, сек'
+    )
+    
+    objects = StopEventQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = 'Стоянка на остановке'
+        verbose_name_plural = 'Стоянки на остановках'
+        ordering = ['-arrived_at']
+        indexes = [
+            models.Index(
+                fields=['route', 'stops_version', 'stop_index', 'arrived_at'],
+                name='stopevent_route_version_stop'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Смена #{self.shift_id}: остановка {self.stop_index} в {self.arrived_at:%H:%M:%S}"
@@ -0,0 +1,102 @@
+import base64
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class LocationCursorPagination(BasePagination):
+    """
+    Keyset-пагинация истории координат по (timestamp, id), от новых к старым.
+
+    Курсор хранит позицию последней отданной записи, следующая страница
+    начинается строго после неё. Благодаря индексам (bus, -timestamp) и
+    busloc_shift_ts_covering (shift, -timestamp, -id) каждая страница —
+    это сканирование диапазона индекса, без OFFSET, поэтому глубокие
+    страницы стоят столько же, сколько первая.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+
+    def __init__(self, default_limit=100, max_limit=1000):
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+        self.next_cursor = None
+        self.request = None
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get(self.limit_query_param, self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Должно быть целым числом'})
+        return max(1, min(limit, self.max_limit))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_limit(request)
+
+        queryset = queryset.order_by('-timestamp', '-id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, location_id = self.decode_cursor(cursor)
+            # timestamp__lte даёт границу диапазона индекса,
+            # exclude отсекает уже отданные записи с тем же временем
+            queryset = queryset.filter(
+                timestamp__lte=timestamp
+            ).exclude(
+                timestamp=timestamp, id__gte=location_id
+            )
+
+        rows = list(queryset[:limit + 1])
+        page = rows[:limit]
+
+        if len(rows) > limit:
+            self.next_cursor = self.encode_cursor(*self.get_position(page[-1]))
+        else:
+            self.next_cursor = None
+
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def add_headers(self, response):
+        """
+        Передаёт курсор следующей страницы в заголовках, не меняя тело ответа.
+        """
+        if self.next_cursor:
+            response['X-Next-Cursor'] = self.next_cursor
+            response['Link'] = f'<{self.get_next_link()}>; rel="next"'
+        return response
+
+    @staticmethod
+    def get_position(row):
+        """
+        (timestamp, id) записи: объекта модели или словаря из .values().
+        """
+        if isinstance(row, dict):
+            return row['timestamp'], row['id']
+        return row.timestamp, row.id
+
+    @staticmethod
+    def encode_cursor(timestamp, location_id):
+        raw = f'{timestamp.isoformat()}|{location_id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            timestamp, location_id = raw.rsplit('|', 1)
+            parsed = parse_datetime(timestamp)
+            if parsed is None:
+                raise ValueError
+            return parsed, int(location_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({'cursor': 'Неверный курсор'})
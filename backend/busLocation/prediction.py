@@ -0,0 +1,116 @@
+"""
+Прогноз текущего положения автобусов (/api/locations/latest/?predict=1).
+
+От последней координаты автобус «доезжает» до текущего момента со своей
+скоростью. Если координата лежит на пути маршрута автобуса (сетка
+route/planner.py) и направление движения совпадает с направлением пути,
+сдвиг идёт вдоль пути, иначе - по прямой по heading. Уверенность падает
+с возрастом координаты, при движении не по пути и при плохой точности GPS.
+"""
+import math
+
+from django.conf import settings
+from django.utils import timezone
+
+from gorod_osh import refcache
+from route import planner
+from route.geo import METERS_PER_DEGREE
+
+
+DEFAULTS = {
+    # Дальше этого координата не экстраполируется, уверенность - 0
+    'MAX_SECONDS': 60,
+    # Насколько далеко от пути координата ещё считается на маршруте
+    'SNAP_RADIUS_M': 40,
+    # Расхождение heading и направления пути, при котором автобус едет не по пути
+    'MAX_HEADING_DIFF': 60,
+    # Точность GPS, начиная с которой уверенность снижается
+    'GOOD_ACCURACY_M': 20,
+}
+
+# Базовая уверенность: вдоль пути и по прямой
+ON_PATH_CONFIDENCE = 0.9
+DEAD_RECKONING_CONFIDENCE = 0.5
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LOCATION_PREDICTION', {})}
+
+
+def heading_diff(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+def snap(network, route_id, item, config):
+    """
+    Место координаты на пути маршрута (расстояние от начала) или None,
+    если она далеко от пути или автобус едет против него.
+    """
+    candidates = network.access(
+        item['latitude'], item['longitude'], config['SNAP_RADIUS_M']
+    ).get(route_id)
+    if not candidates:
+        return None
+
+    if item['heading'] is not None:
+        candidates = [
+            candidate for candidate in candidates
+            if heading_diff(network.bearing_at(route_id, candidate[0]), item['heading']) <= config['MAX_HEADING_DIFF']
+        ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda candidate: candidate[1])[0]
+
+
+def predict_item(network, item, now, config):
+    """
+    Прогноз для одного элемента latest:
+    {latitude, longitude, heading, confidence, seconds_ahead}.
+    """
+    seconds = max(0.0, (now - item['timestamp']).total_seconds())
+    ahead = min(seconds, float(config['MAX_SECONDS']))
+    distance = (item['speed'] or 0) / 3.6 * ahead
+
+    bus = refcache.buses.get(item['bus_id'])
+    route_id = bus[2] if bus else None
+    along = snap(network, route_id, item, config) if route_id in network.routes else None
+
+    if along is not None:
+        length = network.routes[route_id][2][-1]
+        along = min(along + distance, length)
+        latitude, longitude = network.point_at(route_id, along)
+        heading = network.bearing_at(route_id, along)
+        confidence = ON_PATH_CONFIDENCE
+    else:
+        latitude, longitude, heading = item['latitude'], item['longitude'], item['heading']
+        if heading is not None and distance:
+            radians = math.radians(heading)
+            longitude += distance * math.sin(radians) / (
+                METERS_PER_DEGREE * math.cos(math.radians(latitude))
+            )
+            latitude += distance * math.cos(radians) / METERS_PER_DEGREE
+        confidence = DEAD_RECKONING_CONFIDENCE
+
+    confidence *= max(0.0, 1 - seconds / config['MAX_SECONDS'])
+    if item['accuracy'] and item['accuracy'] > config['GOOD_ACCURACY_M']:
+        confidence *= config['GOOD_ACCURACY_M'] / item['accuracy']
+
+    return {
+        'latitude': round(latitude, 6),
+        'longitude': round(longitude, 6),
+        'heading': round(heading, 1) if heading is not None else None,
+        'confidence': round(confidence, 2),
+        'seconds_ahead': round(ahead, 1),
+    }
+
+
+def add_predictions(items, now=None):
+    """
+    Добавляет predicted к каждому элементу ответа latest.
+    """
+    config = get_config()
+    now = now or timezone.now()
+    network = planner.network.data()
+    for item in items:
+        item['predicted'] = predict_item(network, item, now, config)
+    return items
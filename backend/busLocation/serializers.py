@@ -1,7 +1,30 @@
+import logging
+
+from django.db import transaction
 from rest_framework import serializers
+from . import deviation, hub, ingest, stops
 from .models import BusLocation
 
 
+logger = logging.getLogger(__name__)
+
+
+def track_route(location, shift):
+    """
+    Сход с маршрута и остановки по сохранённой координате. Выполняется
+    после коммита: ошибка контроля маршрута не откатывает координату
+    и не мешает её приёму, как и ошибка шины (hub.publish_location).
+    """
+    try:
+        deviation.check(location, shift)
+    except Exception:
+        logger.exception('Route deviation check failed for shift %s', shift.id)
+    try:
+        stops.track(location, shift)
+    except Exception:
+        logger.exception('Stop tracking failed for shift %s', shift.id)
+
+
 class BusLocationSerializer(serializers.ModelSerializer):
     """
     Полный сериализатор местоположения автобуса.
@@ -27,11 +50,16 @@ class BusLocationCreateSerializer(serializers.ModelSerializer):
     """
     Сериализатор для создания записи местоположения.
     Используется водителями для отправки координат.
+    
+    seq - необязательный порядковый номер координаты в смене. Повтор
+    с уже принятым номером ничего не записывает (см. is_duplicate).
     """
+    seq = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    
     class Meta:
         model = BusLocation
         fields = [
-            'latitude', 'longitude', 'speed', 'heading', 'accuracy'
+            'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'seq'
         ]
     
     def validate_latitude(self, value):
@@ -66,6 +94,40 @@ class BusLocationCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Направление должно быть от 0 до 360")
         return value
     
+    def is_redundant(self):
+        """
+        Координата не несёт новой информации: автобус стоит в мёртвой
+        зоне последней сохранённой точки (см. busLocation/ingest.py).
+        """
+        shift = self.context.get('shift')
+        if not shift:
+            return False
+        
+        return ingest.is_redundant(
+            shift.id,
+            self.validated_data['latitude'],
+            self.validated_data['longitude'],
+            self.validated_data.get('accuracy')
+        )
+    
+    def is_duplicate(self):
+        """
+        Координата с этим seq уже сохранена. Номер больше подтверждённого
+        (обычный случай) проверяется по кешу без БД, меньший - точечным
+        запросом по индексу (shift, seq): это может быть и повтор, и
+        координата, потерянная при обрыве связи. Гонку одновременных
+        повторов закрывает сам уникальный индекс.
+        """
+        shift = self.context.get('shift')
+        seq = self.validated_data.get('seq')
+        if not shift or seq is None:
+            return False
+        
+        acked = ingest.acked_seq(shift.id)
+        if acked is None or seq > acked:
+            return False
+        return BusLocation.objects.filter(shift_id=shift.id, seq=seq).exists()
+    
     def create(self, validated_data):
         """
         Автоматически добавляем bus и shift из контекста.
@@ -76,7 +138,12 @@ class BusLocationCreateSerializer(serializers.ModelSerializer):
         
         validated_data['bus'] = shift.bus
         validated_data['shift'] = shift
-        return super().create(validated_data)
+        location = super().create(validated_data)
+        ingest.remember(location)
+        ingest.acknowledge(shift.id, location.seq)
+        transaction.on_commit(lambda: track_route(location, shift))
+        hub.publish_location(location, shift)
+        return location
 
 
 class BusLocationListSerializer(serializers.ModelSerializer):
@@ -0,0 +1,206 @@
+"""
+Вспомогательные функции для нагрузочных тестов и генерации данных:
+создание синтетического парка (маршруты, автобусы, водители, смены),
+движение автобуса по Route.path и сводная статистика замеров.
+"""
+import math
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from bus.models import Bus
+from route.geo import cumulative_distances, point_along
+from route.models import Route
+from shift.models import Shift
+from user.models import User
+
+
+# Центр города Ош
+CITY_CENTER = (40.5283, 72.7985)
+
+BUS_TYPES = [choice for choice, _ in Route.BUS_TYPE_CHOICES]
+
+
+def generate_path(rng, points=60, step_m=150, center=CITY_CENTER, spread_m=4000):
+    """
+    Генерирует правдоподобный путь маршрута: плавное случайное блуждание
+    с шагом step_m метров от случайной точки вокруг центра города.
+    """
+    lat0, lng0 = center
+    meters_per_deg_lat = 111320
+    meters_per_deg_lng = 111320 * math.cos(math.radians(lat0))
+
+    lat = lat0 + rng.uniform(-spread_m, spread_m) / meters_per_deg_lat
+    lng = lng0 + rng.uniform(-spread_m, spread_m) / meters_per_deg_lng
+    direction = rng.uniform(0, 2 * math.pi)
+
+    path = []
+    for _ in range(points):
+        path.append({'lat': round(lat, 6), 'lng': round(lng, 6)})
+        direction += rng.gauss(0, 0.3)
+        lat += step_m * math.cos(direction) / meters_per_deg_lat
+        lng += step_m * math.sin(direction) / meters_per_deg_lng
+    return path
+
+
+def fleet_filter(prefix):
+    """
+    Фильтры, по которым находятся объекты синтетического парка.
+    """
+    return {
+        'routes': Route.objects.filter(number__startswith=prefix),
+        'buses': Bus.objects.filter(registration_number__startswith=prefix),
+        'drivers': User.objects.filter(username__startswith=f'{prefix.lower()}_driver_'),
+    }
+
+
+def delete_fleet(prefix):
+    """
+    Удаляет синтетический парк с указанным префиксом.
+    Смены и координаты удаляются каскадно.
+    """
+    objects = fleet_filter(prefix)
+    with transaction.atomic():
+        objects['drivers'].delete()
+        objects['buses'].delete()
+        objects['routes'].delete()
+
+
+def delete_created(fleet):
+    """
+    Удаляет только объекты, созданные create_fleet, по их id,
+    не трогая другие объекты с тем же префиксом.
+    """
+    with transaction.atomic():
+        User.objects.filter(id__in=[driver.id for driver, _, _ in fleet]).delete()
+        Bus.objects.filter(id__in=[bus.id for _, bus, _ in fleet]).delete()
+        Route.objects.filter(id__in={route.id for _, _, route in fleet}).delete()
+
+
+def create_fleet(prefix, routes, buses_per_route, password, seed=0, path_points=60):
+    """
+    Создаёт маршруты, автобусы и водителей.
+    buses_per_route - число автобусов на каждом маршруте или список
+    чисел по маршрутам. Возвращает список кортежей (driver, bus, route).
+    """
+    if isinstance(buses_per_route, int):
+        buses_per_route = [buses_per_route] * routes
+    rng = random.Random(seed)
+    password_hash = make_password(password)
+
+    with transaction.atomic():
+        route_objects = []
+        for i in range(routes):
+            path = generate_path(rng, points=path_points)
+            route_objects.append(Route(
+                number=f'{prefix}{i + 1}',
+                name=f'Нагрузочный маршрут {i + 1}',
+                bus_type=BUS_TYPES[i % len(BUS_TYPES)],
+                start_point='Начало',
+                end_point='Конец',
+                start_coordinates=path[0],
+                end_coordinates=path[-1],
+                path=path,
+            ))
+        route_objects = Route.objects.bulk_create(route_objects)
+
+        drivers = []
+        buses = []
+        for route, count in zip(route_objects, buses_per_route):
+            for _ in range(count):
+                index = len(buses) + 1
+                drivers.append(User(
+                    username=f'{prefix.lower()}_driver_{index}',
+                    password=password_hash,
+                    first_name='Водитель',
+                    last_name=str(index),
+                    role='driver',
+                ))
+                buses.append(Bus(
+                    registration_number=f'{prefix}{index:06d}',
+                    bus_type=route.bus_type,
+                    capacity=30,
+                    route=route,
+                ))
+
+        drivers = User.objects.bulk_create(drivers)
+        for driver, bus in zip(drivers, buses):
+            bus.assigned_driver = driver
+        buses = Bus.objects.bulk_create(buses)
+
+    return [(driver, bus, bus.route) for driver, bus in zip(drivers, buses)]
+
+
+def start_shifts(fleet):
+    """
+    Начинает активную смену для каждого водителя парка.
+    """
+    return [
+        Shift.objects.create(driver=driver, bus=bus)
+        for driver, bus, _ in fleet
+    ]
+
+
+class PathWalker:
+    """
+    Двигает автобус по пути маршрута туда и обратно с заданной скоростью.
+    """
+
+    def __init__(self, path, speed_kmh, offset_m=0.0):
+        self.path = path
+        self.cumulative = cumulative_distances(path)
+        self.speed_ms = speed_kmh / 3.6
+        self.offset_m = offset_m
+
+    def position(self, elapsed_seconds):
+        """
+        Возвращает (lat, lng, heading) через elapsed_seconds после старта.
+        """
+        length = self.cumulative[-1]
+        travelled = (self.offset_m + self.speed_ms * elapsed_seconds) % (2 * length)
+
+        if travelled <= length:
+            return point_along(self.path, self.cumulative, travelled)
+
+        lat, lng, heading = point_along(self.path, self.cumulative, 2 * length - travelled)
+        return lat, lng, (heading + 180) % 360
+
+
+def percentile(sorted_values, fraction):
+    """
+    Перцентиль по отсортированному списку (линейная интерполяция).
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples, duration_seconds=None):
+    """
+    Сводная статистика по замерам.
+    samples - список словарей {'latency_ms': float, 'queries': int|None, 'ok': bool}.
+    """
+    latencies = sorted(s['latency_ms'] for s in samples)
+    queries = [s['queries'] for s in samples if s.get('queries') is not None]
+
+    summary = {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if not s['ok']),
+        'p50_ms': _round(percentile(latencies, 0.50)),
+        'p95_ms': _round(percentile(latencies, 0.95)),
+        'p99_ms': _round(percentile(latencies, 0.99)),
+        'max_ms': _round(latencies[-1] if latencies else None),
+        'avg_queries': _round(sum(queries) / len(queries) if queries else None),
+        'max_queries': max(queries) if queries else None,
+    }
+    if duration_seconds:
+        summary['throughput_rps'] = _round(len(samples) / duration_seconds)
+    return summary
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
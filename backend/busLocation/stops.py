@@ -0,0 +1,190 @@
+"""
+Прибытия на остановки и отправления с них.
+
+Остановки маршрута (Route.stops) один раз на процесс и версию маршрута
+проецируются на путь (расстояние от начала определяет конечные)
+и раскладываются в сетку route/geo.py PointGrid. Каждая принятая
+координата продвигает состояние смены:
+
+- вне остановки, координата ближе ARRIVAL_RADIUS_M к остановке -
+  прибытие, создаётся StopEvent;
+- на остановке, координата дальше DEPARTURE_RADIUS_M от неё (или уже
+  у другой остановки) - отправление, в StopEvent пишется departed_at
+  и время стоянки.
+
+Рейс заканчивается прибытием на конечную, если после прошлой конечной
+были промежуточные остановки. StopEvent хранит номер остановки в списке
+версии Route.stops_version; если список остановок изменили, пока автобус
+стоял, открытое прибытие закрывается следующей координатой. История координат не перечитывается:
+состояние смены хранится в общем кеше, без кеша восстанавливается по
+последнему StopEvent смены.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from route.geo import PointGrid, cumulative_distances, locate_on_path
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ARRIVAL_RADIUS_M': 30,
+    # Больше радиуса прибытия, чтобы дрожание GPS у остановки
+    # не давало ложных отправлений
+    'DEPARTURE_RADIUS_M': 50,
+    'MAX_ACCURACY_M': 50,
+}
+
+# Остановки, подготовленные этим процессом: {route_id: ((updated_at, радиус), StopIndex)}
+_indexes = {}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'STOP_EVENTS', {})}
+
+
+def state_key(shift_id):
+    return f'stops:state:{shift_id}'
+
+
+class StopIndex:
+    """
+    Остановки маршрута: сетка для поиска и номера конечных.
+    """
+
+    def __init__(self, route, radius_m):
+        self.grid = PointGrid(route.stops, radius_m)
+
+        cumulative = cumulative_distances(route.path)
+        positions = [
+            locate_on_path(route.path, cumulative, stop['lat'], stop['lng'])[0]
+            for stop in route.stops
+        ]
+        self.terminals = {
+            positions.index(min(positions)),
+            positions.index(max(positions)),
+        } if positions else set()
+
+
+def index_for(route):
+    """
+    Остановки маршрута; пересчитываются, если маршрут сохранили.
+    """
+    radius_m = max(get_config()['DEPARTURE_RADIUS_M'], get_config()['ARRIVAL_RADIUS_M'])
+    cached = _indexes.get(route.pk)
+    if cached and cached[0] == (route.updated_at, radius_m):
+        return cached[1]
+
+    index = StopIndex(route, radius_m)
+    _indexes[route.pk] = ((route.updated_at, radius_m), index)
+    return index
+
+
+def get_state(shift_id):
+    """
+    Состояние смены: открытое прибытие (id StopEvent, номер остановки,
+    версия списка остановок, время прибытия), текущий рейс и число промежуточных остановок
+    с последней конечной. Второе значение - True, если состояние
+    пришлось восстановить из БД.
+    """
+    try:
+        state = cache.get(state_key(shift_id))
+    except Exception:
+        logger.exception('Failed to read stop state for shift %s', shift_id)
+        state = None
+
+    if state is not None:
+        return state, False
+
+    from .models import StopEvent
+
+    last = StopEvent.objects.filter(shift_id=shift_id).order_by('-arrived_at', '-id').values(
+        'id', 'stop_index', 'stops_version', 'trip', 'arrived_at', 'departed_at'
+    ).first()
+    is_open = last is not None and last['departed_at'] is None
+    return {
+        'event_id': last['id'] if is_open else None,
+        'stop': last['stop_index'] if is_open else None,
+        'version': last['stops_version'] if is_open else None,
+        'arrived_at': last['arrived_at'] if is_open else None,
+        'trip': last['trip'] if last else 1,
+        'visited': 0,
+    }, True
+
+
+def set_state(shift_id, state):
+    try:
+        # Смена без координат дольше суток неактуальна
+        cache.set(state_key(shift_id), state, 24 * 60 * 60)
+    except Exception:
+        logger.exception('Failed to store stop state for shift %s', shift_id)
+
+
+def track(location, shift):
+    """
+    Продвигает состояние смены по сохранённой координате.
+    Возвращает список событий: ('departed', остановка), ('arrived', остановка).
+    """
+    config = get_config()
+    route = shift.bus.route
+    if not config['ENABLED'] or route is None or not route.stops:
+        return []
+
+    if location.accuracy is not None and location.accuracy > config['MAX_ACCURACY_M']:
+        return []
+
+    from .models import StopEvent
+
+    index = index_for(route)
+    state, restored = get_state(shift.id)
+    events = []
+
+    nearest = index.grid.nearest(location.latitude, location.longitude, config['ARRIVAL_RADIUS_M'])
+
+    if state['stop'] is not None:
+        if state.get('version') != route.stops_version:
+            # Остановки маршрута изменились, пока автобус стоял
+            departed = True
+        else:
+            departed = nearest not in (None, state['stop']) or index.grid.distance_m(
+                state['stop'], location.latitude, location.longitude
+            ) > config['DEPARTURE_RADIUS_M']
+
+        if departed:
+            StopEvent.objects.filter(id=state['event_id']).update(
+                departed_at=location.timestamp,
+                dwell_seconds=max(0, int((location.timestamp - state['arrived_at']).total_seconds()))
+            )
+            events.append(('departed', state['stop']))
+            state['event_id'] = state['stop'] = state['version'] = state['arrived_at'] = None
+
+    if state['stop'] is None and nearest is not None:
+        event = StopEvent.objects.create(
+            route=route,
+            stop_index=nearest,
+            stops_version=route.stops_version,
+            shift=shift,
+            bus_id=shift.bus_id,
+            trip=state['trip'],
+            arrived_at=location.timestamp
+        )
+        state['event_id'] = event.id
+        state['stop'] = nearest
+        state['version'] = route.stops_version
+        state['arrived_at'] = location.timestamp
+        events.append(('arrived', nearest))
+
+        # Прибытие на конечную завершает рейс
+        if nearest in index.terminals:
+            if state['visited']:
+                state['trip'] += 1
+                state['visited'] = 0
+        else:
+            state['visited'] += 1
+
+    if events or restored:
+        set_state(shift.id, state)
+    return events
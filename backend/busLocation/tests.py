@@ -1,3 +1,422 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from bus.models import Bus
+from route.models import Route
+from shift.models import Shift
+from user.models import User
+from . import clusters, deviation, hub, ingest, stops
+from .models import BusLocation, RouteDeviation, StopEvent
+
+
+def create_route(**kwargs):
+    """
+    Маршрут по параллели 40.5 на восток от 72.80 до 72.82 (около 1.7 км),
+    остановки в начале, середине и конце.
+    """
+    fields = {
+        'number': '1',
+        'name': 'Тестовый',
+        'bus_type': 'bus',
+        'start_point': 'Начало',
+        'end_point': 'Конец',
+        'start_coordinates': {'lat': 40.5, 'lng': 72.80},
+        'end_coordinates': {'lat': 40.5, 'lng': 72.82},
+        'path': [{'lat': 40.5, 'lng': 72.80}, {'lat': 40.5, 'lng': 72.82}],
+        'stops': [
+            {'name': 'Начало', 'lat': 40.5, 'lng': 72.80},
+            {'name': 'Середина', 'lat': 40.5, 'lng': 72.81},
+            {'name': 'Конец', 'lat': 40.5, 'lng': 72.82},
+        ],
+    }
+    fields.update(kwargs)
+    return Route.objects.create(**fields)
+
+
+class LocationTestCase(APITestCase):
+    """
+    Водитель на активной смене на автобусе маршрута create_route.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.route = create_route()
+        self.driver = User.objects.create_user('driver', password='secret', role='driver')
+        self.bus = Bus.objects.create(registration_number='01KG001', bus_type='bus', route=self.route)
+        self.shift = Shift.objects.create(driver=self.driver, bus=self.bus)
+        self.started = timezone.now() - timedelta(hours=1)
+        self.client.force_authenticate(self.driver)
+
+    def fix(self, latitude, longitude, seconds=0, **kwargs):
+        """
+        Сохранённая координата смены через seconds секунд от начала теста.
+        """
+        location = BusLocation.objects.create(
+            shift=self.shift, bus=self.bus, latitude=latitude, longitude=longitude, **kwargs
+        )
+        location.timestamp = self.started + timedelta(seconds=seconds)
+        location.save(update_fields=['timestamp'])
+        return location
+
+    def post_fix(self, latitude, longitude, **kwargs):
+        return self.client.post(
+            '/api/locations/', {'latitude': latitude, 'longitude': longitude, **kwargs}, format='json'
+        )
+
+
+class IngestSequenceTests(LocationTestCase):
+
+    def test_accepted_fix_is_acknowledged(self):
+        response = self.post_fix(40.5, 72.80, seq=1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['acked_seq'], 1)
+
+    def test_repeated_seq_is_not_stored_twice(self):
+        self.post_fix(40.5, 72.80, seq=1)
+        response = self.post_fix(40.5, 72.80, seq=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(response.data['acked_seq'], 1)
+        self.assertEqual(BusLocation.objects.filter(shift=self.shift).count(), 1)
+
+    def test_late_fix_below_acked_seq_is_stored(self):
+        """
+        Номер меньше подтверждённого, но такой координаты нет -
+        она потерялась при обрыве связи и сохраняется.
+        """
+        self.post_fix(40.5, 72.80, seq=5)
+        response = self.post_fix(40.5, 72.81, seq=3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['acked_seq'], 5)
+        self.assertEqual(
+            sorted(BusLocation.objects.filter(shift=self.shift).values_list('seq', flat=True)), [3, 5]
+        )
+
+    def test_acked_seq_is_restored_from_database(self):
+        self.fix(40.5, 72.80, seq=7)
+        cache.clear()
+        self.assertEqual(ingest.acked_seq(self.shift.id), 7)
+
+    def test_missing_seq_is_cached(self):
+        self.assertIsNone(ingest.acked_seq(self.shift.id))
+        with self.assertNumQueries(0):
+            self.assertIsNone(ingest.acked_seq(self.shift.id))
+
+        ingest.acknowledge(self.shift.id, 4)
+        self.assertEqual(ingest.acked_seq(self.shift.id), 4)
+
+    def test_acknowledge_never_lowers_seq(self):
+        ingest.acknowledge(self.shift.id, 5)
+        ingest.acknowledge(self.shift.id, 3)
+        self.assertEqual(ingest.acked_seq(self.shift.id), 5)
+
+    def test_negative_seq_is_rejected(self):
+        response = self.post_fix(40.5, 72.80, seq=-1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('seq', response.data)
+
+
+class SmallFloatFieldTests(LocationTestCase):
+
+    def test_values_round_trip_without_float32_noise(self):
+        location = self.fix(40.5, 72.80, speed=45.3, heading=359.9, accuracy=0.1)
+        location.refresh_from_db()
+        self.assertEqual((location.speed, location.heading, location.accuracy), (45.3, 359.9, 0.1))
+        self.assertEqual(
+            BusLocation.objects.filter(id=location.id).values_list('speed', flat=True).get(), 45.3
+        )
+
+
+class DeadBandTests(LocationTestCase):
+
+    def test_standing_bus_fix_is_filtered(self):
+        self.post_fix(40.5, 72.80, seq=1)
+        # Около 5 метров от прошлой точки
+        response = self.post_fix(40.50004, 72.80, seq=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['filtered'])
+        self.assertEqual(response.data['acked_seq'], 2)
+        self.assertEqual(BusLocation.objects.filter(shift=self.shift).count(), 1)
+
+    def test_moving_bus_fix_is_stored(self):
+        self.post_fix(40.5, 72.80)
+        # Около 110 метров
+        response = self.post_fix(40.501, 72.80)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(BusLocation.objects.filter(shift=self.shift).count(), 2)
+
+    def test_poor_accuracy_widens_dead_band(self):
+        location = self.fix(40.5, 72.80)
+        ingest.remember(location)
+        now = location.timestamp + timedelta(seconds=1)
+        # Около 33 метров: дальше MIN_DISTANCE_M, но ближе погрешности 40 м
+        self.assertFalse(ingest.is_redundant(self.shift.id, 40.5003, 72.80, None, now=now))
+        self.assertTrue(ingest.is_redundant(self.shift.id, 40.5003, 72.80, 40, now=now))
+
+    def test_heartbeat_stores_standing_bus(self):
+        location = self.fix(40.5, 72.80)
+        ingest.remember(location)
+        heartbeat = ingest.get_config()['HEARTBEAT_SECONDS']
+        self.assertTrue(ingest.is_redundant(
+            self.shift.id, 40.5, 72.80, None, now=location.timestamp + timedelta(seconds=1)
+        ))
+        self.assertFalse(ingest.is_redundant(
+            self.shift.id, 40.5, 72.80, None, now=location.timestamp + timedelta(seconds=heartbeat)
+        ))
+
+
+class CursorPaginationTests(LocationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.locations = [self.fix(40.5, 72.80 + index * 0.001, seconds=index) for index in range(5)]
+        # Две координаты с одинаковым временем: порядок между ними - по id
+        BusLocation.objects.filter(id=self.locations[3].id).update(timestamp=self.locations[2].timestamp)
+
+    def test_shift_locations_pages_cover_all_rows_once(self):
+        ids = []
+        cursor = None
+        for _ in range(5):
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(f'/api/locations/shift/{self.shift.id}/', params)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(location['id'] for location in response.data['locations'])
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+            self.assertEqual(response['X-Next-Cursor'], cursor)
+
+        self.assertEqual(ids, list(
+            BusLocation.objects.filter(shift=self.shift).order_by('-timestamp', '-id').values_list('id', flat=True)
+        ))
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(f'/api/locations/shift/{self.shift.id}/', {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_track_continues_from_since_id(self):
+        response = self.client.get('/api/locations/track/', {'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['has_more'])
+        first = response.data['track']
+
+        response = self.client.get('/api/locations/track/', {'since_id': response.data['next_since_id']})
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(len(first) + len(response.data['track']), 5)
+
+        # Новых точек нет: курсор остаётся прежним
+        since_id = response.data['next_since_id']
+        response = self.client.get('/api/locations/track/', {'since_id': since_id})
+        self.assertEqual(response.data['track'], [])
+        self.assertEqual(response.data['next_since_id'], since_id)
+
+    def test_track_rejects_foreign_since_id(self):
+        response = self.client.get('/api/locations/track/', {'since_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/locations/track/', {'since_id': self.locations[-1].id + 1000})
+        self.assertEqual(response.status_code, 400)
+
+
+class RouteDeviationTests(LocationTestCase):
+
+    def test_deviation_is_confirmed_and_closed(self):
+        # Одна координата вне коридора - скачок GPS, не сход
+        self.assertIsNone(deviation.check(self.fix(40.5, 72.801, 0), self.shift))
+        self.assertIsNone(deviation.check(self.fix(40.505, 72.802, 5), self.shift))
+        self.assertIsNone(deviation.check(self.fix(40.5, 72.803, 10), self.shift))
+        self.assertFalse(RouteDeviation.objects.exists())
+
+        first_off = self.fix(40.505, 72.804, 15)
+        self.assertIsNone(deviation.check(first_off, self.shift))
+        self.assertEqual(deviation.check(self.fix(40.505, 72.805, 20), self.shift), 'started')
+
+        record = RouteDeviation.objects.get(shift=self.shift)
+        self.assertEqual(record.started_at, first_off.timestamp)
+        self.assertIsNone(record.ended_at)
+
+        first_back = self.fix(40.5, 72.806, 25)
+        self.assertIsNone(deviation.check(first_back, self.shift))
+        self.assertEqual(deviation.check(self.fix(40.5, 72.807, 30), self.shift), 'ended')
+        record.refresh_from_db()
+        self.assertEqual(record.ended_at, first_back.timestamp)
+
+    def test_open_deviation_is_restored_without_cache(self):
+        deviation.check(self.fix(40.505, 72.804, 0), self.shift)
+        deviation.check(self.fix(40.505, 72.805, 5), self.shift)
+        cache.clear()
+
+        deviation.check(self.fix(40.5, 72.806, 10), self.shift)
+        self.assertEqual(deviation.check(self.fix(40.5, 72.807, 15), self.shift), 'ended')
+        self.assertEqual(RouteDeviation.objects.filter(ended_at__isnull=True).count(), 0)
+
+    def test_inaccurate_fix_is_ignored(self):
+        self.assertIsNone(deviation.check(self.fix(40.505, 72.804, 0, accuracy=200), self.shift))
+        self.assertIsNone(deviation.check(self.fix(40.505, 72.805, 5, accuracy=200), self.shift))
+        self.assertFalse(RouteDeviation.objects.exists())
+
+    def test_feed_rejects_malformed_shift(self):
+        self.client.force_authenticate(User.objects.create_user('admin', password='secret', role='admin'))
+        self.assertEqual(self.client.get('/api/locations/deviations/', {'shift': self.shift.id}).status_code, 200)
+        self.assertEqual(self.client.get('/api/locations/deviations/', {'shift': 'abc'}).status_code, 400)
+
+
+class StopEventTests(LocationTestCase):
+
+    def test_arrival_and_departure(self):
+        self.assertEqual(stops.track(self.fix(40.5, 72.81, 0), self.shift), [('arrived', 1)])
+        # Дрожание GPS у остановки - не отправление
+        self.assertEqual(stops.track(self.fix(40.50005, 72.81, 20), self.shift), [])
+        self.assertEqual(stops.track(self.fix(40.5, 72.812, 45), self.shift), [('departed', 1)])
+
+        event = StopEvent.objects.get(shift=self.shift)
+        self.assertEqual(event.stop_index, 1)
+        self.assertEqual(event.dwell_seconds, 45)
+
+    def test_trip_ends_at_terminal(self):
+        stops.track(self.fix(40.5, 72.80, 0), self.shift)
+        stops.track(self.fix(40.5, 72.805, 60), self.shift)
+        stops.track(self.fix(40.5, 72.81, 120), self.shift)
+        stops.track(self.fix(40.5, 72.815, 180), self.shift)
+        stops.track(self.fix(40.5, 72.82, 240), self.shift)
+        stops.track(self.fix(40.5, 72.815, 300), self.shift)
+        stops.track(self.fix(40.5, 72.81, 360), self.shift)
+
+        self.assertEqual(
+            list(StopEvent.objects.filter(shift=self.shift).order_by('arrived_at').values_list(
+                'stop_index', 'trip'
+            )),
+            [(0, 1), (1, 1), (2, 1), (1, 2)]
+        )
+
+    def test_open_arrival_is_restored_without_cache(self):
+        stops.track(self.fix(40.5, 72.81, 0), self.shift)
+        cache.clear()
+        self.assertEqual(stops.track(self.fix(40.5, 72.812, 30), self.shift), [('departed', 1)])
+        self.assertEqual(StopEvent.objects.get(shift=self.shift).dwell_seconds, 30)
+
+    def test_edited_stops_get_new_version(self):
+        stops.track(self.fix(40.5, 72.81, 0), self.shift)
+
+        self.route.name = 'Переименованный'
+        self.route.save()
+        self.assertEqual(self.route.stops_version, 1)
+
+        self.route.stops = [{'name': 'Депо', 'lat': 40.5, 'lng': 72.795}, *self.route.stops]
+        self.route.save(update_fields=['stops', 'updated_at'])
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.stops_version, 2)
+
+        # Прибытие по старому списку закрывается, та же остановка - новый номер
+        self.assertEqual(stops.track(self.fix(40.5, 72.81, 20), self.shift), [('departed', 1), ('arrived', 2)])
+        self.assertEqual(
+            list(StopEvent.objects.order_by('arrived_at').values_list('stops_version', 'stop_index', 'dwell_seconds')),
+            [(1, 1, 20), (2, 2, None)]
+        )
+        self.assertEqual(
+            [row['stop_index'] for row in StopEvent.objects.dwell_stats(self.route.id, 2, self.started)],
+            [2]
+        )
+
+
+
+class AdminDateHierarchyTests(LocationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        admin_user = User.objects.create_superuser('root', password='secret')
+        self.client.force_login(admin_user)
+        self.url = '/admin/busLocation/buslocation/'
+
+    def test_entry_without_date_opens_today(self):
+        for url in (self.url, '/admin/busLocation/stopevent/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('__day=', response['Location'])
+
+    def test_year_view_and_popups_are_not_redirected(self):
+        year = timezone.localdate().year
+        self.assertEqual(self.client.get(self.url, {'timestamp__year': year}).status_code, 200)
+        self.assertEqual(self.client.get(self.url, {'_popup': 1, '_to_field': 'id'}).status_code, 200)
+
+    def test_all_dates_link_is_not_redirected(self):
+        response = self.client.get(self.url, HTTP_REFERER=f'http://testserver{self.url}?timestamp__year=2026')
+        self.assertEqual(response.status_code, 200)
+
+class ClusterFilterTests(LocationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        clusters._indexes.clear()
+
+    def test_invalid_filters_are_rejected(self):
+        for params in ({'route': 'abc'}, {'bus_type': 'rocket'}, {'route': 'abc', 'zoom': 10}):
+            self.assertEqual(self.client.get('/api/locations/latest/', params).status_code, 400)
+
+    def test_filters_are_normalised(self):
+        self.assertEqual(clusters.parse_filters('', ''), (None, None))
+        self.assertEqual(clusters.parse_filters('07', 'bus'), (7, 'bus'))
+
+    @override_settings(LOCATION_CLUSTERS={'MAX_INDEXES': 2})
+    def test_index_cache_is_bounded(self):
+        self.fix(40.5, 72.80)
+        for route in range(1, 5):
+            response = self.client.get('/api/locations/latest/', {'route': route, 'zoom': 10})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual([key[0] for key in clusters._indexes], [3, 4])
+
+
+class GpxImportTests(LocationTestCase):
+
+    def import_gpx(self, *args):
+        timestamp = (self.shift.start_time + timedelta(minutes=1)).isoformat()
+        with tempfile.NamedTemporaryFile('w', suffix='.gpx', delete=False) as f:
+            f.write(
+                '<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>'
+                f'<trkpt lat="40.5" lon="72.8"><time>{timestamp}</time><hdop>1.2</hdop></trkpt>'
+                '</trkseg></trk></gpx>'
+            )
+        self.addCleanup(os.remove, f.name)
+        call_command('import_locations', f.name, '--bus', self.bus.registration_number, *args, stdout=StringIO())
+        return BusLocation.objects.get(shift=self.shift).accuracy
+
+    def test_hdop_is_converted_to_meters(self):
+        self.assertEqual(self.import_gpx(), 6.0)
+
+    def test_hdop_is_skipped_without_uere(self):
+        self.assertIsNone(self.import_gpx('--uere', '0'))
+
+
+class PositionHubTests(LocationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        hub._hub = None
+        self.addCleanup(setattr, hub, '_hub', None)
+
+    def test_nothing_is_published_by_default(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.post_fix(40.5, 72.80).status_code, 201)
+        self.assertFalse([query for query in queries.captured_queries if 'pg_notify' in query['sql']])
+
+    @override_settings(POSITION_HUB={'PUBLISH': True, 'BACKEND': 'local'})
+    def test_fix_is_published_after_commit(self):
+        with hub.get_hub().subscribe(route=self.route.id) as subscription:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.post_fix(40.5, 72.80)
+            self.assertIsNone(subscription.get(timeout=0))
+
+            for callback in callbacks:
+                callback()
+            self.assertEqual(subscription.get(timeout=0)['shift'], self.shift.id)
@@ -2,24 +2,37 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.settings import api_settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.utils import timezone
-from django.db.models import OuterRef, Subquery
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
-from .models import BusLocation
+from . import clusters, fastpath, ingest, prediction
+from .models import BusLocation, RouteDeviation
+from .pagination import LocationCursorPagination
 from shift.models import Shift
 from .serializers import (
     BusLocationSerializer, BusLocationCreateSerializer,
     BusLocationListSerializer, BusLocationTrackSerializer
 )
-from user.permissions import IsDriver
-import json
+from user.permissions import IsAdmin, IsDriver
+from gorod_osh import metrics, parsers, refcache, renderers
+import logging
+
+
+logger = logging.getLogger(__name__)
 
 
 class BusLocationViewSet(viewsets.ModelViewSet):
     """
     ViewSet для управления местоположениями автобусов.
+    Кроме JSON принимает и отдаёт MessagePack (Content-Type/Accept:
+    application/msgpack) - для приложений на дорогом мобильном интернете.
     """
     queryset = BusLocation.objects.select_related('bus', 'shift', 'shift__driver').all()
+    parser_classes = parsers.with_msgpack(api_settings.DEFAULT_PARSER_CLASSES)
+    renderer_classes = renderers.with_msgpack(api_settings.DEFAULT_RENDERER_CLASSES)
     
     def get_serializer_class(self):
         """
@@ -36,39 +49,34 @@ class BusLocationViewSet(viewsets.ModelViewSet):
     def get_permissions(self):
         """
         Публичный доступ для чтения (пассажиры смотрят где автобусы).
-        Только водители могут отправлять координаты.
+        Только водители могут отправлять координаты, ленту сходов
+        с маршрута видят только админы.
         """
         if self.action in ['list', 'retrieve', 'latest', 'bus_history', 'shift_locations']:
             return [AllowAny()]
         elif self.action in ['create', 'send']:
             return [IsDriver()]
+        elif self.action == 'deviations':
+            return [IsAdmin()]
         return [IsAuthenticated()]
     
     def create(self, request, *args, **kwargs):
         """
         Создать запись координаты.
         Доступно только водителям с активной сменой.
+        Точки стоящего автобуса отбрасываются фильтром (ответ 200, filtered=true).
+        Повтор с уже сохранённым seq ничего не записывает (ответ 200,
+        duplicate=true); при переданном seq в ответе есть acked_seq.
         """
-        # ОТЛАДКА: Логируем все данные
-        print(f"\n{'='*60}")
-        print(f"📍 ПОЛУЧЕН ЗАПРОС НА ОТПРАВКУ КООРДИНАТ")
-        print(f"{'='*60}")
-        print(f"👤 Пользователь: {request.user}")
-        print(f"📦 Данные запроса: {json.dumps(request.data, indent=2, ensure_ascii=False)}")
-        
         # Получаем активную смену
         try:
             shift = Shift.objects.select_related('bus', 'bus__route').get(
                 driver=request.user, 
                 status='active'
             )
-            print(f"✅ Активная смена найдена:")
-            print(f"   - ID смены: {shift.id}")
-            print(f"   - Автобус: {shift.bus.registration_number}")
-            print(f"   - Маршрут: {shift.bus.route.number if shift.bus.route else 'НЕТ МАРШРУТА'}")
         except Shift.DoesNotExist:
-            print(f"❌ У пользователя {request.user} НЕТ активной смены")
-            print(f"{'='*60}\n")
+            logger.debug('Location rejected: user %s has no active shift', request.user)
+            metrics.inc('ingest_rejected_total', {'field': 'shift'})
             return Response(
                 {'detail': 'У вас нет активной смены'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -79,24 +87,58 @@ class BusLocationViewSet(viewsets.ModelViewSet):
             context={'request': request, 'shift': shift}
         )
         
-        # ОТЛАДКА: Проверяем валидацию
         if not serializer.is_valid():
-            print(f"❌ ОШИБКИ ВАЛИДАЦИИ:")
-            for field, errors in serializer.errors.items():
-                print(f"   - {field}: {errors}")
-            print(f"{'='*60}\n")
+            logger.debug('Location rejected for shift %s: %s', shift.id, serializer.errors)
+            for field in serializer.errors:
+                metrics.inc('ingest_rejected_total', {'field': field})
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Сохраняем
-        location = serializer.save()
-        print(f"✅ Координаты сохранены:")
-        print(f"   - Широта: {location.latitude}")
-        print(f"   - Долгота: {location.longitude}")
-        print(f"   - Скорость: {location.speed}")
-        print(f"   - ID записи: {location.id}")
-        print(f"{'='*60}\n")
+        seq = serializer.validated_data.get('seq')
+        
+        # Повтор уже сохранённой координаты: ничего не пишем
+        if serializer.is_duplicate():
+            return self.duplicate_response(shift, seq)
+        
+        # Стоящий автобус: координату не сохраняем, водителю отвечаем 200
+        if serializer.is_redundant():
+            metrics.inc('ingest_filtered_total')
+            ingest.acknowledge(shift.id, seq)
+            return Response(
+                self.with_acked_seq({**serializer.data, 'filtered': True}, shift, seq),
+                status=status.HTTP_200_OK
+            )
+        
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            # Одновременный повтор успел раньше (уникальный индекс (shift, seq))
+            if seq is None or not BusLocation.objects.filter(shift_id=shift.id, seq=seq).exists():
+                raise
+            return self.duplicate_response(shift, seq)
+        
+        metrics.inc('ingest_fixes_total')
         
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(
+            self.with_acked_seq(serializer.data, shift, seq),
+            status=status.HTTP_201_CREATED
+        )
+    
+    def with_acked_seq(self, data, shift, seq):
+        """
+        Добавляет в ответ acked_seq, если приложение прислало seq.
+        """
+        if seq is None:
+            return data
+        return {**data, 'acked_seq': ingest.acked_seq(shift.id)}
+    
+    def duplicate_response(self, shift, seq):
+        metrics.inc('ingest_duplicate_total')
+        return Response({
+            'seq': seq,
+            'duplicate': True,
+            'acked_seq': ingest.acked_seq(shift.id)
+        }, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['post'])
     def send(self, request):
@@ -108,7 +150,8 @@ class BusLocationViewSet(viewsets.ModelViewSet):
             "longitude": 74.569812,
             "speed": 45.5,
             "heading": 180,
-            "accuracy": 10
+            "accuracy": 10,
+            "seq": 128
         }
         """
         return self.create(request)
@@ -117,78 +160,57 @@ class BusLocationViewSet(viewsets.ModelViewSet):
     def latest(self, request):
         """
         Получить последние координаты всех активных автобусов.
-        Оптимизирован: один запрос вместо N+1.
+        Оптимизирован: один запрос на все автобусы.
         GET /api/locations/latest/
         
         Query params:
         - route: ID маршрута (опционально)
         - bus_type: тип транспорта (опционально)
+        - zoom: масштаб карты 0-22 (опционально); с ним ответ -
+          {zoom, clusters, buses}: на мелком масштабе близкие автобусы
+          объединяются в кластеры (busLocation/clusters.py)
+        - predict: 1 - добавить каждому автобусу predicted, прогноз
+          положения на текущий момент с уверенностью (busLocation/prediction.py)
         """
-        # Подзапрос для получения последней координаты каждой смены
-        latest_location_subquery = BusLocation.objects.filter(
-            shift=OuterRef('pk')
-        ).order_by('-timestamp').values('id')[:1]
-        
-        # Получаем активные смены с аннотацией ID последней координаты
-        active_shifts = Shift.objects.filter(
-            status='active'
-        ).select_related(
-            'bus',
-            'bus__route'
-        ).annotate(
-            latest_location_id=Subquery(latest_location_subquery)
-        )
+        zoom = request.query_params.get('zoom')
+        if zoom is not None:
+            try:
+                zoom = clusters.parse_zoom(zoom)
+            except ValueError:
+                return Response(
+                    {'detail': 'zoom должен быть целым числом от 0 до 22'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        try:
+            route_id, bus_type = clusters.parse_filters(
+                request.query_params.get('route'), request.query_params.get('bus_type')
+            )
+        except ValueError:
+            return Response(
+                {'detail': 'route должен быть ID маршрута, bus_type - типом транспорта'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        active_shifts = Shift.objects.filter(status='active')
         
         # Фильтр по маршруту
-        route_id = request.query_params.get('route')
-        if route_id:
+        if route_id is not None:
             active_shifts = active_shifts.filter(bus__route_id=route_id)
         
         # Фильтр по типу транспорта
-        bus_type = request.query_params.get('bus_type')
-        if bus_type:
+        if bus_type is not None:
             active_shifts = active_shifts.filter(bus__bus_type=bus_type)
         
-        # Получаем ID всех последних координат
-        location_ids = [
-            shift.latest_location_id 
-            for shift in active_shifts 
-            if shift.latest_location_id
-        ]
-        
-        # ОТЛАДКА
-        print(f"\n📊 ЗАПРОС ПОСЛЕДНИХ КООРДИНАТ:")
-        print(f"   - Активных смен: {active_shifts.count()}")
-        print(f"   - Координат для отправки: {len(location_ids)}")
-        
-        # Получаем все координаты одним запросом
-        locations_dict = {
-            loc.shift_id: loc 
-            for loc in BusLocation.objects.filter(
-                id__in=location_ids
-            ).select_related('shift__bus', 'shift__bus__route')
-        }
+        # Один запрос: последняя координата каждой смены, данные автобуса -
+        # из справочного кеша
+        locations = fastpath.latest_locations(active_shifts)
         
-        # Формируем ответ
-        locations = []
-        for shift in active_shifts:
-            location = locations_dict.get(shift.id)
-            if location:
-                locations.append({
-                    'bus_id': shift.bus.id,
-                    'bus_number': shift.bus.registration_number,
-                    'bus_type': shift.bus.bus_type,
-                    'route_number': shift.bus.route.number if shift.bus.route else None,
-                    'latitude': float(location.latitude),
-                    'longitude': float(location.longitude),
-                    'speed': location.speed,
-                    'heading': location.heading,
-                    'accuracy': location.accuracy,
-                    'timestamp': location.timestamp
-                })
-                print(f"   ✅ Автобус {shift.bus.registration_number} - маршрут {shift.bus.route.number if shift.bus.route else 'НЕТ'}")
-        
-        print(f"   📤 Отправлено координат: {len(locations)}\n")
+        if request.query_params.get('predict') == '1':
+            prediction.add_predictions(locations)
+        
+        if zoom is not None:
+            return Response(clusters.cluster_locations(locations, zoom, (route_id, bus_type)))
         
         return Response(locations)
     
@@ -200,20 +222,21 @@ class BusLocationViewSet(viewsets.ModelViewSet):
         
         Query params:
         - hours: количество часов назад (по умолчанию 1)
-        - limit: максимум записей (по умолчанию 100, максимум 1000)
+        - limit: максимум записей на страницу (по умолчанию 100, максимум 1000)
+        - cursor: курсор следующей страницы из заголовка X-Next-Cursor
         """
         hours = int(request.query_params.get('hours', 1))
-        limit = min(int(request.query_params.get('limit', 100)), 1000)
-        
         start_time = timezone.now() - timedelta(hours=hours)
         
         locations = BusLocation.objects.filter(
             bus_id=bus_id,
             timestamp__gte=start_time
-        ).order_by('-timestamp')[:limit]
+        ).values(*fastpath.LIST_FIELDS)
         
-        serializer = self.get_serializer(locations, many=True)
-        return Response(serializer.data)
+        paginator = LocationCursorPagination(default_limit=100, max_limit=1000)
+        page = paginator.paginate_queryset(locations, request, view=self)
+        
+        return paginator.add_headers(Response(fastpath.location_list(page)))
     
     @action(detail=False, methods=['get'], url_path='shift/(?P<shift_id>[^/.]+)')
     def shift_locations(self, request, shift_id=None):
@@ -222,35 +245,36 @@ class BusLocationViewSet(viewsets.ModelViewSet):
         GET /api/locations/shift/{shift_id}/
         
         Query params:
-        - limit: максимум записей (по умолчанию 500, максимум 2000)
+        - limit: максимум записей на страницу (по умолчанию 500, максимум 2000)
+        - cursor: курсор следующей страницы (next_cursor из ответа)
         """
-        limit = min(int(request.query_params.get('limit', 500)), 2000)
-        
         # Проверяем существование смены
         try:
-            shift = Shift.objects.get(id=shift_id)
+            shift = Shift.objects.select_related('bus', 'driver').get(id=shift_id)
         except Shift.DoesNotExist:
             return Response(
                 {'detail': 'Смена не найдена'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        locations = BusLocation.objects.filter(
-            shift_id=shift_id
-        ).order_by('-timestamp')[:limit]
-        
-        serializer = self.get_serializer(locations, many=True)
+        paginator = LocationCursorPagination(default_limit=500, max_limit=2000)
+        page = paginator.paginate_queryset(
+            BusLocation.objects.filter(shift_id=shift_id).values(*fastpath.LIST_FIELDS),
+            request,
+            view=self
+        )
         
-        return Response({
+        return paginator.add_headers(Response({
             'shift_id': shift.id,
             'bus_number': shift.bus.registration_number,
             'driver_name': f"{shift.driver.first_name} {shift.driver.last_name}".strip() or shift.driver.username,
             'start_time': shift.start_time,
             'end_time': shift.end_time,
             'status': shift.status,
-            'total_locations': locations.count(),
-            'locations': serializer.data
-        })
+            'total_locations': len(page),
+            'next_cursor': paginator.next_cursor,
+            'locations': fastpath.location_list(page)
+        }))
     
     @action(detail=False, methods=['get'])
     def track(self, request):
@@ -260,6 +284,12 @@ class BusLocationViewSet(viewsets.ModelViewSet):
         
         Query params:
         - limit: максимум записей (по умолчанию 200, максимум 1000)
+        - since_id: только точки после этой (next_since_id из прошлого
+          ответа) - приложение дозагружает трек, а не получает его заново
+        - since: только точки новее этого времени (если since_id нет)
+        
+        has_more=true - после последней точки есть ещё, следующий запрос
+        с since_id=next_since_id продолжит трек.
         """
         # Получаем активную смену водителя
         try:
@@ -275,12 +305,43 @@ class BusLocationViewSet(viewsets.ModelViewSet):
         
         limit = min(int(request.query_params.get('limit', 200)), 1000)
         
-        # Координаты по возрастанию времени для построения трека
-        locations = BusLocation.objects.filter(
-            shift=shift
-        ).order_by('timestamp')[:limit]
+        points = BusLocation.objects.filter(shift=shift)
         
-        serializer = self.get_serializer(locations, many=True)
+        since_id = request.query_params.get('since_id')
+        since = request.query_params.get('since')
+        if since_id:
+            if not since_id.isdigit():
+                return Response(
+                    {'detail': 'Некорректный since_id'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            since_id = int(since_id)
+            # Keyset по (timestamp, id) - тот же порядок, что у трека,
+            # и диапазон покрывающего индекса смены
+            since = points.filter(id=since_id).values_list('timestamp', flat=True).first()
+            if since is None:
+                return Response(
+                    {'detail': 'Точка since_id не из текущей смены'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            points = points.filter(
+                Q(timestamp__gt=since) | Q(timestamp=since, id__gt=since_id)
+            )
+        elif since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response(
+                    {'detail': 'Некорректный формат since'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            points = points.filter(timestamp__gt=since)
+        
+        # Координаты по возрастанию времени для построения трека
+        track, last_id, has_more = fastpath.track_page(
+            points.order_by('timestamp', 'id'), limit
+        )
         
         return Response({
             'shift_id': shift.id,
@@ -288,21 +349,101 @@ class BusLocationViewSet(viewsets.ModelViewSet):
             'route_number': shift.bus.route.number if shift.bus.route else None,
             'start_time': shift.start_time,
             'duration_hours': shift.duration_hours,
-            'total_points': locations.count(),
-            'track': serializer.data
+            'total_points': len(track),
+            'next_since_id': last_id if last_id is not None else (since_id or None),
+            'has_more': has_more,
+            'track': track
         })
-    
+
+    @action(detail=False, methods=['get'])
+    def deviations(self, request):
+        """
+        Лента сходов с маршрута для диспетчера (только админы).
+        GET /api/locations/deviations/
+
+        Query params:
+        - since: вернуть сходы, начатые или закрытые после этого времени
+          (по умолчанию - за последние сутки); для опроса передавать
+          next_since из предыдущего ответа. Время отдаётся с точностью
+          до секунды, поэтому события последней секунды могут повториться
+          (различаются по id и event)
+        - active: 1 - только незакрытые сходы
+        - shift: ID смены (опционально)
+        """
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response(
+                    {'detail': 'Некорректный формат since'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        else:
+            since = timezone.now() - timedelta(days=1)
+
+        deviations = RouteDeviation.objects.filter(updated_at__gt=since)
+
+        if request.query_params.get('active') == '1':
+            deviations = deviations.filter(ended_at__isnull=True)
+
+        shift_id = request.query_params.get('shift')
+        if shift_id:
+            try:
+                shift_id = int(shift_id)
+            except ValueError:
+                return Response(
+                    {'detail': 'shift должен быть ID смены'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            deviations = deviations.filter(shift_id=shift_id)
+
+        rows = list(deviations.order_by('updated_at', 'id').values(
+            'id', 'shift_id', 'bus_id', 'route_id', 'started_at', 'ended_at',
+            'latitude', 'longitude', 'updated_at'
+        )[:500])
+
+        return Response({
+            'next_since': fastpath.format_datetime(rows[-1]['updated_at'] if rows else since),
+            'deviations': [
+                {
+                    'id': row['id'],
+                    'event': 'ended' if row['ended_at'] else 'started',
+                    'shift_id': row['shift_id'],
+                    'bus_id': row['bus_id'],
+                    'bus_number': refcache.bus_number(row['bus_id']),
+                    'route_number': refcache.route_number(row['route_id']),
+                    'latitude': float(row['latitude']),
+                    'longitude': float(row['longitude']),
+                    'started_at': fastpath.format_datetime(row['started_at']),
+                    'ended_at': fastpath.format_datetime(row['ended_at']),
+                }
+                for row in rows
+            ]
+        })
+
     def list(self, request, *args, **kwargs):
         """
         Список координат с пагинацией.
         Обычно не используется, но доступен для отладки.
+        Последние 100 записей по времени, как и раньше.
         """
         queryset = self.filter_queryset(self.get_queryset())
         
-        # Ограничиваем последними 100 записями по умолчанию
-        queryset = queryset.order_by('-timestamp')[:100]
+        # Сначала окно за сутки, неделю, месяц: окно по времени читается
+        # через BRIN-индекс, без сортировки всей таблицы. Вся таблица
+        # сортируется, только если за месяц не набралось 100 записей.
+        now = timezone.now()
+        for days in (1, 7, 30, None):
+            window = queryset
+            if days is not None:
+                window = window.filter(timestamp__gte=now - timedelta(days=days))
+            locations = list(window.order_by('-timestamp')[:100])
+            if len(locations) == 100:
+                break
         
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(locations, many=True)
         return Response(serializer.data)
     
     def update(self, request, *args, **kwargs):
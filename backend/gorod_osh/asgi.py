@@ -3,14 +3,33 @@ ASGI config for gorod_osh project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Публичные endpoints чтения (координаты, автобусы на линии, маршруты)
+обслуживаются асинхронными view из gorod_osh/urls_asgi.py, поэтому медленные
+мобильные клиенты не занимают потоки. Остальные запросы идут в обычные view.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gorod_osh.settings")
 
-application = get_asgi_application()
+ASGI_URLCONF = "gorod_osh.urls_asgi"
+
+
+class GorodOshASGIHandler(ASGIHandler):
+    """
+    ASGI-обработчик, использующий URL-конфигурацию с асинхронными view.
+    """
+
+    async def get_response_async(self, request):
+        request.urlconf = ASGI_URLCONF
+        return await super().get_response_async(request)
+
+
+django.setup(set_prefix=False)
+application = GorodOshASGIHandler()
@@ -0,0 +1,114 @@
+"""
+Общие функции асинхронных публичных endpoints (см. gorod_osh/asgi.py).
+Ответы кодируются так же, как JSONRenderer DRF, и кешируются уже
+закодированными, чтобы повторные запросы не трогали ни БД, ни сериализацию.
+Ответы со справочными данными удаляются из кеша сигналами приложений
+после коммита (invalidate).
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from . import metrics
+from .renderers import MessagePackRenderer, msgpack
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'LIVE_TTL': 2,
+    'ROUTES_TTL': 60,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ASYNC_READ_CACHE', {})}
+
+
+def encode(data):
+    """
+    JSON тем же рендерером, что у DRF: первым JSON-рендерером
+    из REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].
+    """
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        if issubclass(renderer_class, JSONRenderer):
+            return renderer_class().render(data)
+    return JSONRenderer().render(data)
+
+
+def json_response(content, status=200):
+    return HttpResponse(content, status=status, content_type='application/json')
+
+
+def accepts_msgpack(request):
+    """
+    Клиент просит MessagePack (Accept: application/msgpack) и msgpack установлен.
+    """
+    return msgpack is not None and MessagePackRenderer.media_type in request.headers.get('Accept', '')
+
+
+async def cached_json(cache_key, ttl, build, request=None):
+    """
+    Возвращает закодированный JSON из кеша или строит его через
+    корутину build() и сохраняет на ttl секунд.
+    Если передан request и клиент принимает MessagePack, ответ
+    кодируется в MessagePack и кешируется под отдельным ключом.
+    """
+    binary = request is not None and accepts_msgpack(request)
+    if binary:
+        cache_key = f'{cache_key}:msgpack'
+
+    content = await cache.aget(cache_key)
+    metrics.record_cache('async_read', content is not None)
+
+    if content is None:
+        data = await build()
+        content = MessagePackRenderer().render(data) if binary else encode(data)
+        await cache.aset(cache_key, content, ttl)
+
+    if binary:
+        response = HttpResponse(content, content_type=MessagePackRenderer.media_type)
+    else:
+        response = json_response(content)
+    if request is not None:
+        patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def invalidate(*cache_keys):
+    """
+    Удаляет закешированные ответы cache_keys в обоих форматах.
+    """
+    try:
+        cache.delete_many([key for cache_key in cache_keys for key in (cache_key, f'{cache_key}:msgpack')])
+    except Exception:
+        logger.exception('Failed to invalidate async read cache')
+
+
+def query_key(prefix, request, *names):
+    """
+    Ключ кеша из префикса и значений выбранных query params.
+    """
+    values = [request.GET.get(name, '') for name in names]
+    return ':'.join([prefix, *values])
+
+
+def read_only(async_view, sync_view):
+    """
+    GET/HEAD обслуживает async_view, остальные методы (создание и т.п.)
+    передаются обычному view в потоке.
+    """
+    sync_view_async = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await async_view(request, *args, **kwargs)
+        return await sync_view_async(request, *args, **kwargs)
+
+    return view
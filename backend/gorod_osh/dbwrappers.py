@@ -0,0 +1,44 @@
+"""
+execute_wrapper на соединениях всех потоков (metrics, profiling).
+
+connection.execute_wrapper() действует только на соединение текущего
+потока, а в ASGI запросы к БД выполняются в потоках sync_to_async со
+своими соединениями. Поэтому обёртки ставятся на соединения потока,
+в котором Django рассылает request_started (в ASGI - тот же поток, где
+работает ORM запроса), и на каждое новое соединение, и остаются на
+них; данные запроса они берут из ContextVar, который sync_to_async
+переносит в поток вместе с контекстом.
+"""
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+_wrappers = []
+
+
+def install(wrapper):
+    """
+    Ставит wrapper на соединения всех потоков, начиная со следующего запроса.
+    """
+    if wrapper not in _wrappers:
+        _wrappers.append(wrapper)
+    request_started.connect(_on_request_started, dispatch_uid='gorod_osh.dbwrappers')
+    connection_created.connect(_on_connection_created, dispatch_uid='gorod_osh.dbwrappers')
+
+
+def _on_request_started(sender, **kwargs):
+    # Соединения потока могли открыться до install()
+    for connection in connections.all(initialized_only=True):
+        _add(connection)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _add(connection)
+
+
+def _add(connection):
+    for wrapper in _wrappers:
+        if wrapper not in connection.execute_wrappers:
+            # В начало: connection.execute_wrapper() снимает последнюю обёртку
+            connection.execute_wrappers.insert(0, wrapper)
@@ -0,0 +1,406 @@
+"""
+Метрики в формате Prometheus (GET /metrics).
+
+Каждый процесс накапливает счётчики и гистограммы в памяти и периодически
+сохраняет свой снимок в общий кеш (settings.CACHES). Endpoint /metrics
+суммирует снимки всех живых процессов, поэтому неважно, какой worker
+обработал запрос Prometheus. Снимки процессов, которые перестали
+обновляться, истекают по TTL.
+
+Без TOKEN метрики отдаются только при DEBUG и адресам из ALLOWED_IPS
+(Prometheus рядом с процессами); через прокси нужен TOKEN, открыть
+метрики всем можно только явно (PUBLIC).
+"""
+import hmac
+import logging
+import os
+import socket
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseForbidden
+
+from . import dbwrappers
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 5,
+    'WORKER_TTL': 300,
+    'TOKEN': None,
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+    'PUBLIC': False,
+}
+
+PREFIX = 'gorod_osh_'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DESCRIPTIONS = {
+    'http_requests_total': ('counter', 'Количество HTTP-запросов'),
+    'http_request_duration_seconds': ('histogram', 'Время обработки HTTP-запроса'),
+    'http_db_queries_total': ('counter', 'Количество SQL-запросов'),
+    'ingest_fixes_total': ('counter', 'Принятые GPS-координаты'),
+    'ingest_rejected_total': ('counter', 'Отклонённые GPS-координаты по полям'),
+    'ingest_filtered_total': ('counter', 'Отброшенные фильтром координаты стоящих автобусов'),
+    'ingest_duplicate_total': ('counter', 'Повторно отправленные координаты (тот же seq)'),
+    'cache_requests_total': ('counter', 'Обращения к кешам'),
+    'route_deviations_total': ('counter', 'Сходы с маршрута и возвраты на него'),
+    'hub_published_total': ('counter', 'Координаты, опубликованные в шину'),
+    'hub_dropped_total': ('counter', 'Координаты, выброшенные из очереди медленного подписчика'),
+}
+
+# Снимки процессов лежат в слотах metrics:worker:1..N, N - в WORKER_SLOTS_KEY.
+# Слот занимается атомарным cache.add (свободный после TTL) или incr
+# счётчика, поэтому процессы не перезаписывают общий список друг друга
+WORKER_SLOTS_KEY = 'metrics:worker_slots'
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+# Счётчик SQL текущего запроса (QueryCounter) для count_queries
+_query_counter = ContextVar('metrics_query_counter', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class Registry:
+    """
+    Счётчики и гистограммы текущего процесса.
+    Ключ метрики: (имя, кортеж пар (метка, значение)).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+        # Слот этого процесса в общем кеше (см. WORKER_SLOTS_KEY)
+        self.slot = None
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0
+                }
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {
+                    key: {**h, 'counts': list(h['counts'])}
+                    for key, h in self.histograms.items()
+                },
+            }
+
+    def flush(self, force=False):
+        """
+        Сохраняет снимок процесса в общий кеш не чаще FLUSH_INTERVAL.
+        Ошибки кеша не должны ломать обработку запросов.
+        """
+        config = get_config()
+        now = time.time()
+        if not force and now - self.last_flush < config['FLUSH_INTERVAL']:
+            return
+        self.last_flush = now
+
+        try:
+            if self.slot is None:
+                self.slot = _claim_slot(config['WORKER_TTL'])
+            else:
+                current = cache.get(_slot_key(self.slot))
+                if current is not None and current['worker'] != WORKER_ID:
+                    # Слот истёк, пока процесс простаивал, и его занял другой
+                    self.slot = _claim_slot(config['WORKER_TTL'])
+            cache.set(
+                _slot_key(self.slot),
+                {'worker': WORKER_ID, **self.snapshot()},
+                config['WORKER_TTL']
+            )
+        except Exception:
+            logger.exception('Failed to flush metrics snapshot')
+
+
+def _slot_key(slot):
+    return f'metrics:worker:{slot}'
+
+
+def _claim_slot(ttl):
+    """
+    Номер слота для снимка этого процесса: первый свободный
+    из существующих или новый.
+    """
+    count = cache.get(WORKER_SLOTS_KEY) or 0
+    taken = cache.get_many([_slot_key(slot) for slot in range(1, count + 1)])
+    for slot in range(1, count + 1):
+        if _slot_key(slot) not in taken and cache.add(_slot_key(slot), {'worker': WORKER_ID}, ttl):
+            return slot
+
+    cache.add(WORKER_SLOTS_KEY, 0, None)
+    slot = cache.incr(WORKER_SLOTS_KEY)
+    cache.set(_slot_key(slot), {'worker': WORKER_ID}, ttl)
+    return slot
+
+
+registry = Registry()
+
+
+def inc(name, labels=None, value=1):
+    registry.inc(name, labels, value)
+
+
+def observe(name, value, labels=None):
+    registry.observe(name, value, labels)
+
+
+def record_cache(cache_name, hit):
+    """
+    Учитывает попадание или промах кеша cache_name.
+    """
+    registry.inc('cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'})
+
+
+class MetricsMiddleware:
+    """
+    Считает запросы, время обработки и SQL-запросы по каждому действию.
+    Работает и в WSGI, и в ASGI без переключения потоков; SQL из потоков
+    sync_to_async учитываются через gorod_osh/dbwrappers.py.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        dbwrappers.install(count_queries)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path == '/metrics':
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        token = _query_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        self.record(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    async def __acall__(self, request):
+        if request.path == '/metrics':
+            return await self.get_response(request)
+
+        counter = QueryCounter()
+        token = _query_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        self.record(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    def record(self, request, response, duration, queries):
+        # profiling тянет rest_framework.views, а metrics импортируют и классы
+        # из REST_FRAMEWORK (аутентификация), поэтому импорт здесь
+        from .profiling import get_view_name
+
+        endpoint = get_view_name(request, response) or 'unmatched'
+        registry.inc('http_requests_total', {
+            'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)
+        })
+        registry.observe('http_request_duration_seconds', duration, {'endpoint': endpoint})
+        registry.inc('http_db_queries_total', {'endpoint': endpoint}, queries)
+        registry.flush()
+
+
+class QueryCounter:
+    """
+    Количество SQL-запросов одного HTTP-запроса.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    execute_wrapper на всех соединениях: считает SQL в QueryCounter
+    текущего запроса, если он есть.
+    """
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.count += 1
+    return execute(sql, params, many, context)
+
+
+def metrics_view(request):
+    """
+    Метрики всех процессов в текстовом формате Prometheus.
+    GET /metrics
+    """
+    if not _allowed(request, get_config()):
+        return HttpResponseForbidden()
+
+    registry.flush(force=True)
+    snapshots = _collect_snapshots()
+    counters, histograms = _merge(snapshots)
+
+    lines = _render(counters, histograms)
+    lines.extend(_render_gauges(counters, len(snapshots)))
+
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+def _allowed(request, config):
+    """
+    С TOKEN - только с Authorization: Bearer <TOKEN>, без него - при
+    DEBUG, PUBLIC или с адресов ALLOWED_IPS.
+    """
+    token = config['TOKEN']
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if config['PUBLIC'] or settings.DEBUG:
+        return True
+    return request.META.get('REMOTE_ADDR') in config['ALLOWED_IPS']
+
+
+def _collect_snapshots():
+    try:
+        count = cache.get(WORKER_SLOTS_KEY) or 0
+        keys = [_slot_key(slot) for slot in range(1, count + 1)]
+        # Только что занятый слот ещё без снимка
+        snapshots = [
+            snapshot for snapshot in cache.get_many(keys).values()
+            if 'counters' in snapshot
+        ]
+    except Exception:
+        logger.exception('Failed to read metrics snapshots')
+        snapshots = []
+
+    return snapshots or [registry.snapshot()]
+
+
+def _merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for key, value in snapshot['counters'].items():
+            counters[key] = counters.get(key, 0) + value
+        for key, h in snapshot['histograms'].items():
+            merged = histograms.setdefault(key, {
+                'buckets': h['buckets'], 'counts': [0] * len(h['buckets']), 'sum': 0.0, 'count': 0
+            })
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], h['counts'])]
+            merged['sum'] += h['sum']
+            merged['count'] += h['count']
+    return counters, histograms
+
+
+def _render(counters, histograms):
+    lines = []
+
+    for name, (metric_type, description) in DESCRIPTIONS.items():
+        if metric_type == 'counter':
+            series = sorted((k, v) for k, v in counters.items() if k[0] == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {PREFIX}{name} {description}')
+            lines.append(f'# TYPE {PREFIX}{name} counter')
+            for (_, labels), value in series:
+                lines.append(f'{PREFIX}{name}{_format_labels(labels)} {value}')
+        else:
+            series = sorted((k, h) for k, h in histograms.items() if k[0] == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {PREFIX}{name} {description}')
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for (_, labels), h in series:
+                for bound, count in zip(h['buckets'], h['counts']):
+                    lines.append(
+                        f'{PREFIX}{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {count}'
+                    )
+                lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {h["count"]}')
+                lines.append(f'{PREFIX}{name}_sum{_format_labels(labels)} {h["sum"]}')
+                lines.append(f'{PREFIX}{name}_count{_format_labels(labels)} {h["count"]}')
+
+    return lines
+
+
+def _render_gauges(counters, workers):
+    """
+    Значения, которые вычисляются в момент запроса метрик.
+    """
+    from shift.models import Shift
+
+    lines = [
+        f'# HELP {PREFIX}active_shifts Количество активных смен',
+        f'# TYPE {PREFIX}active_shifts gauge',
+        f'{PREFIX}active_shifts {Shift.get_active_shifts_count()}',
+        f'# HELP {PREFIX}metrics_workers Процессы, приславшие метрики',
+        f'# TYPE {PREFIX}metrics_workers gauge',
+        f'{PREFIX}metrics_workers {workers}',
+    ]
+
+    caches = {}
+    for (name, labels), value in counters.items():
+        if name == 'cache_requests_total':
+            labels = dict(labels)
+            stats = caches.setdefault(labels['cache'], {'hit': 0, 'miss': 0})
+            stats[labels['result']] += value
+
+    if caches:
+        lines.append(f'# HELP {PREFIX}cache_hit_ratio Доля попаданий в кеш')
+        lines.append(f'# TYPE {PREFIX}cache_hit_ratio gauge')
+        for cache_name, stats in sorted(caches.items()):
+            total = stats['hit'] + stats['miss']
+            ratio = stats['hit'] / total if total else 0
+            lines.append(f'{PREFIX}cache_hit_ratio{_format_labels((("cache", cache_name),))} {ratio:.4f}')
+
+    return lines
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
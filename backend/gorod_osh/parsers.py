@@ -0,0 +1,33 @@
+"""
+MessagePack-парсер для приёма координат от приложения водителя
+(Content-Type: application/msgpack). Подключается через with_msgpack().
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class MessagePackParser(BaseParser):
+    """
+    Разбирает тело запроса в те же dict/list, что и JSONParser.
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc or type(exc).__name__}')
+
+
+def with_msgpack(parser_classes):
+    """
+    Список парсеров с MessagePack. Без установленного msgpack не меняется.
+    """
+    if msgpack is None:
+        return list(parser_classes)
+    return [*parser_classes, MessagePackParser]
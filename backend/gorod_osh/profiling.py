@@ -0,0 +1,253 @@
+"""
+Профилирование запросов (включается через настройку PROFILING).
+
+Для каждого запроса собирается: действие view, количество и суммарное
+время SQL, самые медленные и повторяющиеся запросы (признак N+1), время
+сериализаторов и общее время. Записи хранятся в ограниченном кольцевом
+буфере в памяти процесса и доступны администраторам по /api/profiling/.
+Часть записей пишется в лог с заданной вероятностью.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from user.permissions import IsAdmin
+from . import dbwrappers
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'BUFFER_SIZE': 500,
+    'SLOWEST_QUERIES': 5,
+    'LOG_SAMPLE_RATE': 0.01,
+    'SLOW_REQUEST_MS': 1000,
+}
+
+_current = ContextVar('profiling_current', default=None)
+_buffer = deque(maxlen=DEFAULTS['BUFFER_SIZE'])
+_buffer_lock = threading.Lock()
+_serializers_patched = False
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PROFILING', {})}
+
+
+class RequestProfile:
+    """
+    Данные профилирования одного запроса.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+
+    def record_query(self, sql, seconds):
+        self.queries.append((sql, seconds))
+
+    def as_dict(self, request, response, total_seconds, slowest_count):
+        sql_seconds = sum(seconds for _, seconds in self.queries)
+        slowest = sorted(self.queries, key=lambda q: q[1], reverse=True)[:slowest_count]
+        repeated = Counter(sql for sql, _ in self.queries).most_common(3)
+
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': get_view_name(request, response),
+            'status': response.status_code,
+            'total_ms': round(total_seconds * 1000, 2),
+            'sql_count': len(self.queries),
+            'sql_ms': round(sql_seconds * 1000, 2),
+            'serializer_ms': round(self.serializer_seconds * 1000, 2),
+            'slowest_queries': [
+                {'sql': sql, 'ms': round(seconds * 1000, 2)} for sql, seconds in slowest
+            ],
+            'repeated_queries': [
+                {'sql': sql, 'count': count} for sql, count in repeated if count > 1
+            ],
+        }
+
+
+class ProfilingMiddleware:
+    """
+    Middleware профилирования. Если PROFILING['ENABLED'] выключен,
+    Django исключает его из цепочки (MiddlewareNotUsed).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+
+        global _buffer
+        if _buffer.maxlen != config['BUFFER_SIZE']:
+            _buffer = deque(maxlen=config['BUFFER_SIZE'])
+
+        _patch_serializers()
+        dbwrappers.install(_query_wrapper)
+        self.get_response = get_response
+        self.config = config
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        self.record(profile, request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        self.record(profile, request, response, time.perf_counter() - started)
+        return response
+
+    def record(self, profile, request, response, total_seconds):
+        entry = profile.as_dict(request, response, total_seconds, self.config['SLOWEST_QUERIES'])
+        with _buffer_lock:
+            _buffer.append(entry)
+
+        if entry['total_ms'] >= self.config['SLOW_REQUEST_MS']:
+            logger.warning('Slow request: %s', entry)
+        elif random.random() < self.config['LOG_SAMPLE_RATE']:
+            logger.info('Request profile: %s', entry)
+
+
+class ProfilingView(APIView):
+    """
+    Последние записи профилирования (только для администраторов).
+    GET /api/profiling/
+
+    Query params:
+    - limit: количество записей (по умолчанию 100)
+    - view: фильтр по имени действия, например BusLocationViewSet.latest
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        limit = int(request.query_params.get('limit', 100))
+        view_name = request.query_params.get('view')
+
+        with _buffer_lock:
+            entries = list(_buffer)
+
+        if view_name:
+            entries = [e for e in entries if e['view'] == view_name]
+
+        return Response({
+            'enabled': get_config()['ENABLED'],
+            'summary': _summarize(entries),
+            'entries': entries[-limit:][::-1],
+        })
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    profile = _current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if profile is not None:
+            profile.record_query(sql, time.perf_counter() - started)
+
+
+def get_view_name(request, response):
+    """
+    Имя обработчика запроса в виде ViewSet.action (или имя URL для обычных view).
+    """
+    renderer_context = getattr(response, 'renderer_context', None) or {}
+    view = renderer_context.get('view')
+    if view is not None:
+        action = getattr(view, 'action', None) or request.method.lower()
+        return f'{view.__class__.__name__}.{action}'
+
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else None
+
+
+def _summarize(entries):
+    """
+    Средние показатели по каждому действию.
+    """
+    grouped = {}
+    for entry in entries:
+        grouped.setdefault(entry['view'], []).append(entry)
+
+    return {
+        str(view): {
+            'requests': len(items),
+            'avg_total_ms': round(sum(e['total_ms'] for e in items) / len(items), 2),
+            'avg_sql_count': round(sum(e['sql_count'] for e in items) / len(items), 2),
+            'avg_sql_ms': round(sum(e['sql_ms'] for e in items) / len(items), 2),
+            'avg_serializer_ms': round(sum(e['serializer_ms'] for e in items) / len(items), 2),
+        }
+        for view, items in grouped.items()
+    }
+
+
+def _timed_data(data_property):
+    """
+    Оборачивает свойство .data сериализатора замером времени.
+    Вложенные вызовы не учитываются повторно.
+    """
+    fget = data_property.fget
+
+    def data(self):
+        profile = _current.get()
+        if profile is None or profile.serializer_depth:
+            return fget(self)
+
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return fget(self)
+        finally:
+            profile.serializer_seconds += time.perf_counter() - started
+            profile.serializer_depth -= 1
+
+    return property(data)
+
+
+def _patch_serializers():
+    global _serializers_patched
+    if _serializers_patched:
+        return
+
+    serializers.Serializer.data = _timed_data(serializers.Serializer.data)
+    serializers.ListSerializer.data = _timed_data(serializers.ListSerializer.data)
+    _serializers_patched = True
@@ -0,0 +1,182 @@
+"""
+Справочные данные в памяти процесса: маршруты, автобусы, водители.
+
+Эти таблицы маленькие и меняются редко, а читаются в каждом списке
+смен, автобусов и в /api/locations/latest/. Каждый процесс целиком
+загружает таблицу в словарь {id: значение} и разрешает номера маршрутов,
+гос. номера и имена водителей без JOIN и без запросов на строку.
+
+Согласованность между процессами - через счётчик версии в общем кеше
+(settings.CACHES). Сохранение или удаление объекта (сигналы в signals.py
+приложений) после коммита увеличивает версию, и каждый процесс
+перечитывает таблицу, заметив новую версию. Версия сверяется не чаще
+раза в REFCACHE_CHECK_SECONDS секунд, а при промахе по id - сразу,
+поэтому только что созданный автобус или маршрут виден без задержки.
+Id, которого нет и после сверки (не водитель, удалённый автобус),
+запоминается до следующей версии таблицы и больше не сверяется.
+"""
+import logging
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceTable:
+    """
+    Таблица {id: значение}, загружаемая целиком функцией loader.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.lock = threading.Lock()
+        # (версия, данные, время последней сверки версии, id без значения)
+        self.state = None
+
+    @property
+    def version_key(self):
+        return f'refcache:version:{self.name}'
+
+    def shared_version(self):
+        try:
+            version = cache.get(self.version_key)
+            if version is None:
+                # Без ключа версии каждая сверка перечитывала бы таблицу
+                cache.add(self.version_key, 0, None)
+                version = cache.get(self.version_key)
+            return version
+        except Exception:
+            logger.exception('Failed to read reference cache version %s', self.name)
+            return None
+
+    def data(self, force_check=False):
+        state = self.state
+        now = time.monotonic()
+        check_seconds = getattr(settings, 'REFCACHE_CHECK_SECONDS', 5)
+
+        if state is not None and not force_check and now - state[2] < check_seconds:
+            return state[1]
+
+        with self.lock:
+            version = self.shared_version()
+            state = self.state
+            if state is None or version is None or version != state[0]:
+                # Версия читается до загрузки, поэтому данные не старше версии
+                state = (version, self.loader(), now, set())
+            else:
+                state = (state[0], state[1], now, state[3])
+            self.state = state
+        return state[1]
+
+    def get(self, pk):
+        if pk is None:
+            return None
+        value = self.data().get(pk)
+        if value is not None:
+            return value
+
+        state = self.state
+        if state is not None and pk in state[3]:
+            return None
+        value = self.data(force_check=True).get(pk)
+        state = self.state
+        if value is None and state is not None:
+            state[3].add(pk)
+        return value
+
+    def invalidate(self):
+        """
+        Сбрасывает таблицу в этом процессе и увеличивает общую версию.
+        """
+        self.state = None
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+        except Exception:
+            logger.exception('Failed to bump reference cache version %s', self.name)
+
+
+def load_routes():
+    Route = apps.get_model('route', 'Route')
+    return dict(Route.objects.values_list('id', 'number'))
+
+
+def load_buses():
+    Bus = apps.get_model('bus', 'Bus')
+    return {
+        bus_id: (registration_number, bus_type, route_id)
+        for bus_id, registration_number, bus_type, route_id in Bus.objects.values_list(
+            'id', 'registration_number', 'bus_type', 'route_id'
+        )
+    }
+
+
+def load_drivers():
+    User = apps.get_model('user', 'User')
+    return {
+        user_id: f'{first_name} {last_name}'.strip() or username
+        for user_id, username, first_name, last_name in User.objects.filter(
+            role='driver'
+        ).values_list('id', 'username', 'first_name', 'last_name')
+    }
+
+
+routes = ReferenceTable('route', load_routes)
+buses = ReferenceTable('bus', load_buses)
+drivers = ReferenceTable('driver', load_drivers)
+
+
+def route_number(route_id):
+    return routes.get(route_id)
+
+
+def bus_number(bus_id):
+    bus = buses.get(bus_id)
+    return bus[0] if bus else None
+
+
+def bus_type(bus_id):
+    bus = buses.get(bus_id)
+    return bus[1] if bus else None
+
+
+def bus_route_number(bus_id):
+    bus = buses.get(bus_id)
+    return route_number(bus[2]) if bus else None
+
+
+def driver_name(user_id):
+    """
+    Имя водителя как в сериализаторах: "Имя Фамилия" или username.
+    Для пользователей не с ролью водителя - None.
+    """
+    return drivers.get(user_id)
+
+
+class ReferenceField(serializers.ReadOnlyField):
+    """
+    Поле сериализатора, которое берёт значение из справочного кеша по id:
+    route_number = ReferenceField(route_number, source='route_id').
+
+    Пустое значение пропускается так же, как source='route.number'
+    при отсутствующем маршруте, поэтому вывод API не меняется.
+    """
+
+    def __init__(self, resolve, **kwargs):
+        self.resolve = resolve
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        value = self.resolve(super().get_attribute(instance))
+        if value is None:
+            raise SkipField()
+        return value
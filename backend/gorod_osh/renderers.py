@@ -0,0 +1,97 @@
+"""
+JSON-рендерер на orjson для горячих endpoints чтения.
+Подключается через REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].
+
+MessagePack-рендерер для мобильных клиентов подключается отдельными
+view через with_msgpack().
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, который кодирует через orjson.
+
+    datetime, Decimal и прочие типы DRF передаются в JSONEncoder.default,
+    поэтому их формат совпадает с обычным рендерером. Если orjson не
+    установлен, запрошен отступ (browsable API, ?indent) или данные ему
+    не по силам (например, целые больше 64 бит), используется JSONRenderer.
+
+    Байты совпадают с JSONRenderer, кроме чисел с плавающей точкой вне
+    1e-4 <= |x| < 1e16: orjson пишет 1e20, 1e-7 и 0.0000999 там, где
+    json пишет 1e+20, 1e-07 и 9.99e-05 (значения те же). NaN и
+    бесконечность orjson пишет как null, а JSONRenderer (STRICT_JSON)
+    выдаёт ошибку; в ответы API они не попадают - FloatField их не
+    принимает. Проверять каждое число перед кодированием не стали:
+    обход данных в Python дороже самого orjson.
+    """
+    options = 0
+
+    def __init__(self):
+        if orjson is not None:
+            self.options = orjson.OPT_PASSTHROUGH_DATETIME
+            self._default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if (
+            orjson is None
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self._default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Как и JSONRenderer, экранируем \u2028 и \u2029
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Те же данные, что в JSON, но в MessagePack (Accept: application/msgpack):
+    числа передаются бинарно, ответ короче и быстрее разбирается в приложении.
+    Типы, которых нет в MessagePack (datetime, Decimal), кодируются
+    JSONEncoder.default, как в JSON-ответе.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def __init__(self):
+        self._default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self._default, use_bin_type=True)
+
+
+def with_msgpack(renderer_classes):
+    """
+    Список рендереров с MessagePack в конце (JSON остаётся по умолчанию).
+    Без установленного msgpack список не меняется.
+    """
+    if msgpack is None:
+        return list(renderer_classes)
+    return [*renderer_classes, MessagePackRenderer]
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -33,6 +34,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # ← ПЕРВЫМ!
+    'gorod_osh.metrics.MetricsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -40,6 +42,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    'gorod_osh.profiling.ProfilingMiddleware',  # включается через PROFILING
 ]
 
 ROOT_URLCONF = "gorod_osh.urls"
@@ -73,6 +76,26 @@ DATABASES = {
     }
 }
 
+# Кеш. Метрики (/metrics), справочный кеш, кеш JWT и состояние приёма
+# координат согласованы между worker-процессами только при общем кеше:
+# в продакшене задайте REDIS_URL (например redis://127.0.0.1:6379/1,
+# нужен пакет redis). Без него - LocMem, каждый процесс видит только
+# свои данные (достаточно для разработки с одним процессом).
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -94,11 +117,16 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework настройки
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-рендерер с откатом на стандартный JSONRenderer (gorod_osh/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'gorod_osh.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50,
     'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S',
@@ -115,5 +143,148 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Сколько секунд пользователь из JWT хранится в кеше (user/authentication.py).
+# Сохранение пользователя сбрасывает кеш сразу, TTL - предел устаревания
+AUTH_PRINCIPAL_CACHE_TTL = 10
+
+# Как часто (секунды) процесс сверяет версию справочного кеша маршрутов,
+# автобусов и водителей (gorod_osh/refcache.py) с общим кешем
+REFCACHE_CHECK_SECONDS = 5
+
 # CORS настройки
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Профилирование запросов (SQL, сериализаторы, общее время)
+# Результаты: GET /api/profiling/ (только админы)
+PROFILING = {
+    'ENABLED': False,
+    'BUFFER_SIZE': 500,
+    'SLOWEST_QUERIES': 5,
+    'LOG_SAMPLE_RATE': 0.01,
+    'SLOW_REQUEST_MS': 1000,
+}
+
+# Метрики Prometheus: GET /metrics
+# TOKEN - если задан, запрос должен содержать Authorization: Bearer <TOKEN>;
+# без него метрики доступны только при DEBUG и с адресов ALLOWED_IPS.
+# PUBLIC - открыть метрики всем без токена
+METRICS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 5,
+    'WORKER_TTL': 300,
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'PUBLIC': False,
+}
+
+# Кеш асинхронных публичных endpoints (ASGI), секунды
+# LIVE_TTL - координаты, автобусы на линии и список маршрутов (в нём число
+# автобусов на линии), ROUTES_TTL - пути маршрутов
+ASYNC_READ_CACHE = {
+    'LIVE_TTL': 2,
+    'ROUTES_TTL': 60,
+}
+
+# Фильтр входящих координат (busLocation/ingest.py): точки внутри мёртвой
+# зоны не сохраняются, но не реже раза в HEARTBEAT_SECONDS секунд
+LOCATION_INGEST_FILTER = {
+    'ENABLED': True,
+    'MIN_DISTANCE_M': 15,
+    'MAX_ACCURACY_M': 50,
+    'HEARTBEAT_SECONDS': 60,
+}
+
+# Контроль схода с маршрута (busLocation/deviation.py): коридор BUFFER_M
+# метров по обе стороны пути, сход и возврат подтверждаются CONFIRM_FIXES
+# координатами подряд
+ROUTE_DEVIATION = {
+    'ENABLED': True,
+    'BUFFER_M': 75,
+    'CONFIRM_FIXES': 2,
+    'MAX_ACCURACY_M': 50,
+}
+
+# Прибытия на остановки и отправления (busLocation/stops.py): прибытие -
+# ближе ARRIVAL_RADIUS_M к остановке, отправление - дальше DEPARTURE_RADIUS_M
+STOP_EVENTS = {
+    'ENABLED': True,
+    'ARRIVAL_RADIUS_M': 30,
+    'DEPARTURE_RADIUS_M': 50,
+    'MAX_ACCURACY_M': 50,
+}
+
+# Поиск маршрутов между точками (route/planner.py): пешком не дальше
+# WALK_RADIUS_M до маршрута и от него, время оценивается по средним скоростям
+ROUTE_PLANNER = {
+    'WALK_RADIUS_M': 500,
+    'WALK_SPEED_KMH': 4.5,
+    'BUS_SPEED_KMH': 18,
+    'CELL_M': 250,
+    'MAX_RESULTS': 10,
+}
+
+# Поездки с пересадками (route/journeys.py): пересадка - пути маршрутов
+# ближе TRANSFER_RADIUS_M, на ожидание закладывается TRANSFER_PENALTY_MIN
+ROUTE_JOURNEYS = {
+    'TRANSFER_RADIUS_M': 150,
+    'TRANSFER_STEP_M': 100,
+    'TRANSFER_PENALTY_MIN': 5,
+    'MAX_TRANSFERS': 2,
+}
+
+# Кластеры автобусов на /api/locations/latest/?zoom= (busLocation/clusters.py):
+# ячейки CELL_PX экранных пикселей до масштаба MAX_ZOOM, в кластере
+# не меньше MIN_POINTS автобусов
+LOCATION_CLUSTERS = {
+    'MAX_ZOOM': 14,
+    'CELL_PX': 64,
+    'MIN_POINTS': 2,
+}
+
+# Прогноз положения на /api/locations/latest/?predict=1 (busLocation/prediction.py):
+# не дальше MAX_SECONDS от последней координаты, вдоль пути маршрута,
+# если координата ближе SNAP_RADIUS_M к нему
+LOCATION_PREDICTION = {
+    'MAX_SECONDS': 60,
+    'SNAP_RADIUS_M': 40,
+    'MAX_HEADING_DIFF': 60,
+    'GOOD_ACCURACY_M': 20,
+}
+
+# Шина координат (busLocation/hub.py): PUBLISH - публиковать принятые
+# координаты (включать, когда есть подписчики); BACKEND 'postgres'
+# (LISTEN/NOTIFY между процессами) или 'local' (внутри процесса), None - по
+# базе данных. QUEUE_SIZE - очередь подписчика, при переполнении теряются
+# старые координаты
+POSITION_HUB = {
+    'PUBLISH': False,
+    'BACKEND': None,
+    'CHANNEL': 'bus_positions',
+    'QUEUE_SIZE': 1000,
+    'RECONNECT_SECONDS': 5,
+}
+
+# Логирование
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'gorod_osh': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'busLocation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'shift': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
@@ -4,6 +4,8 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
+from .profiling import ProfilingView
+from .metrics import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -29,6 +31,12 @@ urlpatterns = [
     path('api/shifts/', include('shift.urls')),
     path('api/locations/', include('busLocation.urls')),
 
+    # Профилирование запросов (только для админов)
+    path('api/profiling/', ProfilingView.as_view(), name='profiling'),
+
+    # Метрики Prometheus
+    path('metrics', metrics_view, name='metrics'),
+
     # Swagger UI
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='swagger-ui'),
 
@@ -0,0 +1,24 @@
+"""
+URL-конфигурация для ASGI (см. asgi.py).
+Публичные endpoints чтения (AllowAny) обслуживаются асинхронными view,
+всё остальное совпадает с gorod_osh/urls.py.
+"""
+from django.urls import path
+
+from bus import async_views as bus_views
+from busLocation import async_views as location_views
+from route import async_views as route_views
+from route.views import RouteViewSet
+from .async_responses import read_only
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/locations/latest/', location_views.latest),
+    path('api/buses/on-route/', bus_views.on_route),
+    path('api/buses/by-route/<route_id>/', bus_views.by_route),
+    path('api/routes/', read_only(
+        route_views.route_list,
+        RouteViewSet.as_view({'get': 'list', 'post': 'create'}, basename='route', detail=False)
+    )),
+    path('api/routes/<pk>/path/', route_views.route_path),
+] + sync_urlpatterns
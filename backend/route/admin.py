@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Route
+from .models import Route, RouteTransfer
 
 
 @admin.register(Route)
@@ -7,16 +7,32 @@ class RouteAdmin(admin.ModelAdmin):
     list_display = ('number', 'name', 'bus_type', 'is_active', 'working_hours', 'created_at')
     list_filter = ('bus_type', 'is_active')
     search_fields = ('number', 'name', 'start_point', 'end_point')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('stops_version', 'created_at', 'updated_at')
     
     fieldsets = (
         ('Основная информация', {
             'fields': ('number', 'name', 'bus_type', 'is_active')
         }),
         ('Маршрут', {
-            'fields': ('start_point', 'end_point', 'start_coordinates', 'end_coordinates', 'path')
+            'fields': ('start_point', 'end_point', 'start_coordinates', 'end_coordinates', 'path', 'stops', 'stops_version')
         }),
         ('Дополнительно', {
             'fields': ('working_hours', 'created_at', 'updated_at')
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(RouteTransfer)
+class RouteTransferAdmin(admin.ModelAdmin):
+    """
+    Пересадки только для просмотра: пересчитываются при сохранении маршрутов.
+    """
+    list_display = ('from_route', 'from_position', 'to_route', 'to_position', 'walk_m')
+    list_filter = ('from_route',)
+    list_select_related = ('from_route', 'to_route')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,70 @@
+"""
+Асинхронные версии публичных endpoints маршрутов.
+Подключаются только в ASGI (gorod_osh/urls_asgi.py).
+"""
+from django.db.models import Count, Q
+from django.http import Http404
+from django.views.decorators.http import require_safe
+
+from gorod_osh.async_responses import cached_json, encode, get_config, json_response
+from .models import Route
+from .serializers import RouteSerializer
+
+
+ROUTES_KEY = 'async:routes'
+
+
+def route_path_key(pk):
+    return f'async:route_path:{pk}'
+
+
+@require_safe
+async def route_list(request):
+    """
+    GET /api/routes/ — то же, что RouteViewSet.list.
+    Количество активных автобусов считается аннотацией в том же запросе.
+    Оно меняется с каждой сменой, поэтому список кешируется на LIVE_TTL,
+    а правки маршрутов и автобусов удаляют его сразу (route/signals.py,
+    bus/signals.py).
+    """
+    async def build():
+        routes = Route.objects.annotate(
+            _cached_active_buses_count=Count(
+                'buses__shifts',
+                filter=Q(buses__shifts__status='active')
+            )
+        )
+        return RouteSerializer([route async for route in routes], many=True).data
+
+    return await cached_json(ROUTES_KEY, get_config()['LIVE_TTL'], build)
+
+
+@require_safe
+async def route_path(request, pk):
+    """
+    GET /api/routes/{id}/path/ — то же, что RouteViewSet.path.
+    Кеш удаляется при сохранении маршрута (route/signals.py).
+    """
+    try:
+        pk = int(pk)
+    except ValueError:
+        return json_response(encode({'detail': 'Маршрут не найден'}), status=404)
+
+    async def build():
+        try:
+            route = await Route.objects.aget(pk=pk)
+        except Route.DoesNotExist:
+            raise Http404
+
+        return {
+            'id': route.id,
+            'number': route.number,
+            'path': route.path,
+            'start_coordinates': route.start_coordinates,
+            'end_coordinates': route.end_coordinates
+        }
+
+    try:
+        return await cached_json(route_path_key(pk), get_config()['ROUTES_TTL'], build)
+    except Http404:
+        return json_response(encode({'detail': 'Маршрут не найден'}), status=404)
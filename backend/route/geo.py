@@ -0,0 +1,200 @@
+import math
+from bisect import bisect_left
+
+
+EARTH_RADIUS_M = 6371000
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """
+    Расстояние между двумя точками в метрах (формула гаверсинусов).
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bearing_deg(lat1, lng1, lat2, lng2):
+    """
+    Начальный азимут из первой точки во вторую в градусах (0=север, 90=восток).
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_lambda = math.radians(lng2 - lng1)
+
+    x = math.sin(d_lambda) * math.cos(phi2)
+    y = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(d_lambda)
+    return (math.degrees(math.atan2(x, y)) + 360) % 360
+
+
+def cumulative_distances(path):
+    """
+    Накопленное расстояние (м) от начала пути до каждой точки.
+    path - список точек {"lat": ..., "lng": ...} как в Route.path.
+    """
+    distances = [0.0]
+    for previous, point in zip(path, path[1:]):
+        distances.append(distances[-1] + haversine_m(
+            previous['lat'], previous['lng'], point['lat'], point['lng']
+        ))
+    return distances
+
+
+def point_along(path, cumulative, distance):
+    """
+    Точка на пути на расстоянии distance (м) от начала.
+    Возвращает (lat, lng, bearing) где bearing - направление сегмента.
+    """
+    distance = max(0.0, min(distance, cumulative[-1]))
+    i = min(max(bisect_left(cumulative, distance), 1), len(path) - 1)
+
+    start, end = path[i - 1], path[i]
+    segment = cumulative[i] - cumulative[i - 1]
+    ratio = (distance - cumulative[i - 1]) / segment if segment else 0.0
+    lat = start['lat'] + (end['lat'] - start['lat']) * ratio
+    lng = start['lng'] + (end['lng'] - start['lng']) * ratio
+    return lat, lng, bearing_deg(start['lat'], start['lng'], end['lat'], end['lng'])
+
+
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def segment_distance(px, py, ax, ay, bx, by):
+    """
+    Расстояние от точки до отрезка на плоскости.
+    """
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = ((px - ax) * dx + (py - ay) * dy) / length2 if length2 else 0.0
+    t = max(0.0, min(1.0, t))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+class SegmentGrid:
+    """
+    Коридор шириной buffer_m по обе стороны от пути маршрута.
+
+    Путь проецируется на плоскость (метры вокруг первой точки, для
+    масштабов города погрешность пренебрежимо мала), и каждый сегмент
+    заносится во все ячейки сетки со стороной buffer_m, которые задевает
+    его буфер. Проверка точки - одна ячейка и несколько сегментов в ней,
+    а не расстояние до всех сегментов пути.
+    """
+
+    def __init__(self, path, buffer_m):
+        self.buffer_m = buffer_m
+        self.origin_lat = path[0]['lat']
+        self.origin_lng = path[0]['lng']
+        self.kx = METERS_PER_DEGREE * math.cos(math.radians(self.origin_lat))
+
+        points = [self.project(point['lat'], point['lng']) for point in path]
+        self.segments = list(zip(points, points[1:]))
+
+        self.cells = {}
+        # Ячейка засчитывается сегменту, если её центр ближе buffer + полдиагонали
+        reach = buffer_m + buffer_m * math.sqrt(2) / 2
+        for index, ((ax, ay), (bx, by)) in enumerate(self.segments):
+            for cx in range(self.cell(min(ax, bx) - buffer_m), self.cell(max(ax, bx) + buffer_m) + 1):
+                for cy in range(self.cell(min(ay, by) - buffer_m), self.cell(max(ay, by) + buffer_m) + 1):
+                    center_x = (cx + 0.5) * buffer_m
+                    center_y = (cy + 0.5) * buffer_m
+                    if segment_distance(center_x, center_y, ax, ay, bx, by) <= reach:
+                        self.cells.setdefault((cx, cy), []).append(index)
+
+    def project(self, lat, lng):
+        return (lng - self.origin_lng) * self.kx, (lat - self.origin_lat) * METERS_PER_DEGREE
+
+    def cell(self, value):
+        return math.floor(value / self.buffer_m)
+
+    def distance_m(self, lat, lng):
+        """
+        Расстояние до пути в метрах или None, если точка вне коридора.
+        """
+        x, y = self.project(float(lat), float(lng))
+        candidates = self.cells.get((self.cell(x), self.cell(y)))
+        if not candidates:
+            return None
+
+        distance = min(
+            segment_distance(x, y, ax, ay, bx, by)
+            for (ax, ay), (bx, by) in (self.segments[index] for index in candidates)
+        )
+        return distance if distance <= self.buffer_m else None
+
+    def contains(self, lat, lng):
+        return self.distance_m(lat, lng) is not None
+
+
+def locate_on_path(path, cumulative, lat, lng):
+    """
+    Проекция точки на путь: (расстояние вдоль пути от начала, отступ от пути)
+    в метрах. Перебирает все сегменты, поэтому для разовых расчётов
+    (остановки при сохранении маршрута), а не для каждой координаты.
+    """
+    kx = METERS_PER_DEGREE * math.cos(math.radians(lat))
+    best = None
+    for i in range(1, len(path)):
+        start, end = path[i - 1], path[i]
+        ax, ay = (start['lng'] - lng) * kx, (start['lat'] - lat) * METERS_PER_DEGREE
+        bx, by = (end['lng'] - lng) * kx, (end['lat'] - lat) * METERS_PER_DEGREE
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        t = max(0.0, min(1.0, -(ax * dx + ay * dy) / length2)) if length2 else 0.0
+        offset = math.hypot(ax + t * dx, ay + t * dy)
+        if best is None or offset < best[1]:
+            along = cumulative[i - 1] + t * (cumulative[i] - cumulative[i - 1])
+            best = (along, offset)
+    return best
+
+
+class PointGrid:
+    """
+    Точки (остановки) в сетке со стороной radius_m: поиск ближайшей
+    точки в радиусе смотрит 9 соседних ячеек, а не все точки.
+    """
+
+    def __init__(self, points, radius_m):
+        self.radius_m = radius_m
+        self.origin_lat = points[0]['lat'] if points else 0.0
+        self.origin_lng = points[0]['lng'] if points else 0.0
+        self.kx = METERS_PER_DEGREE * math.cos(math.radians(self.origin_lat))
+
+        self.points = [self.project(point['lat'], point['lng']) for point in points]
+        self.cells = {}
+        for index, (x, y) in enumerate(self.points):
+            self.cells.setdefault((self.cell(x), self.cell(y)), []).append(index)
+
+    def project(self, lat, lng):
+        return (lng - self.origin_lng) * self.kx, (lat - self.origin_lat) * METERS_PER_DEGREE
+
+    def cell(self, value):
+        return math.floor(value / self.radius_m)
+
+    def distance_m(self, index, lat, lng):
+        x, y = self.project(float(lat), float(lng))
+        px, py = self.points[index]
+        return math.hypot(x - px, y - py)
+
+    def nearest(self, lat, lng, radius_m=None):
+        """
+        Индекс ближайшей точки не дальше radius_m (по умолчанию radius_m
+        сетки, больше него нельзя) или None.
+        """
+        radius_m = min(radius_m or self.radius_m, self.radius_m)
+        x, y = self.project(float(lat), float(lng))
+        cx, cy = self.cell(x), self.cell(y)
+
+        best, best_distance = None, radius_m
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for index in self.cells.get((cx + dx, cy + dy), ()):
+                    px, py = self.points[index]
+                    distance = math.hypot(x - px, y - py)
+                    if distance <= best_distance:
+                        best, best_distance = index, distance
+        return best
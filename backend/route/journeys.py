@@ -0,0 +1,254 @@
+"""
+Поездки с пересадками (GET /api/routes/journey/).
+
+Граф: маршруты и пересадки между ними (RouteTransfer) - места, где путь
+одного маршрута проходит не дальше TRANSFER_RADIUS_M от пути другого.
+Пересадки ищутся по точкам пути через каждые TRANSFER_STEP_M в сетке
+route/planner.py и хранятся в БД. После коммита сохранения или удаления
+маршрутов (route/signals.py, один раз на транзакцию) пересадки
+пересчитываются в том же процессе, вне запросов поиска: поиск всегда
+читает последние сохранённые пересадки. Команда rebuild_transfers
+пересчитывает их после загрузки маршрутов в обход save().
+
+Поиск - по раундам, как в RAPTOR: раунд k - поездки ровно с k
+пересадками. Метка на маршруте - место посадки и время до него; время
+в любой точке маршрута дальше посадки линейно растёт с расстоянием.
+Раунд проверяет высадку у цели и переносит метки по пересадкам на
+следующий раунд, отбрасывая метки, которые не лучше уже известных.
+Возвращается Парето-набор: поездка с большим числом пересадок
+попадает в ответ, только если она быстрее.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import planner
+from .models import RouteTransfer
+
+
+logger = logging.getLogger(__name__)
+
+# Версия маршрутов, изменившихся после расчёта пересадок, и версия,
+# по которой пересадки в БД посчитаны
+CHANGED_KEY = 'route:transfers:changed'
+BUILT_KEY = 'route:transfers:built'
+LOCK_KEY = 'route:transfers:lock'
+
+DEFAULTS = {
+    'TRANSFER_RADIUS_M': 150,
+    'TRANSFER_STEP_M': 100,
+    # Ожидание следующего автобуса на пересадке
+    'TRANSFER_PENALTY_MIN': 5,
+    'MAX_TRANSFERS': 2,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ROUTE_JOURNEYS', {})}
+
+
+def compute_transfers(network):
+    """
+    Пересадки между всеми маршрутами сети: с каждой точки пути
+    (через TRANSFER_STEP_M) на ближайшую точку каждого соседнего маршрута.
+    """
+    config = get_config()
+    transfers = []
+    for route_id, (_, _, cumulative) in network.routes.items():
+        length = cumulative[-1]
+        samples = int(length // config['TRANSFER_STEP_M']) + 1
+        for step in range(samples + 1):
+            position = min(step * config['TRANSFER_STEP_M'], length)
+            lat, lng = network.point_at(route_id, position)
+            for to_route, candidates in network.access(lat, lng, config['TRANSFER_RADIUS_M']).items():
+                if to_route == route_id:
+                    continue
+                to_position, walk_m, _, _ = min(candidates, key=lambda candidate: candidate[1])
+                transfers.append(RouteTransfer(
+                    from_route_id=route_id,
+                    from_position=round(position, 1),
+                    to_route_id=to_route,
+                    to_position=round(to_position, 1),
+                    walk_m=round(walk_m)
+                ))
+    return transfers
+
+
+def save_transfers(transfers):
+    with transaction.atomic():
+        RouteTransfer.objects.all().delete()
+        RouteTransfer.objects.bulk_create(transfers, batch_size=1000)
+
+
+def rebuild_transfers(network=None):
+    """
+    Пересчитывает и сохраняет все пересадки. Возвращает их количество.
+    """
+    changed = cache.get(CHANGED_KEY, 0)
+    transfers = compute_transfers(network or planner.build_network())
+    save_transfers(transfers)
+    cache.set(BUILT_KEY, changed, None)
+    return len(transfers)
+
+
+def mark_stale():
+    """
+    Маршруты изменились (после коммита, route/signals.py): увеличивает
+    версию изменений и пересчитывает пересадки.
+    """
+    try:
+        cache.add(CHANGED_KEY, 0, None)
+        cache.incr(CHANGED_KEY)
+    except Exception:
+        logger.exception('Failed to mark route transfers stale')
+    planner.network.invalidate()
+    refresh_stale()
+
+
+def refresh_stale():
+    """
+    Пересчитывает пересадки, пока они посчитаны не по последней версии
+    изменений. Считает один процесс: если расчёт уже идёт, процесс с
+    блокировкой после него снова сверит версии и учтёт новое изменение.
+    Ошибка расчёта только пишется в лог - поиск продолжит читать
+    прежние пересадки.
+    """
+    while True:
+        try:
+            if cache.get(CHANGED_KEY, 0) == cache.get(BUILT_KEY, 0):
+                return
+            if not cache.add(LOCK_KEY, True, 300):
+                return
+        except Exception:
+            logger.exception('Failed to check route transfers version')
+            return
+
+        try:
+            count = rebuild_transfers()
+            logger.info('Route transfers rebuilt: %s', count)
+        except Exception:
+            logger.exception('Failed to rebuild route transfers')
+            return
+        finally:
+            cache.delete(LOCK_KEY)
+        # Все процессы перечитают сеть уже с новыми пересадками
+        planner.network.invalidate()
+
+
+def _best_label(labels, position, bus_speed, inclusive=False):
+    """
+    Метка, с которой быстрее всего доехать до position, и время прибытия.
+    """
+    best, best_cost = None, None
+    for label in labels:
+        if label[0] < position or (inclusive and label[0] == position):
+            cost = label[1] + (position - label[0]) / bus_speed
+            if best_cost is None or cost < best_cost:
+                best, best_cost = label, cost
+    return best, best_cost
+
+
+def _journey(network, cost, route_id, label, position, walk_m):
+    """
+    Поездка по цепочке меток от высадки у цели к началу.
+    Метка: (место посадки, время, откуда пришли, пешком до посадки),
+    откуда пришли - None или (маршрут, метка, место высадки).
+    """
+    walk_from_route_m = walk_m
+    legs = []
+    while True:
+        board_position, _, parent, walk_m = label
+        route = network.routes[route_id][0]
+        board_lat, board_lng = network.point_at(route_id, board_position)
+        alight_lat, alight_lng = network.point_at(route_id, position)
+        legs.append({
+            'route_id': route_id,
+            'number': route['number'],
+            'name': route['name'],
+            'bus_type': route['bus_type'],
+            'walk_m': round(walk_m),
+            'board': {'lat': round(board_lat, 6), 'lng': round(board_lng, 6)},
+            'alight': {'lat': round(alight_lat, 6), 'lng': round(alight_lng, 6)},
+            'ride_m': round(position - board_position),
+        })
+        if parent is None:
+            break
+        route_id, label, position = parent
+
+    legs.reverse()
+    return {
+        'transfers': len(legs) - 1,
+        'duration_min': round(cost / 60, 1),
+        'walk_from_route_m': round(walk_from_route_m),
+        'legs': legs,
+    }
+
+
+def search(from_lat, from_lng, to_lat, to_lng):
+    """
+    Поездки от точки до точки без пересадок и с пересадками
+    (не больше MAX_TRANSFERS), каждая следующая быстрее предыдущей.
+    """
+    config = get_config()
+    planner_config = planner.get_config()
+    network = planner.network.data()
+    walk_speed = planner_config['WALK_SPEED_KMH'] / 3.6
+    bus_speed = planner_config['BUS_SPEED_KMH'] / 3.6
+    penalty = config['TRANSFER_PENALTY_MIN'] * 60
+
+    alighting = network.access(to_lat, to_lng, planner_config['WALK_RADIUS_M'])
+    if not alighting:
+        return []
+
+    current = {}
+    for route_id, candidates in network.access(from_lat, from_lng, planner_config['WALK_RADIUS_M']).items():
+        current[route_id] = [
+            (position, walk_m / walk_speed, None, walk_m)
+            for position, walk_m, _, _ in candidates
+        ]
+    reached = {route_id: list(labels) for route_id, labels in current.items()}
+
+    journeys = []
+    best_cost = None
+    for transfers in range(config['MAX_TRANSFERS'] + 1):
+        arrival = None
+        for route_id, labels in current.items():
+            for position, walk_m, _, _ in alighting.get(route_id, ()):
+                label, cost = _best_label(labels, position, bus_speed)
+                if label is None:
+                    continue
+                cost += walk_m / walk_speed
+                if arrival is None or cost < arrival[0]:
+                    arrival = (cost, route_id, label, position, walk_m)
+
+        if arrival is not None and (best_cost is None or arrival[0] < best_cost):
+            best_cost = arrival[0]
+            journeys.append(_journey(network, *arrival))
+
+        if transfers == config['MAX_TRANSFERS']:
+            break
+
+        following = {}
+        for route_id, labels in current.items():
+            for from_position, to_route, to_position, walk_m in network.transfers.get(route_id, ()):
+                label, cost = _best_label(labels, from_position, bus_speed)
+                if label is None:
+                    continue
+                cost += walk_m / walk_speed + penalty
+                # Дальше только дольше: эта ветка не обгонит найденную поездку
+                if best_cost is not None and cost >= best_cost:
+                    continue
+                _, known = _best_label(reached.get(to_route, ()), to_position, bus_speed, inclusive=True)
+                if known is not None and known <= cost:
+                    continue
+                new_label = (to_position, cost, (route_id, label, from_position), walk_m)
+                following.setdefault(to_route, []).append(new_label)
+                reached.setdefault(to_route, []).append(new_label)
+
+        if not following:
+            break
+        current = following
+
+    return journeys
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from route import journeys, planner
+
+
+class Command(BaseCommand):
+    """
+    Пересчёт пересадок между маршрутами (route/journeys.py).
+    Обычно не нужен: пересадки пересчитываются после коммита изменений
+    маршрутов. Нужен после загрузки маршрутов в обход save() (bulk_create,
+    loaddata) или если пересчёт после коммита завершился ошибкой.
+    """
+    help = 'Пересчитать пересадки между маршрутами'
+
+    def handle(self, *args, **options):
+        count = journeys.rebuild_transfers()
+        planner.network.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Пересадок: {count}'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='stops',
+            field=models.JSONField(blank=True, default=list, help_text='Массив остановок: [{"name": "Центр", "lat": 42.8746, "lng": 74.5698}, ...]', verbose_name='Остановки'),
+        ),
+    ]
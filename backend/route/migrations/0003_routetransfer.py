@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0002_route_stops'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_position', models.FloatField(help_text='Расстояние вдоль пути маршрута от начала, м', verbose_name='Место высадки')),
+                ('to_position', models.FloatField(help_text='Расстояние вдоль пути маршрута от начала, м', verbose_name='Место посадки')),
+                ('walk_m', models.PositiveIntegerField(verbose_name='Пешком, м')),
+                ('from_route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfers_from', to='route.route', verbose_name='С маршрута')),
+                ('to_route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfers_to', to='route.route', verbose_name='На маршрут')),
+            ],
+            options={
+                'verbose_name': 'Пересадка',
+                'verbose_name_plural': 'Пересадки',
+                'ordering': ['from_route', 'from_position'],
+            },
+        ),
+    ]
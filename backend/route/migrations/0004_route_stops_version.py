@@ -0,0 +1,26 @@
+"""
+Версия списка остановок маршрута.
+
+Увеличивается в Route.save() при изменении stops; по ней StopEvent
+отличает номера остановок из разных версий списка.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("route", "0003_routetransfer"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="route",
+            name="stops_version",
+            field=models.PositiveIntegerField(
+                default=1,
+                help_text="Увеличивается при изменении списка остановок",
+                verbose_name="Версия остановок",
+            ),
+        ),
+    ]
@@ -63,6 +63,19 @@ class Route(models.Model):
         help_text='Массив координат: [{"lat": 42.8746, "lng": 74.5698}, ...]'
     )
     
+    stops = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='Остановки',
+        help_text='Массив остановок: [{"name": "Центр", "lat": 42.8746, "lng": 74.5698}, ...]'
+    )
+    
+    stops_version = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Версия остановок',
+        help_text='Увеличивается при изменении списка остановок'
+    )
+    
     working_hours = models.CharField(
         max_length=50,
         blank=True,
@@ -124,24 +137,89 @@ class Route(models.Model):
         for point in self.path:
             if not isinstance(point, dict) or 'lat' not in point or 'lng' not in point:
                 raise ValidationError('Каждая точка в path должна содержать lat и lng')
+        
+        if not isinstance(self.stops, list):
+            raise ValidationError('stops должен быть списком остановок')
+        
+        for stop in self.stops:
+            if not isinstance(stop, dict) or 'lat' not in stop or 'lng' not in stop:
+                raise ValidationError('Каждая остановка в stops должна содержать lat и lng')
     
     def save(self, *args, **kwargs):
         """
         Переопределяем save для вызова валидации.
+        
+        Изменённый список остановок получает новую версию: стоянки
+        (StopEvent) хранят номер остановки в списке своей версии и не
+        смешиваются с остановками нового списка. QuerySet.update()
+        версию не меняет.
         """
         self.clean()
+        update_fields = kwargs.get('update_fields')
+        if self.pk and (update_fields is None or 'stops' in update_fields):
+            stored = Route.objects.filter(pk=self.pk).values_list('stops', flat=True).first()
+            if stored is not None and stored != self.stops:
+                self.stops_version += 1
+                if update_fields is not None:
+                    kwargs['update_fields'] = {*update_fields, 'stops_version'}
         super().save(*args, **kwargs)
     
     @property
     def active_buses_count(self):
         """
         Возвращает количество активных автобусов на этом маршруте.
+        Может быть заполнено заранее аннотацией (_cached_active_buses_count).
         """
-        from shift.models import Shift
-        
-        active_shifts = Shift.objects.filter(
-            status='active',
-            bus__route=self
-        ).count()
+        if not hasattr(self, '_cached_active_buses_count'):
+            from shift.models import Shift
+            
+            self._cached_active_buses_count = Shift.objects.filter(
+                status='active',
+                bus__route=self
+            ).count()
         
-        return active_shifts
\ No newline at end of file
+        return self._cached_active_buses_count
+
+
+class RouteTransfer(models.Model):
+    """
+    Пересадка: место, где путь одного маршрута проходит рядом с путём
+    другого. Пересчитывается целиком при изменении маршрутов
+    (route/journeys.py), читается поиском поездок с пересадками.
+    """
+    
+    from_route = models.ForeignKey(
+        Route,
+        on_delete=models.CASCADE,
+        related_name='transfers_from',
+        verbose_name='С маршрута'
+    )
+    
+    from_position = models.FloatField(
+        verbose_name='Место высадки',
+        help_text='Расстояние вдоль пути маршрута от начала, м'
+    )
+    
+    to_route = models.ForeignKey(
+        Route,
+        on_delete=models.CASCADE,
+        related_name='transfers_to',
+        verbose_name='На маршрут'
+    )
+    
+    to_position = models.FloatField(
+        verbose_name='Место посадки',
+        help_text='Расстояние вдоль пути маршрута от начала, м'
+    )
+    
+    walk_m = models.PositiveIntegerField(
+        verbose_name='Пешком, м'
+    )
+    
+    class Meta:
+        verbose_name = 'Пересадка'
+        verbose_name_plural = 'Пересадки'
+        ordering = ['from_route', 'from_position']
+    
+    def __str__(self):
+        return f"{self.from_route_id} → {self.to_route_id} ({self.walk_m} м)"
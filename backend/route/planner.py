@@ -0,0 +1,222 @@
+"""
+Поиск маршрутов между двумя точками (GET /api/routes/plan/).
+
+Пути всех активных маршрутов проецируются на общую плоскость (метры
+вокруг первой точки сети) и каждый сегмент заносится в ячейки сетки
+со стороной CELL_M, которые он задевает. Для точки запроса
+просматриваются только ячейки в пешей доступности и сегменты в них,
+а не JSON-пути всех маршрутов.
+
+Сеть строится целиком один раз на версию маршрутов: сохранение маршрута
+увеличивает версию (route/signals.py), и каждый процесс перестраивает
+сеть при первом запросе после этого (как справочный кеш,
+gorod_osh/refcache.py).
+"""
+import math
+from bisect import bisect_left
+
+from django.apps import apps
+from django.conf import settings
+
+from gorod_osh.refcache import ReferenceTable
+from .geo import METERS_PER_DEGREE
+
+
+DEFAULTS = {
+    # Сколько пешком до маршрута и от него, метры
+    'WALK_RADIUS_M': 500,
+    'WALK_SPEED_KMH': 4.5,
+    # Средняя скорость автобуса с остановками
+    'BUS_SPEED_KMH': 18,
+    'CELL_M': 250,
+    'MAX_RESULTS': 10,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ROUTE_PLANNER', {})}
+
+
+class RouteNetwork:
+    """
+    Сегменты путей всех маршрутов в одной сетке.
+    """
+
+    def __init__(self, routes, cell_m):
+        self.cell_m = cell_m
+        first = routes[0]['path'][0] if routes else {'lat': 0.0, 'lng': 0.0}
+        self.origin_lat = first['lat']
+        self.origin_lng = first['lng']
+        self.kx = METERS_PER_DEGREE * math.cos(math.radians(self.origin_lat))
+
+        # {route_id: (данные маршрута, точки на плоскости, накопленная длина)}
+        self.routes = {}
+        self.cells = {}
+        # Пересадки (route/journeys.py): {route_id: [(откуда, на маршрут, куда, пешком), ...]}
+        self.transfers = {}
+        reach = cell_m * math.sqrt(2) / 2
+        for route in routes:
+            points = [self.project(point['lat'], point['lng']) for point in route['path']]
+            cumulative = [0.0]
+            for (ax, ay), (bx, by) in zip(points, points[1:]):
+                cumulative.append(cumulative[-1] + math.hypot(bx - ax, by - ay))
+            self.routes[route['id']] = (route, points, cumulative)
+
+            for index, ((ax, ay), (bx, by)) in enumerate(zip(points, points[1:])):
+                for cx in range(self.cell(min(ax, bx)), self.cell(max(ax, bx)) + 1):
+                    for cy in range(self.cell(min(ay, by)), self.cell(max(ay, by)) + 1):
+                        center_x = (cx + 0.5) * cell_m
+                        center_y = (cy + 0.5) * cell_m
+                        if _segment_projection(center_x, center_y, ax, ay, bx, by)[0] <= reach:
+                            self.cells.setdefault((cx, cy), []).append((route['id'], index))
+
+    def project(self, lat, lng):
+        return (lng - self.origin_lng) * self.kx, (lat - self.origin_lat) * METERS_PER_DEGREE
+
+    def unproject(self, x, y):
+        return self.origin_lat + y / METERS_PER_DEGREE, self.origin_lng + x / self.kx
+
+    def cell(self, value):
+        return math.floor(value / self.cell_m)
+
+    def point_at(self, route_id, along):
+        """
+        (lat, lng) точки маршрута на расстоянии along от начала пути.
+        """
+        _, points, cumulative = self.routes[route_id]
+        along = max(0.0, min(along, cumulative[-1]))
+        i = min(max(bisect_left(cumulative, along), 1), len(points) - 1)
+        segment = cumulative[i] - cumulative[i - 1]
+        ratio = (along - cumulative[i - 1]) / segment if segment else 0.0
+        (ax, ay), (bx, by) = points[i - 1], points[i]
+        return self.unproject(ax + (bx - ax) * ratio, ay + (by - ay) * ratio)
+
+    def bearing_at(self, route_id, along):
+        """
+        Направление пути маршрута в точке along (0=север, 90=восток).
+        """
+        _, points, cumulative = self.routes[route_id]
+        i = min(max(bisect_left(cumulative, along), 1), len(points) - 1)
+        (ax, ay), (bx, by) = points[i - 1], points[i]
+        return (math.degrees(math.atan2(bx - ax, by - ay)) + 360) % 360
+
+    def access(self, lat, lng, radius_m):
+        """
+        Места посадки в радиусе radius_m от точки:
+        {route_id: [(расстояние вдоль пути, пешком до пути, x, y), ...]}.
+        """
+        x, y = self.project(lat, lng)
+        seen = set()
+        result = {}
+        for cx in range(self.cell(x - radius_m), self.cell(x + radius_m) + 1):
+            for cy in range(self.cell(y - radius_m), self.cell(y + radius_m) + 1):
+                for route_id, index in self.cells.get((cx, cy), ()):
+                    if (route_id, index) in seen:
+                        continue
+                    seen.add((route_id, index))
+
+                    _, points, cumulative = self.routes[route_id]
+                    (ax, ay), (bx, by) = points[index], points[index + 1]
+                    distance, t = _segment_projection(x, y, ax, ay, bx, by)
+                    if distance > radius_m:
+                        continue
+                    along = cumulative[index] + t * (cumulative[index + 1] - cumulative[index])
+                    result.setdefault(route_id, []).append(
+                        (along, distance, ax + t * (bx - ax), ay + t * (by - ay))
+                    )
+        return result
+
+
+def _segment_projection(px, py, ax, ay, bx, by):
+    """
+    Расстояние от точки до отрезка и доля отрезка до ближайшей точки.
+    """
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = ((px - ax) * dx + (py - ay) * dy) / length2 if length2 else 0.0
+    t = max(0.0, min(1.0, t))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy), t
+
+
+def build_network():
+    """
+    Сеть из путей активных маршрутов, без пересадок.
+    """
+    Route = apps.get_model('route', 'Route')
+    routes = [
+        route for route in Route.objects.filter(is_active=True).order_by('id').values(
+            'id', 'number', 'name', 'bus_type', 'path'
+        )
+        if isinstance(route['path'], list) and len(route['path']) >= 2
+    ]
+    return RouteNetwork(routes, get_config()['CELL_M'])
+
+
+def load_network():
+    """
+    Сеть с последними сохранёнными пересадками. Пересадки здесь не
+    пересчитываются: это путь чтения (route/journeys.py).
+    """
+    network = build_network()
+
+    RouteTransfer = apps.get_model('route', 'RouteTransfer')
+    for from_route, from_position, to_route, to_position, walk_m in RouteTransfer.objects.values_list(
+        'from_route_id', 'from_position', 'to_route_id', 'to_position', 'walk_m'
+    ).order_by('from_route_id', 'from_position'):
+        if from_route in network.routes and to_route in network.routes:
+            network.transfers.setdefault(from_route, []).append(
+                (from_position, to_route, to_position, walk_m)
+            )
+    return network
+
+
+network = ReferenceTable('route_network', load_network)
+
+
+def plan(from_lat, from_lng, to_lat, to_lng):
+    """
+    Маршруты, проходящие в пешей доступности от обеих точек в нужном
+    направлении (посадка раньше высадки по ходу пути), по возрастанию
+    оценки времени в пути: пешком до пути, поездка, пешком от пути.
+    """
+    config = get_config()
+    index = network.data()
+    walk_speed = config['WALK_SPEED_KMH'] / 3.6
+    bus_speed = config['BUS_SPEED_KMH'] / 3.6
+
+    boarding = index.access(from_lat, from_lng, config['WALK_RADIUS_M'])
+    alighting = index.access(to_lat, to_lng, config['WALK_RADIUS_M'])
+
+    options = []
+    for route_id in boarding.keys() & alighting.keys():
+        best = None
+        for board in boarding[route_id]:
+            for alight in alighting[route_id]:
+                ride_m = alight[0] - board[0]
+                if ride_m <= 0:
+                    continue
+                seconds = (board[1] + alight[1]) / walk_speed + ride_m / bus_speed
+                if best is None or seconds < best[0]:
+                    best = (seconds, board, alight, ride_m)
+        if best is None:
+            continue
+
+        seconds, board, alight, ride_m = best
+        route = index.routes[route_id][0]
+        board_lat, board_lng = index.unproject(board[2], board[3])
+        alight_lat, alight_lng = index.unproject(alight[2], alight[3])
+        options.append({
+            'route_id': route_id,
+            'number': route['number'],
+            'name': route['name'],
+            'bus_type': route['bus_type'],
+            'board': {'lat': round(board_lat, 6), 'lng': round(board_lng, 6)},
+            'alight': {'lat': round(alight_lat, 6), 'lng': round(alight_lng, 6)},
+            'walk_to_route_m': round(board[1]),
+            'ride_m': round(ride_m),
+            'walk_from_route_m': round(alight[1]),
+            'duration_min': round(seconds / 60, 1),
+        })
+
+    options.sort(key=lambda option: option['duration_min'])
+    return options[:config['MAX_RESULTS']]
@@ -15,7 +15,7 @@ class RouteSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'number', 'name', 'bus_type', 'bus_type_display',
             'start_point', 'end_point', 'start_coordinates', 'end_coordinates',
-            'path', 'working_hours', 'is_active', 'active_buses_count',
+            'path', 'stops', 'working_hours', 'is_active', 'active_buses_count',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'active_buses_count']
@@ -46,7 +46,7 @@ class RouteCreateUpdateSerializer(serializers.ModelSerializer):
         model = Route
         fields = [
             'number', 'name', 'bus_type', 'start_point', 'end_point',
-            'start_coordinates', 'end_coordinates', 'path',
+            'start_coordinates', 'end_coordinates', 'path', 'stops',
             'working_hours', 'is_active'
         ]
     
@@ -85,4 +85,19 @@ class RouteCreateUpdateSerializer(serializers.ModelSerializer):
             if 'lat' not in point or 'lng' not in point:
                 raise serializers.ValidationError(f"Точка {i} должна содержать lat и lng")
         
-        return value
\ No newline at end of file
+        return value
+    
+    def validate_stops(self, value):
+        """
+        Валидация остановок.
+        """
+        if not isinstance(value, list):
+            raise serializers.ValidationError("Должен быть массивом")
+        
+        for i, stop in enumerate(value):
+            if not isinstance(stop, dict):
+                raise serializers.ValidationError(f"Остановка {i} должна быть объектом")
+            if 'lat' not in stop or 'lng' not in stop:
+                raise serializers.ValidationError(f"Остановка {i} должна содержать lat и lng")
+        
+        return value
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from gorod_osh import refcache
+from gorod_osh.async_responses import invalidate
+from . import async_views, journeys
+from .models import Route
+
+
+def on_commit_once(func):
+    """
+    transaction.on_commit, но не больше одного раза на транзакцию:
+    удаление сотен маршрутов одним запросом не должно повторять
+    одну и ту же работу для каждого.
+    """
+    connection = transaction.get_connection()
+    if any(item[1] == func for item in connection.run_on_commit):
+        return
+    transaction.on_commit(func)
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def reset_route_references(sender, instance, **kwargs):
+    """
+    Номера маршрутов в справочном кеше перечитываются после коммита.
+    """
+    on_commit_once(refcache.routes.invalidate)
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def reset_async_route_responses(sender, instance, **kwargs):
+    """
+    Закешированные ответы ASGI (route/async_views.py) со списком
+    маршрутов и путём этого маршрута удаляются после коммита.
+    """
+    route_id = instance.pk
+    transaction.on_commit(
+        lambda: invalidate(async_views.ROUTES_KEY, async_views.route_path_key(route_id))
+    )
+
+
+@receiver(post_save, sender=Route)
+def build_route_indexes(sender, instance, **kwargs):
+    """
+    Коридор для контроля схода с маршрута и сетка остановок строятся
+    сразу при сохранении, а не на первой координате после правки пути.
+    """
+    from busLocation import deviation, stops
+
+    deviation.corridor_for(instance)
+    if instance.stops:
+        stops.index_for(instance)
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def mark_route_network_stale(sender, instance, **kwargs):
+    """
+    Сеть поиска маршрутов и пересадки пересчитываются после коммита,
+    один раз на транзакцию, а не в запросах поиска (route/journeys.py).
+    """
+    on_commit_once(journeys.mark_stale)
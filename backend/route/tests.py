@@ -1,3 +1,172 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from bus.models import Bus
+from busLocation.models import BusLocation
+from gorod_osh import metrics, refcache
+from shift.models import Shift
+from user.models import User
+from . import journeys, planner
+from .models import Route, RouteTransfer
+
+
+def create_route(number, path, **kwargs):
+    return Route.objects.create(
+        number=number,
+        name=f'Маршрут {number}',
+        bus_type='bus',
+        start_point='Начало',
+        end_point='Конец',
+        start_coordinates=path[0],
+        end_coordinates=path[-1],
+        path=path,
+        **kwargs
+    )
+
+
+class JourneySearchTests(APITestCase):
+    """
+    Маршрут 1 идёт на восток по параллели 40.5, маршрут 2 начинается
+    у его конца и идёт на север: из начала первого в конец второго
+    можно доехать только с пересадкой.
+    """
+
+    def setUp(self):
+        cache.clear()
+        planner.network.state = None
+        refcache.routes.state = None
+        # Сохранение маршрутов отмечает пересадки устаревшими после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            self.east = create_route('1', [{'lat': 40.5, 'lng': 72.80}, {'lat': 40.5, 'lng': 72.82}])
+            self.north = create_route('2', [{'lat': 40.5, 'lng': 72.82}, {'lat': 40.52, 'lng': 72.82}])
+
+    def search(self, origin, destination):
+        return self.client.get('/api/routes/journey/', {
+            'from': '{},{}'.format(*origin),
+            'to': '{},{}'.format(*destination),
+        })
+
+    def test_direct_journey(self):
+        response = self.search((40.5, 72.801), (40.5, 72.815))
+        self.assertEqual(response.status_code, 200)
+        journey = response.data['journeys'][0]
+        self.assertEqual(journey['transfers'], 0)
+        self.assertEqual([leg['number'] for leg in journey['legs']], ['1'])
+
+    def test_journey_with_transfer(self):
+        response = self.search((40.5, 72.801), (40.519, 72.82))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['journeys']), 1)
+        journey = response.data['journeys'][0]
+        self.assertEqual(journey['transfers'], 1)
+        self.assertEqual([leg['number'] for leg in journey['legs']], ['1', '2'])
+        self.assertLess(journey['legs'][0]['board']['lng'], journey['legs'][0]['alight']['lng'])
+
+    def test_transfers_are_rebuilt_after_commit(self):
+        self.assertTrue(RouteTransfer.objects.filter(from_route=self.east, to_route=self.north).exists())
+        self.assertEqual(cache.get(journeys.BUILT_KEY), cache.get(journeys.CHANGED_KEY))
+
+    def test_search_does_not_rebuild_stale_transfers(self):
+        cache.incr(journeys.CHANGED_KEY)
+        planner.network.state = None
+        # Только маршруты и сохранённые пересадки, без записи
+        with self.assertNumQueries(2):
+            planner.network.data()
+        self.assertNotEqual(cache.get(journeys.BUILT_KEY), cache.get(journeys.CHANGED_KEY))
+
+    def test_inactive_route_is_not_used(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.north.is_active = False
+            self.north.save()
+
+        response = self.search((40.5, 72.801), (40.519, 72.82))
+        self.assertEqual(response.data['journeys'], [])
+
+    def test_invalid_point_is_rejected(self):
+        self.assertEqual(self.client.get('/api/routes/journey/', {'from': '40.5', 'to': '40.5,72.8'}).status_code, 400)
+        self.assertEqual(self.search((91, 72.8), (40.5, 72.8)).status_code, 400)
+
+
+class StopStatsTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.route = create_route('1', [{'lat': 40.5, 'lng': 72.80}, {'lat': 40.5, 'lng': 72.82}])
+        self.client.force_authenticate(User.objects.create_user('admin', password='secret', role='admin'))
+
+    def stop_stats(self, **params):
+        return self.client.get(f'/api/routes/{self.route.id}/stop-stats/', params)
+
+    def test_valid_params(self):
+        self.assertEqual(self.stop_stats(days=1).status_code, 200)
+        self.assertEqual(self.stop_stats(stop=0).data['arrivals'], [])
+
+    def test_invalid_params_are_rejected(self):
+        for params in ({'days': 'week'}, {'days': 0}, {'days': 10 ** 9}, {'stop': 'first'}, {'stop': -1}):
+            self.assertEqual(self.stop_stats(**params).status_code, 400)
+
+
+@override_settings(ROOT_URLCONF='gorod_osh.urls_asgi')
+class AsyncRouteTests(TestCase):
+    """
+    Публичные endpoints маршрутов в ASGI (route/async_views.py).
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.route = create_route('1', [{'lat': 40.5, 'lng': 72.80}, {'lat': 40.5, 'lng': 72.82}])
+
+    async def test_queries_are_counted_in_metrics(self):
+        def queries():
+            return sum(
+                value for (name, _), value in metrics.registry.snapshot()['counters'].items()
+                if name == 'http_db_queries_total'
+            )
+
+        before = queries()
+        response = await self.async_client.get('/api/routes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(queries(), before)
+
+    async def test_route_path_is_fresh_after_save(self):
+        response = await self.async_client.get(f'/api/routes/{self.route.id}/path/')
+        self.assertEqual(response.json()['number'], '1')
+
+        def rename():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.route.number = '1А'
+                self.route.save()
+
+        await sync_to_async(rename)()
+        response = await self.async_client.get(f'/api/routes/{self.route.id}/path/')
+        self.assertEqual(response.json()['number'], '1А')
+
+    async def test_route_list_is_fresh_after_bus_assignment(self):
+        response = await self.async_client.get('/api/routes/')
+        self.assertEqual(response.json()[0]['active_buses_count'], 0)
+
+        def start_shift():
+            driver = User.objects.create_user('driver', password='secret', role='driver')
+            with self.captureOnCommitCallbacks(execute=True):
+                bus = Bus.objects.create(registration_number='01KG001', bus_type='bus', route=self.route)
+            Shift.objects.create(driver=driver, bus=bus)
+
+        await sync_to_async(start_shift)()
+        response = await self.async_client.get('/api/routes/')
+        self.assertEqual(response.json()[0]['active_buses_count'], 1)
+
+    async def test_on_route_matches_sync_view(self):
+        def start_shift():
+            driver = User.objects.create_user('driver', password='secret', role='driver')
+            bus = Bus.objects.create(registration_number='01KG001', bus_type='bus', route=self.route)
+            shift = Shift.objects.create(driver=driver, bus=bus)
+            BusLocation.objects.create(shift=shift, bus=bus, latitude=40.5, longitude=72.81)
+
+        await sync_to_async(start_shift)()
+        response = await self.async_client.get('/api/buses/on-route/')
+        self.assertEqual(response.status_code, 200)
+        with override_settings(ROOT_URLCONF='gorod_osh.urls'):
+            expected = await sync_to_async(self.client.get)('/api/buses/on-route/')
+        self.assertEqual(response.json(), expected.json())
@@ -2,6 +2,11 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.utils import timezone
+from datetime import timedelta
+from gorod_osh import refcache
+from user.permissions import IsAdmin
+from . import journeys, planner
 from .models import Route
 from .serializers import (
     RouteSerializer, RouteListSerializer, RouteCreateUpdateSerializer
@@ -19,7 +24,10 @@ class RouteViewSet(viewsets.ModelViewSet):
     - PUT    /api/routes/{id}/    - Обновить маршрут
     - DELETE /api/routes/{id}/    - Удалить маршрут
     - GET    /api/routes/active/  - Активные маршруты
+    - GET    /api/routes/plan/    - Маршруты между двумя точками
+    - GET    /api/routes/journey/ - Поездки с пересадками
     - GET    /api/routes/{id}/path/ - Только путь маршрута
+    - GET    /api/routes/{id}/stop-stats/ - Стоянки на остановках (админы)
     """
     queryset = Route.objects.all()
     pagination_class = None
@@ -37,8 +45,10 @@ class RouteViewSet(viewsets.ModelViewSet):
         Публичный доступ для GET запросов.
         Только админы могут создавать/редактировать/удалять.
         """
-        if self.action in ['list', 'retrieve', 'active', 'path']:
+        if self.action in ['list', 'retrieve', 'active', 'path', 'plan', 'journey']:
             return [AllowAny()]
+        elif self.action == 'stop_stats':
+            return [IsAdmin()]
         return [IsAuthenticated()]
     
     @action(detail=False, methods=['get'])
@@ -51,6 +61,62 @@ class RouteViewSet(viewsets.ModelViewSet):
         serializer = RouteListSerializer(active_routes, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def plan(self, request):
+        """
+        Маршруты, которые проходят в пешей доступности от обеих точек
+        (в нужную сторону), по возрастанию оценки времени в пути.
+        GET /api/routes/plan/?from=lat,lng&to=lat,lng
+        """
+        points = self.parse_points(request)
+        if isinstance(points, Response):
+            return points
+        
+        return Response({
+            'from': {'lat': points['from'][0], 'lng': points['from'][1]},
+            'to': {'lat': points['to'][0], 'lng': points['to'][1]},
+            'routes': planner.plan(*points['from'], *points['to'])
+        })
+    
+    @action(detail=False, methods=['get'])
+    def journey(self, request):
+        """
+        Поездки от точки до точки, в том числе с одной и двумя
+        пересадками (route/journeys.py). Поездка с большим числом
+        пересадок возвращается, только если она быстрее.
+        GET /api/routes/journey/?from=lat,lng&to=lat,lng
+        """
+        points = self.parse_points(request)
+        if isinstance(points, Response):
+            return points
+        
+        return Response({
+            'from': {'lat': points['from'][0], 'lng': points['from'][1]},
+            'to': {'lat': points['to'][0], 'lng': points['to'][1]},
+            'journeys': journeys.search(*points['from'], *points['to'])
+        })
+    
+    def parse_points(self, request):
+        """
+        Точки from и to из query params (lat,lng) или ответ 400.
+        """
+        points = {}
+        for name in ('from', 'to'):
+            try:
+                lat, lng = (float(value) for value in request.query_params[name].split(','))
+            except (KeyError, ValueError):
+                return Response(
+                    {'detail': f'Параметр {name} обязателен в формате lat,lng'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                return Response(
+                    {'detail': f'Некорректные координаты {name}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            points[name] = (lat, lng)
+        return points
+    
     @action(detail=True, methods=['get'])
     def path(self, request, pk=None):
         """
@@ -64,4 +130,89 @@ class RouteViewSet(viewsets.ModelViewSet):
             'path': route.path,
             'start_coordinates': route.start_coordinates,
             'end_coordinates': route.end_coordinates
-        })
\ No newline at end of file
+        })
+    
+    @action(detail=True, methods=['get'], url_path='stop-stats')
+    def stop_stats(self, request, pk=None):
+        """
+        Статистика стоянок по остановкам маршрута из StopEvent,
+        без чтения истории координат. Учитываются только стоянки у
+        текущего списка остановок (Route.stops_version).
+        GET /api/routes/{id}/stop-stats/
+        
+        Query params:
+        - days: период в днях (по умолчанию 7)
+        - stop: номер остановки - вместо сводки вернуть её прибытия
+          с интервалами между ними (соблюдение интервала движения)
+        """
+        from busLocation.models import StopEvent
+        
+        route = self.get_object()
+        try:
+            days = int(request.query_params.get('days', 7))
+            since = timezone.now() - timedelta(days=days)
+        except (ValueError, OverflowError):
+            days = 0
+        if days < 1:
+            return Response(
+                {'detail': 'days должен быть целым числом дней больше 0'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        stop = request.query_params.get('stop')
+        if stop is not None:
+            try:
+                stop = int(stop)
+            except ValueError:
+                stop = -1
+            if stop < 0:
+                return Response(
+                    {'detail': 'stop должен быть номером остановки'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            arrivals = []
+            previous = None
+            for arrived_at, departed_at, dwell_seconds, bus_id, trip in StopEvent.objects.filter(
+                route=route,
+                stops_version=route.stops_version,
+                stop_index=stop,
+                arrived_at__gte=since
+            ).order_by('arrived_at').values_list(
+                'arrived_at', 'departed_at', 'dwell_seconds', 'bus_id', 'trip'
+            )[:1000]:
+                arrivals.append({
+                    'arrived_at': arrived_at,
+                    'departed_at': departed_at,
+                    'dwell_seconds': dwell_seconds,
+                    'headway_seconds': int((arrived_at - previous).total_seconds()) if previous else None,
+                    'bus_number': refcache.bus_number(bus_id),
+                    'trip': trip
+                })
+                previous = arrived_at
+            
+            return Response({
+                'route_id': route.id,
+                'stop': stop,
+                'period_days': days,
+                'arrivals': arrivals
+            })
+        
+        stops = []
+        for row in StopEvent.objects.dwell_stats(route.id, route.stops_version, since):
+            index = row['stop_index']
+            stops.append({
+                'stop': index,
+                'name': route.stops[index].get('name') if index < len(route.stops) else None,
+                'visits': row['visits'],
+                'avg_dwell_seconds': round(row['avg_dwell_seconds']) if row['avg_dwell_seconds'] is not None else None,
+                'max_dwell_seconds': row['max_dwell_seconds'],
+                'last_arrival': row['last_arrival']
+            })
+        
+        return Response({
+            'route_id': route.id,
+            'number': route.number,
+            'period_days': days,
+            'stops': stops
+        })
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import Shift
 
 
@@ -7,7 +8,12 @@ class ShiftAdmin(admin.ModelAdmin):
     list_display = ('id', 'driver', 'bus', 'start_time', 'end_time', 'status', 'duration_hours')
     list_filter = ('status', 'start_time')
     search_fields = ('driver__username', 'bus__registration_number')
-    readonly_fields = ('start_time', 'duration', 'duration_hours', 'last_location')
+    readonly_fields = ('start_time', 'duration', 'duration_hours', 'last_location', 'deviations_count')
+    # Bus.__str__ обращается к маршруту
+    list_select_related = ('driver', 'bus', 'bus__route')
+    # Выпадающие списки всех автобусов и водителей строились бы на каждую
+    # загрузку формы, с запросом маршрута на каждый автобус
+    autocomplete_fields = ('driver', 'bus')
     
     fieldsets = (
         ('Информация о смене', {
@@ -17,10 +23,28 @@ class ShiftAdmin(admin.ModelAdmin):
             'fields': ('start_time', 'end_time', 'duration', 'duration_hours')
         }),
         ('Последнее местоположение', {
-            'fields': ('last_location',)
+            'fields': ('last_location', 'deviations_count')
         }),
     )
     
     def duration_hours(self, obj):
         return f"{obj.duration_hours:.2f} ч"
-    duration_hours.short_description = 'Продолжительность'
\ No newline at end of file
+    duration_hours.short_description = 'Продолжительность'
+
+    def last_location(self, obj):
+        """
+        Последняя координата одним чтением покрывающего индекса смены,
+        без загрузки автобуса.
+        """
+        location = obj.last_location
+        if location is None:
+            return '-'
+        return (
+            f"{location.latitude}, {location.longitude} "
+            f"({timezone.localtime(location.timestamp):%d.%m.%Y %H:%M:%S})"
+        )
+    last_location.short_description = 'Последняя координата'
+
+    def deviations_count(self, obj):
+        return obj.deviations_count
+    deviations_count.short_description = 'Сходов с маршрута'
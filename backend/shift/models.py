@@ -139,6 +139,13 @@ class Shift(models.Model):
         self.status = 'completed'
         self.save()
         
+        # Незакрытый сход с маршрута завершается вместе со сменой
+        from busLocation.models import RouteDeviation
+        
+        RouteDeviation.objects.filter(shift=self, ended_at__isnull=True).update(
+            ended_at=self.end_time, updated_at=self.end_time
+        )
+        
         return self
     
     @property
@@ -178,17 +185,29 @@ class Shift(models.Model):
     def last_location(self):
         """
         Возвращает последнюю координату этой смены.
-        Используется кеширование для оптимизации.
+        Используется кеширование для оптимизации; для списка смен
+        заполняется заранее через BusLocation.objects.attach_to_shifts.
         """
         if not hasattr(self, '_cached_last_location'):
             from busLocation.models import BusLocation
             
-            self._cached_last_location = BusLocation.objects.filter(
-                shift=self
-            ).order_by('-timestamp').first()
+            self._cached_last_location = BusLocation.objects.latest_for_shifts(
+                [self.id]
+            ).first()
         
         return self._cached_last_location
     
+    @property
+    def deviations_count(self):
+        """
+        Количество сходов с маршрута за смену.
+        ShiftViewSet заполняет его заранее аннотацией queryset.
+        """
+        if not hasattr(self, '_cached_deviations_count'):
+            self._cached_deviations_count = self.deviations.count()
+        
+        return self._cached_deviations_count
+    
     @property
     def total_locations(self):
         """
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from gorod_osh import refcache
 from .models import Shift
 from user.serializers import DriverSerializer
 from bus.serializers import BusListSerializer
@@ -13,13 +14,14 @@ class ShiftSerializer(serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     duration_hours = serializers.FloatField(read_only=True)
     last_location = serializers.SerializerMethodField()
+    deviations_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Shift
         fields = [
             'id', 'driver', 'driver_info', 'bus', 'bus_info',
             'start_time', 'end_time', 'status', 'status_display',
-            'duration_hours', 'last_location'
+            'duration_hours', 'last_location', 'deviations_count'
         ]
         read_only_fields = ['id', 'start_time', 'duration_hours']
     
@@ -44,8 +46,8 @@ class ShiftListSerializer(serializers.ModelSerializer):
     Упрощённый сериализатор для списка смен.
     """
     driver_name = serializers.SerializerMethodField()
-    bus_number = serializers.CharField(source='bus.registration_number', read_only=True)
-    route_number = serializers.CharField(source='bus.route.number', read_only=True)
+    bus_number = refcache.ReferenceField(refcache.bus_number, source='bus_id')
+    route_number = refcache.ReferenceField(refcache.bus_route_number, source='bus_id')
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     duration_hours = serializers.FloatField(read_only=True)
     
@@ -58,6 +60,9 @@ class ShiftListSerializer(serializers.ModelSerializer):
         ]
     
     def get_driver_name(self, obj):
+        name = refcache.driver_name(obj.driver_id)
+        if name is not None:
+            return name
         return f"{obj.driver.first_name} {obj.driver.last_name}".strip() or obj.driver.username
 
 
@@ -119,8 +124,8 @@ class ShiftHistorySerializer(serializers.ModelSerializer):
     Сериализатор для истории смен (только завершённые).
     """
     driver_name = serializers.SerializerMethodField()
-    bus_number = serializers.CharField(source='bus.registration_number', read_only=True)
-    route_number = serializers.CharField(source='bus.route.number', read_only=True)
+    bus_number = refcache.ReferenceField(refcache.bus_number, source='bus_id')
+    route_number = refcache.ReferenceField(refcache.bus_route_number, source='bus_id')
     duration_hours = serializers.FloatField(read_only=True)
     
     class Meta:
@@ -131,4 +136,7 @@ class ShiftHistorySerializer(serializers.ModelSerializer):
         ]
     
     def get_driver_name(self, obj):
+        name = refcache.driver_name(obj.driver_id)
+        if name is not None:
+            return name
         return f"{obj.driver.first_name} {obj.driver.last_name}".strip() or obj.driver.username
\ No newline at end of file
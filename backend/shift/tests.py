@@ -1,3 +1,45 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from bus.models import Bus
+from busLocation.models import RouteDeviation
+from user.models import User
+from .models import Shift
+
+
+class ShiftDeviationsCountTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='secret', role='admin')
+        driver = User.objects.create_user('driver', password='secret', role='driver')
+        bus = Bus.objects.create(registration_number='01KG001', bus_type='bus')
+        self.shift = Shift.objects.create(driver=driver, bus=bus)
+        for _ in range(2):
+            RouteDeviation.objects.create(
+                shift=self.shift, bus=bus, started_at=timezone.now(), latitude=40.5, longitude=72.8
+            )
+        self.client.force_authenticate(self.admin)
+
+    def test_retrieve_counts_deviations_in_shift_query(self):
+        response = self.client.get(f'/api/shifts/{self.shift.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deviations_count'], 2)
+
+        # Сходы считаются в запросе смены, а не отдельным COUNT
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/shifts/{self.shift.id}/')
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT COUNT(*)') and 'routedeviation' in query['sql']
+        ])
+
+    def test_destroy_does_not_count_deviations(self):
+        self.shift.complete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(f'/api/shifts/{self.shift.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse([query for query in queries.captured_queries if 'GROUP BY' in query['sql']])
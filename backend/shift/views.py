@@ -2,6 +2,7 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db.models import Count
 from django.utils import timezone
 from datetime import timedelta
 from .models import Shift
@@ -9,7 +10,10 @@ from .serializers import (
     ShiftSerializer, ShiftListSerializer, ShiftStartSerializer,
     ShiftHistorySerializer
 )
-import json
+import logging
+
+
+logger = logging.getLogger(__name__)
 
 
 class ShiftViewSet(viewsets.ModelViewSet):
@@ -36,9 +40,19 @@ class ShiftViewSet(viewsets.ModelViewSet):
         Водители видят только свои смены.
         Админы видят все смены.
         """
+        queryset = self.queryset
+        if self.action in ['list', 'active']:
+            # ShiftListSerializer берёт имена и номера из справочного кеша
+            queryset = Shift.objects.all()
+        elif self.action == 'retrieve':
+            # deviations_count для ShiftSerializer тем же запросом; записи
+            # и удаления JOIN с GROUP BY не платят, при ответе update
+            # счётчик - отдельный COUNT
+            queryset = queryset.annotate(_cached_deviations_count=Count('deviations'))
+
         if self.request.user.role == 'driver':
-            return self.queryset.filter(driver=self.request.user)
-        return self.queryset
+            return queryset.filter(driver=self.request.user)
+        return queryset
     
     @action(detail=False, methods=['post'])
     def start(self, request):
@@ -49,29 +63,15 @@ class ShiftViewSet(viewsets.ModelViewSet):
             "bus": 1
         }
         """
-        # ОТЛАДКА
-        print(f"\n{'='*60}")
-        print(f"🚀 ЗАПРОС НА НАЧАЛО СМЕНЫ")
-        print(f"{'='*60}")
-        print(f"👤 Пользователь: {request.user}")
-        print(f"📦 Данные запроса: {json.dumps(request.data, indent=2, ensure_ascii=False)}")
-        
         serializer = self.get_serializer(data=request.data, context={'request': request})
         
         if not serializer.is_valid():
-            print(f"❌ ОШИБКИ ВАЛИДАЦИИ:")
-            for field, errors in serializer.errors.items():
-                print(f"   - {field}: {errors}")
-            print(f"{'='*60}\n")
+            logger.debug('Shift start rejected for %s: %s', request.user, serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         try:
             shift = serializer.save()
-            print(f"✅ Смена начата:")
-            print(f"   - ID смены: {shift.id}")
-            print(f"   - Автобус: {shift.bus.registration_number}")
-            print(f"   - Маршрут: {shift.bus.route.number if shift.bus.route else 'НЕТ'}")
-            print(f"{'='*60}\n")
+            logger.debug('Shift %s started by %s on bus %s', shift.id, request.user, shift.bus_id)
             
             response_serializer = ShiftSerializer(shift)
             return Response(
@@ -79,9 +79,7 @@ class ShiftViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_201_CREATED
             )
         except Exception as e:
-            print(f"❌ ОШИБКА ПРИ СОХРАНЕНИИ СМЕНЫ:")
-            print(f"   - {type(e).__name__}: {e}")
-            print(f"{'='*60}\n")
+            logger.warning('Shift start failed for %s: %s: %s', request.user, type(e).__name__, e)
             return Response(
                 {'detail': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
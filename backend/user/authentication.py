@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from gorod_osh import metrics
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Пароль (хеш) в кеш не кладём, при обращении он загрузится из БД
+EXCLUDED_FIELDS = ('password',)
+
+
+def principal_cache_key(user_id):
+    return f'auth:principal:{user_id}'
+
+
+def invalidate_principal(user_id):
+    """
+    Удаляет закешированного пользователя (см. user/signals.py).
+    """
+    try:
+        cache.delete(principal_cache_key(user_id))
+    except Exception:
+        logger.exception('Failed to invalidate cached principal %s', user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, которая не читает пользователя из БД на каждый запрос.
+
+    Водитель отправляет координаты каждые 5 секунд, и каждый запрос
+    раньше начинался с SELECT по users. Теперь поля пользователя (кроме
+    пароля) кешируются по его ID на AUTH_PRINCIPAL_CACHE_TTL секунд,
+    а объект собирается через User.from_db, поэтому IsDriver/IsAdmin
+    и фильтры вида driver=request.user обходятся без БД.
+
+    Сохранение и удаление пользователя (block/unblock, смена пароля,
+    правка в админке) сразу сбрасывают кеш, TTL лишь ограничивает
+    устаревание при изменениях в обход save().
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатор пользователя')
+
+        user = self.get_cached_user(user_id)
+        metrics.record_cache('auth_principal', user is not None)
+
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+            self.cache_user(user_id, user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('Пользователь неактивен', code='user_inactive')
+
+        if user.is_blocked:
+            raise AuthenticationFailed('Пользователь заблокирован', code='user_blocked')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != user._password_hash:
+                raise AuthenticationFailed('Пароль пользователя был изменён', code='password_changed')
+
+        return user
+
+    def get_cached_user(self, user_id):
+        try:
+            cached = cache.get(principal_cache_key(user_id))
+        except Exception:
+            logger.exception('Failed to read cached principal %s', user_id)
+            return None
+
+        if cached is None:
+            return None
+
+        field_names, values, password_hash = cached
+        user = self.user_model.from_db(DEFAULT_DB_ALIAS, field_names, values)
+        user._password_hash = password_hash
+        return user
+
+    def cache_user(self, user_id, user):
+        field_names = [
+            field.attname for field in self.user_model._meta.concrete_fields
+            if field.attname not in EXCLUDED_FIELDS
+        ]
+        values = [getattr(user, name) for name in field_names]
+
+        # Для CHECK_REVOKE_TOKEN достаточно md5 от хеша пароля
+        user._password_hash = (
+            get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None
+        )
+
+        try:
+            cache.set(
+                principal_cache_key(user_id),
+                (field_names, values, user._password_hash),
+                getattr(settings, 'AUTH_PRINCIPAL_CACHE_TTL', 10)
+            )
+        except Exception:
+            logger.exception('Failed to cache principal %s', user_id)
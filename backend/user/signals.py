@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from gorod_osh import refcache
+from .models import User
+
+
+# Поля, от которых зависит имя водителя в справочном кеше
+DRIVER_NAME_FIELDS = {'username', 'first_name', 'last_name', 'role'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reset_cached_principal(sender, instance, **kwargs):
+    """
+    Сбрасывает закешированного пользователя после коммита, чтобы
+    блокировка и смена пароля действовали со следующего запроса.
+    """
+    from .authentication import invalidate_principal
+
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_principal(user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reset_driver_references(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    """
+    Перечитывает имена водителей после коммита. Сохранения, не трогающие
+    имя (например, last_login при входе), кеш не сбрасывают. Для
+    админа сбрасывают смена роли и полный save(): прежняя роль не
+    известна, а так водителя переводят в админы из админки.
+    """
+    if instance.role != 'driver':
+        if signal is not post_save or created:
+            return
+        if update_fields is not None and 'role' not in update_fields:
+            return
+    elif update_fields is not None and not DRIVER_NAME_FIELDS.intersection(update_fields):
+        return
+    transaction.on_commit(refcache.drivers.invalidate)
@@ -1,3 +1,73 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from gorod_osh import refcache
+from .authentication import principal_cache_key
+from .models import User
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user('driver', password='secret', role='driver')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.driver)}')
+
+    def test_principal_is_cached(self):
+        self.assertEqual(self.client.get('/api/shifts/').status_code, 200)
+        self.assertIsNotNone(cache.get(principal_cache_key(self.driver.id)))
+
+        with self.assertNumQueries(1):
+            # Только запрос смен, пользователь берётся из кеша
+            self.assertEqual(self.client.get('/api/shifts/').status_code, 200)
+
+    def test_block_invalidates_cached_principal(self):
+        self.assertEqual(self.client.get('/api/shifts/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.driver.block()
+
+        self.assertIsNone(cache.get(principal_cache_key(self.driver.id)))
+        self.assertEqual(self.client.get('/api/shifts/').status_code, 401)
+
+
+class DriverReferenceTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        refcache.drivers.state = None
+        self.driver = User.objects.create_user('driver', password='secret', role='driver', first_name='Азамат')
+
+    def test_full_save_demotion_resets_driver_name(self):
+        self.assertEqual(refcache.driver_name(self.driver.id), 'Азамат')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.driver.role = 'admin'
+            self.driver.save()
+
+        self.assertIsNone(refcache.driver_name(self.driver.id))
+
+    def test_new_admin_does_not_reset_drivers(self):
+        refcache.driver_name(self.driver.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            User.objects.create_user('admin', password='secret', role='admin')
+        self.assertNotIn(refcache.drivers.invalidate, callbacks)
+
+
+class MetricsAccessTests(APITestCase):
+    """
+    Доступ к /metrics (gorod_osh/metrics.py).
+    """
+
+    @override_settings(DEBUG=False, METRICS={'TOKEN': None})
+    def test_only_allowed_ips_without_token(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 403)
+
+    @override_settings(DEBUG=False, METRICS={'TOKEN': 'secret'})
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)